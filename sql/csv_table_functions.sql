@@ -1,19 +1,38 @@
--- Function to create a table with the CSV schema
+-- Function to create a table for an uploaded dataset from its declared or inferred schema.
+-- p_columns is a JSON array of {name, type, role, nullable}: types integer, float, boolean,
+-- text, date and timestamp; role "key" for the primary key, "geo" for the latitude and
+-- longitude columns (in that order), "filterable" for columns that get an index.
+-- With p_staging the table is created as <name>__staging for swap_csv_table, replacing a
+-- leftover staging table from an abandoned replace.
 -- This function needs to be created in Supabase Dashboard or via SQL Editor
 
-CREATE OR REPLACE FUNCTION create_csv_table(p_table_name text)
+CREATE OR REPLACE FUNCTION create_dataset_table(p_table_name text, p_columns jsonb, p_staging boolean DEFAULT false)
 RETURNS text
 LANGUAGE plpgsql
 SECURITY DEFINER
 AS $$
+DECLARE
+    v_table text := CASE WHEN p_staging THEN p_table_name || '__staging' ELSE p_table_name END;
+    v_column jsonb;
+    v_name text;
+    v_type text;
+    v_definitions text[] := '{}';
+    v_key text;
+    v_geo text[] := '{}';
+    v_filterable text[] := '{}';
 BEGIN
     -- Validate table name to prevent SQL injection
     IF p_table_name !~ '^[a-zA-Z_][a-zA-Z0-9_]*$' THEN
         RAISE EXCEPTION 'Invalid table name: %', p_table_name;
     END IF;
     
-    -- Check if table already exists
-    IF EXISTS (
+    IF p_staging THEN
+        -- Leave room for the suffix and index names within the 63 character identifier limit
+        IF length(p_table_name) > 40 THEN
+            RAISE EXCEPTION 'Table name % is too long to replace', p_table_name;
+        END IF;
+        EXECUTE format('DROP TABLE IF EXISTS %I', v_table);
+    ELSIF EXISTS (
         SELECT 1 
         FROM information_schema.tables 
         WHERE table_schema = 'public' 
@@ -22,31 +41,110 @@ BEGIN
         RAISE EXCEPTION 'Table % already exists', p_table_name;
     END IF;
     
-    -- Create the table with the required schema
-    EXECUTE format('
-        CREATE TABLE %I (
-            id BIGINT PRIMARY KEY,
-            latitude DOUBLE PRECISION NOT NULL,
-            longitude DOUBLE PRECISION NOT NULL,
-            business_name TEXT NOT NULL
-        )', p_table_name);
+    FOR v_column IN SELECT * FROM jsonb_array_elements(p_columns) LOOP
+        v_name := v_column->>'name';
+        IF v_name IS NULL OR v_name !~ '^[a-zA-Z_][a-zA-Z0-9_]*$' OR v_name = 'row_hash' THEN
+            RAISE EXCEPTION 'Invalid column name: %', v_name;
+        END IF;
+        
+        v_type := CASE v_column->>'type'
+            WHEN 'integer' THEN 'BIGINT'
+            WHEN 'float' THEN 'DOUBLE PRECISION'
+            WHEN 'boolean' THEN 'BOOLEAN'
+            WHEN 'text' THEN 'TEXT'
+            WHEN 'date' THEN 'DATE'
+            WHEN 'timestamp' THEN 'TIMESTAMPTZ'
+        END;
+        IF v_type IS NULL THEN
+            RAISE EXCEPTION 'Invalid type % of column %', v_column->>'type', v_name;
+        END IF;
+        
+        IF coalesce(v_column->>'role', '') IN ('key', 'geo') OR NOT coalesce((v_column->>'nullable')::boolean, true) THEN
+            v_type := v_type || ' NOT NULL';
+        END IF;
+        v_definitions := v_definitions || format('%I %s', v_name, v_type);
+        
+        CASE v_column->>'role'
+            WHEN 'key' THEN
+                IF v_key IS NOT NULL THEN
+                    RAISE EXCEPTION 'Only one key column is allowed';
+                END IF;
+                v_key := v_name;
+            WHEN 'geo' THEN v_geo := v_geo || v_name;
+            WHEN 'filterable' THEN v_filterable := v_filterable || v_name;
+            ELSE NULL;
+        END CASE;
+    END LOOP;
+    
+    IF v_key IS NULL THEN
+        RAISE EXCEPTION 'A key column is required';
+    END IF;
+    IF cardinality(v_geo) NOT IN (0, 2) THEN
+        RAISE EXCEPTION 'Expected a latitude and a longitude geo column';
+    END IF;
+    
+    -- Hash of the other columns, compared by delta uploads
+    v_definitions := v_definitions || 'row_hash TEXT'::text || format('PRIMARY KEY (%I)', v_key);
+    EXECUTE format('CREATE TABLE %I (%s)', v_table, array_to_string(v_definitions, ', '));
+    
+    -- Coordinate index for bounding box and distance lookups
+    IF cardinality(v_geo) = 2 THEN
+        EXECUTE format('CREATE INDEX %I ON %I (%I, %I)', v_table || '_lat_lng_idx', v_table, v_geo[1], v_geo[2]);
+    END IF;
+    FOREACH v_name IN ARRAY v_filterable LOOP
+        EXECUTE format('CREATE INDEX %I ON %I (%I)', v_table || '_' || v_name || '_idx', v_table, v_name);
+    END LOOP;
     
     -- Enable RLS (Row Level Security) for the new table
-    EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', p_table_name);
+    EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', v_table);
     
-    -- Create RLS policy for full access
-    EXECUTE format('
-        CREATE POLICY "Enable full access" ON %I
-        FOR ALL
-        TO authenticated
-        USING (true)
-        WITH CHECK (true)
-    ', p_table_name);
+    IF p_staging THEN
+        -- Only the service role loads the staging table, policies are set up when it is swapped in
+        EXECUTE format('GRANT ALL ON TABLE %I TO service_role', v_table);
+    ELSE
+        -- Create RLS policy for full access
+        EXECUTE format('
+            CREATE POLICY "Enable full access" ON %I
+            FOR ALL
+            TO authenticated
+            USING (true)
+            WITH CHECK (true)
+        ', v_table);
+        
+        -- Grant permissions (adjust as needed based on your RLS policies)
+        EXECUTE format('GRANT ALL ON TABLE %I TO authenticated', v_table);
+        EXECUTE format('GRANT ALL ON TABLE %I TO service_role', v_table);
+    END IF;
     
-    -- Grant permissions (adjust as needed based on your RLS policies)
-    EXECUTE format('GRANT ALL ON TABLE %I TO authenticated', p_table_name);
-    EXECUTE format('GRANT ALL ON TABLE %I TO service_role', p_table_name);
+    -- Make the table visible through the API as soon as this transaction commits
+    NOTIFY pgrst, 'reload schema';
     
+    RETURN v_table;
+END;
+$$;
+
+-- Columns of a POI table: id, latitude, longitude, business_name
+CREATE OR REPLACE FUNCTION poi_table_columns()
+RETURNS jsonb
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT '[
+        {"name": "id", "type": "integer", "role": "key"},
+        {"name": "latitude", "type": "float", "role": "geo"},
+        {"name": "longitude", "type": "float", "role": "geo"},
+        {"name": "business_name", "type": "text", "nullable": false}
+    ]'::jsonb;
+$$;
+
+-- Function to create a table with the POI schema
+CREATE OR REPLACE FUNCTION create_csv_table(p_table_name text)
+RETURNS text
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    PERFORM create_dataset_table(p_table_name, poi_table_columns());
     RETURN format('Table %s created successfully', p_table_name);
 END;
 $$;
@@ -76,6 +174,8 @@ BEGIN
     -- Drop the table
     EXECUTE format('DROP TABLE %I', p_table_name);
     
+    NOTIFY pgrst, 'reload schema';
+    
     RETURN format('Table %s dropped successfully', p_table_name);
 END;
 $$;
@@ -188,11 +288,218 @@ BEGIN
 END;
 $$;
 
+-- Staging table with the POI schema for replacing a table without downtime, see create_dataset_table
+CREATE OR REPLACE FUNCTION create_csv_staging_table(p_table_name text)
+RETURNS text
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    RETURN create_dataset_table(p_table_name, poi_table_columns(), true);
+END;
+$$;
+
+-- Swap a loaded staging table in for the live table in one transaction. The statistics are
+-- gathered and the policies set up on the staging table first, so the live table is only
+-- locked for the drop and renames. Queries running against the old table finish first,
+-- later ones see the new data.
+CREATE OR REPLACE FUNCTION swap_csv_table(p_table_name text)
+RETURNS text
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_staging text := p_table_name || '__staging';
+    v_index text;
+BEGIN
+    -- Validate table name to prevent SQL injection
+    IF p_table_name !~ '^[a-zA-Z_][a-zA-Z0-9_]*$' THEN
+        RAISE EXCEPTION 'Invalid table name: %', p_table_name;
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.tables 
+        WHERE table_schema = 'public' 
+        AND table_name = v_staging
+    ) THEN
+        RAISE EXCEPTION 'Table % does not exist', v_staging;
+    END IF;
+    
+    EXECUTE format('ANALYZE %I', v_staging);
+    PERFORM setup_table_policies(v_staging);
+    
+    -- Give up rather than queue behind long running queries on the live table
+    SET LOCAL lock_timeout = '5s';
+    
+    IF EXISTS (
+        SELECT 1 
+        FROM information_schema.tables 
+        WHERE table_schema = 'public' 
+        AND table_name = p_table_name
+    ) THEN
+        EXECUTE format('LOCK TABLE %I IN ACCESS EXCLUSIVE MODE', p_table_name);
+        EXECUTE format('DROP TABLE %I', p_table_name);
+    END IF;
+    
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', v_staging, p_table_name);
+    -- Indexes created by create_dataset_table are named after the table
+    FOR v_index IN
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = 'public' AND tablename = p_table_name AND left(indexname, length(v_staging)) = v_staging
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', v_index, p_table_name || substr(v_index, length(v_staging) + 1));
+    END LOOP;
+    
+    NOTIFY pgrst, 'reload schema';
+    
+    RETURN format('Table %s replaced successfully', p_table_name);
+END;
+$$;
+
+-- Prepare an existing CSV table for a delta upload: tables created before row hashes were
+-- kept get the row_hash column, their rows have no hash and are all rewritten once.
+CREATE OR REPLACE FUNCTION prepare_csv_delta(p_table_name text)
+RETURNS text
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    -- Validate table name to prevent SQL injection
+    IF p_table_name !~ '^[a-zA-Z_][a-zA-Z0-9_]*$' THEN
+        RAISE EXCEPTION 'Invalid table name: %', p_table_name;
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.tables 
+        WHERE table_schema = 'public' 
+        AND table_name = p_table_name
+    ) THEN
+        RAISE EXCEPTION 'Table % does not exist', p_table_name;
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_schema = 'public' 
+        AND table_name = p_table_name
+        AND column_name = 'row_hash'
+    ) THEN
+        EXECUTE format('ALTER TABLE %I ADD COLUMN row_hash TEXT', p_table_name);
+        NOTIFY pgrst, 'reload schema';
+    END IF;
+    
+    RETURN format('Table %s ready for delta upload', p_table_name);
+END;
+$$;
+
+-- Add a stored tile_key column to a table with latitude and longitude columns: the web mercator
+-- tile of each row at p_zoom, as x * 2^zoom + y, with an index for tile and nearest neighbour
+-- reads. The zoom and the latitude and longitude columns are kept in the column comment as
+-- JSON, see poi_spatial_index; the column is rebuilt when they change and left alone otherwise.
+-- Generated, so rows written later get their tile without help.
+CREATE OR REPLACE FUNCTION build_poi_spatial_index(p_table_name text, p_latitude text, p_longitude text, p_zoom integer)
+RETURNS text
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_comment text := jsonb_build_object('zoom', p_zoom, 'latitude', p_latitude, 'longitude', p_longitude)::text;
+    v_tiles bigint := (2::bigint) ^ p_zoom;
+    v_latitude text;
+BEGIN
+    -- Validate table and column names to prevent SQL injection
+    IF p_table_name !~ '^[a-zA-Z_][a-zA-Z0-9_]*$'
+        OR p_latitude !~ '^[a-zA-Z_][a-zA-Z0-9_]*$'
+        OR p_longitude !~ '^[a-zA-Z_][a-zA-Z0-9_]*$' THEN
+        RAISE EXCEPTION 'Invalid table or column name';
+    END IF;
+    
+    IF p_zoom < 0 OR p_zoom > 24 THEN
+        RAISE EXCEPTION 'Invalid zoom: %', p_zoom;
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.tables 
+        WHERE table_schema = 'public' 
+        AND table_name = p_table_name
+    ) THEN
+        RAISE EXCEPTION 'Table % does not exist', p_table_name;
+    END IF;
+    
+    IF EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_schema = 'public' 
+        AND table_name = p_table_name
+        AND column_name = 'tile_key'
+    ) THEN
+        IF col_description(format('public.%I', p_table_name)::regclass,
+            (SELECT attnum FROM pg_attribute
+             WHERE attrelid = format('public.%I', p_table_name)::regclass AND attname = 'tile_key')
+        ) IS NOT DISTINCT FROM v_comment THEN
+            RETURN format('Spatial index of %s is up to date', p_table_name);
+        END IF;
+        EXECUTE format('ALTER TABLE %I DROP COLUMN tile_key', p_table_name);
+    END IF;
+    
+    -- Latitude clamped to the web mercator range, tiles on the far edges (rounding past them at the
+    -- clamped latitudes included) folded back in
+    v_latitude := format('radians(greatest(least(%I, 85.05112878), -85.05112878))', p_latitude);
+    EXECUTE format(
+        'ALTER TABLE %I ADD COLUMN tile_key BIGINT GENERATED ALWAYS AS ('
+        'least(floor((%I + 180) / 360 * %s), %s - 1)::bigint * %s'
+        ' + greatest(least(floor((1 - ln(tan(%s) + 1 / cos(%s)) / pi()) / 2 * %s), %s - 1), 0)::bigint'
+        ') STORED',
+        p_table_name, p_longitude, v_tiles, v_tiles, v_tiles,
+        v_latitude, v_latitude, v_tiles, v_tiles
+    );
+    EXECUTE format('COMMENT ON COLUMN %I.tile_key IS %L', p_table_name, v_comment);
+    EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (tile_key)', p_table_name || '_tile_key_idx', p_table_name);
+    EXECUTE format('ANALYZE %I', p_table_name);
+    
+    NOTIFY pgrst, 'reload schema';
+    
+    RETURN format('Spatial index of %s built at zoom %s', p_table_name, p_zoom);
+END;
+$$;
+
+-- Zoom and latitude and longitude columns of the tile_key column of a table, as written by
+-- build_poi_spatial_index, or NULL when the table has none
+CREATE OR REPLACE FUNCTION poi_spatial_index(p_table_name text)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT CASE WHEN d.comment LIKE '{%' THEN d.comment::jsonb END
+    FROM pg_attribute a
+    CROSS JOIN LATERAL (SELECT col_description(a.attrelid, a.attnum) AS comment) d
+    WHERE a.attrelid = to_regclass(format('public.%I', p_table_name))
+    AND a.attname = 'tile_key'
+    AND NOT a.attisdropped;
+$$;
+
 -- Grant execute permissions on the functions
+GRANT EXECUTE ON FUNCTION create_dataset_table(text, jsonb, boolean) TO service_role;
 GRANT EXECUTE ON FUNCTION create_csv_table(text) TO authenticated;
 GRANT EXECUTE ON FUNCTION create_csv_table(text) TO service_role;
 GRANT EXECUTE ON FUNCTION drop_table(text) TO authenticated;
 GRANT EXECUTE ON FUNCTION drop_table(text) TO service_role;
 GRANT EXECUTE ON FUNCTION setup_table_policies(text) TO authenticated;
 GRANT EXECUTE ON FUNCTION setup_table_policies(text) TO service_role;
-GRANT EXECUTE ON FUNCTION setup_anon_read_policies(text) TO service_role; 
\ No newline at end of file
+GRANT EXECUTE ON FUNCTION setup_anon_read_policies(text) TO service_role;
+GRANT EXECUTE ON FUNCTION create_csv_staging_table(text) TO service_role;
+GRANT EXECUTE ON FUNCTION swap_csv_table(text) TO service_role;
+GRANT EXECUTE ON FUNCTION prepare_csv_delta(text) TO service_role;
+GRANT EXECUTE ON FUNCTION build_poi_spatial_index(text, text, text, integer) TO service_role;
+GRANT EXECUTE ON FUNCTION poi_spatial_index(text) TO service_role;
+
+-- Functions are executable by PUBLIC by default. These run with the owner's rights and are
+-- only meant for the backend, so anon and authenticated must not reach them through /rpc
+REVOKE EXECUTE ON FUNCTION create_dataset_table(text, jsonb, boolean) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION create_csv_staging_table(text) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION swap_csv_table(text) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION prepare_csv_delta(text) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION build_poi_spatial_index(text, text, text, integer) FROM PUBLIC, anon, authenticated;
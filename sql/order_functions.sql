@@ -0,0 +1,43 @@
+-- Function to apply a batch of order changes to a table in one transaction
+-- This function needs to be created in Supabase Dashboard or via SQL Editor
+
+-- p_updates is a JSON array of {"id": "...", "order": 1} objects (a BatchOrderUpdate).
+-- All rows are updated by a single statement. If any id does not exist the whole
+-- batch is rolled back, so the order is never left half-applied.
+CREATE OR REPLACE FUNCTION apply_batch_order(p_table_name text, p_updates jsonb)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_expected integer;
+    v_updated integer;
+BEGIN
+    -- Only tables with an "order" column managed by the admin UI can be reordered
+    IF p_table_name NOT IN ('filters', 'site_types', 'poi') THEN
+        RAISE EXCEPTION 'Ordering is not supported for table %', p_table_name;
+    END IF;
+
+    SELECT count(DISTINCT u.value->>'id') INTO v_expected
+    FROM jsonb_array_elements(p_updates) AS u(value);
+
+    EXECUTE format('
+        UPDATE %I t
+        SET "order" = (u.value->>''order'')::int
+        FROM jsonb_array_elements($1) AS u(value)
+        WHERE t.id::text = u.value->>''id''
+    ', p_table_name) USING p_updates;
+
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+
+    IF v_updated <> v_expected THEN
+        RAISE EXCEPTION 'Order update matched % of % rows in %, no changes were applied', v_updated, v_expected, p_table_name;
+    END IF;
+
+    RETURN v_updated;
+END;
+$$;
+
+-- Grant execute permissions on the functions
+GRANT EXECUTE ON FUNCTION apply_batch_order(text, jsonb) TO anon;
+GRANT EXECUTE ON FUNCTION apply_batch_order(text, jsonb) TO authenticated;
+GRANT EXECUTE ON FUNCTION apply_batch_order(text, jsonb) TO service_role;
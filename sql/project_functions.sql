@@ -0,0 +1,237 @@
+-- Functions for creating and managing projects server-side
+-- This function needs to be created in Supabase Dashboard or via SQL Editor
+
+-- Function to return a project with its market status, site type and user filters
+-- (same shape as the POST /api/projects response)
+CREATE OR REPLACE FUNCTION project_with_relations(p_project_id uuid)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'id', p.id,
+        'created_at', p.created_at,
+        'title', p.title,
+        'market_status', jsonb_build_object(
+            'id', ms.id,
+            'name', ms.name
+        ),
+        'site_types', jsonb_build_object(
+            'id', st.id,
+            'name', st.name
+        ),
+        'user_filters', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', uf.id,
+                'filter_type', uf.filter_type,
+                'filter_data', uf.filter_data,
+                'db_column_name', uf.db_column_name,
+                'display_name', uf.display_name,
+                'order', uf."order",
+                'is_open', uf.is_open
+            ) ORDER BY uf."order")
+            FROM user_filters uf
+            WHERE uf.project_id = p.id
+        ), '[]'::jsonb)
+    )
+    FROM projects p
+    JOIN market_status ms ON ms.id = p.market_status_id
+    JOIN site_types st ON st.id = p.site_type_id
+    WHERE p.id = p_project_id;
+$$;
+
+-- Function to create a project and copy the template filters for its
+-- site type and market status into user_filters.
+-- Runs as a single transaction: either both the project and its filters
+-- are created, or nothing is.
+CREATE OR REPLACE FUNCTION create_project_with_filters(
+    p_title text,
+    p_user_id uuid,
+    p_site_type_id uuid,
+    p_market_status_id uuid,
+    p_is_active boolean DEFAULT true
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_project_id uuid;
+BEGIN
+    -- Create the project (id and created_at use the table defaults)
+    INSERT INTO projects (title, user_id, site_type_id, market_status_id, is_active)
+    VALUES (p_title, p_user_id, p_site_type_id, p_market_status_id, p_is_active)
+    RETURNING id INTO v_project_id;
+
+    -- Copy the template filters for this site type and market status
+    INSERT INTO user_filters (project_id, filter_type, filter_data, db_column_name, "order", display_name, is_open)
+    SELECT v_project_id, f.filter_type, f.filter_data, f.db_column_name, f."order", f.display_name, f.is_open
+    FROM site_type_market_status_filters stmsf
+    JOIN filters f ON f.id = stmsf.filter_id
+    WHERE stmsf.site_type_id = p_site_type_id
+    AND stmsf.market_status_id = p_market_status_id;
+
+    RETURN project_with_relations(v_project_id);
+END;
+$$;
+
+-- Function to bring a project's user_filters in line with the template filters
+-- of its current site type and market status.
+-- Filters are matched on (db_column_name, filter_type):
+--   * filters only in the old set are deleted
+--   * filters only in the new template are inserted with the template values
+--   * filters present in both keep their row; display_name and order follow the
+--     template, while filter_data and is_open are kept when p_keep_values is true
+--     and reset to the template values otherwise
+-- All changes are applied by a single statement.
+CREATE OR REPLACE FUNCTION reconcile_project_filters(
+    p_project_id uuid,
+    p_keep_values boolean DEFAULT true
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_result jsonb;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM projects WHERE id = p_project_id) THEN
+        RAISE EXCEPTION 'Project % not found', p_project_id;
+    END IF;
+
+    WITH template AS (
+        SELECT DISTINCT ON (f.db_column_name, f.filter_type)
+            f.filter_type, f.filter_data, f.db_column_name, f."order", f.display_name, f.is_open
+        FROM projects p
+        JOIN site_type_market_status_filters stmsf
+            ON stmsf.site_type_id = p.site_type_id
+            AND stmsf.market_status_id = p.market_status_id
+        JOIN filters f ON f.id = stmsf.filter_id
+        WHERE p.id = p_project_id
+        ORDER BY f.db_column_name, f.filter_type, f."order"
+    ),
+    deleted AS (
+        DELETE FROM user_filters uf
+        WHERE uf.project_id = p_project_id
+        AND NOT EXISTS (
+            SELECT 1 FROM template t
+            WHERE t.db_column_name IS NOT DISTINCT FROM uf.db_column_name
+            AND t.filter_type = uf.filter_type
+        )
+        RETURNING uf.id
+    ),
+    updated AS (
+        UPDATE user_filters uf
+        SET filter_data = CASE WHEN p_keep_values THEN uf.filter_data ELSE t.filter_data END,
+            is_open = CASE WHEN p_keep_values THEN uf.is_open ELSE t.is_open END,
+            display_name = t.display_name,
+            "order" = t."order"
+        FROM template t
+        WHERE uf.project_id = p_project_id
+        AND t.db_column_name IS NOT DISTINCT FROM uf.db_column_name
+        AND t.filter_type = uf.filter_type
+        -- Skip rows that are already up to date
+        AND (
+            uf.display_name IS DISTINCT FROM t.display_name
+            OR uf."order" IS DISTINCT FROM t."order"
+            OR (NOT p_keep_values AND (
+                uf.filter_data::jsonb IS DISTINCT FROM t.filter_data::jsonb
+                OR uf.is_open IS DISTINCT FROM t.is_open
+            ))
+        )
+        RETURNING uf.id
+    ),
+    inserted AS (
+        INSERT INTO user_filters (project_id, filter_type, filter_data, db_column_name, "order", display_name, is_open)
+        SELECT p_project_id, t.filter_type, t.filter_data, t.db_column_name, t."order", t.display_name, t.is_open
+        FROM template t
+        WHERE NOT EXISTS (
+            SELECT 1 FROM user_filters uf
+            WHERE uf.project_id = p_project_id
+            AND uf.db_column_name IS NOT DISTINCT FROM t.db_column_name
+            AND uf.filter_type = t.filter_type
+        )
+        RETURNING id
+    )
+    SELECT jsonb_build_object(
+        'inserted', (SELECT count(*) FROM inserted),
+        'updated', (SELECT count(*) FROM updated),
+        'deleted', (SELECT count(*) FROM deleted)
+    ) INTO v_result;
+
+    RETURN v_result;
+END;
+$$;
+
+-- Function to duplicate a project owned by p_user_id together with all of its
+-- user_filters. p_filter_overrides is a JSON array of objects keyed by the id of
+-- a source filter, e.g. [{"id": "...", "filter_data": {...}, "is_open": true}];
+-- any of filter_data, is_open and order given there replaces the copied value.
+-- Runs as a single transaction and returns the new project with its relations.
+CREATE OR REPLACE FUNCTION clone_project(
+    p_project_id uuid,
+    p_user_id uuid,
+    p_title text DEFAULT NULL,
+    p_is_active boolean DEFAULT NULL,
+    p_filter_overrides jsonb DEFAULT '[]'::jsonb
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_source projects%ROWTYPE;
+    v_project_id uuid;
+BEGIN
+    SELECT * INTO v_source
+    FROM projects
+    WHERE id = p_project_id
+    AND user_id = p_user_id;
+
+    -- NULL when the user has no such project, the API answers 404
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO projects (title, user_id, site_type_id, market_status_id, is_active)
+    VALUES (
+        COALESCE(p_title, v_source.title || ' (copy)'),
+        p_user_id,
+        v_source.site_type_id,
+        v_source.market_status_id,
+        COALESCE(p_is_active, v_source.is_active)
+    )
+    RETURNING id INTO v_project_id;
+
+    INSERT INTO user_filters (project_id, filter_type, filter_data, db_column_name, "order", display_name, is_open)
+    SELECT
+        v_project_id,
+        uf.filter_type,
+        CASE WHEN o.value ? 'filter_data' THEN o.value->'filter_data' ELSE uf.filter_data::jsonb END,
+        uf.db_column_name,
+        CASE WHEN o.value ? 'order' THEN (o.value->>'order')::int ELSE uf."order" END,
+        uf.display_name,
+        CASE WHEN o.value ? 'is_open' THEN (o.value->>'is_open')::boolean ELSE uf.is_open END
+    FROM user_filters uf
+    LEFT JOIN LATERAL (
+        SELECT e.value
+        FROM jsonb_array_elements(COALESCE(p_filter_overrides, '[]'::jsonb)) AS e(value)
+        WHERE e.value->>'id' = uf.id::text
+        LIMIT 1
+    ) o ON true
+    WHERE uf.project_id = p_project_id;
+
+    RETURN project_with_relations(v_project_id);
+END;
+$$;
+
+-- Grant execute permissions on the functions
+GRANT EXECUTE ON FUNCTION project_with_relations(uuid) TO anon;
+GRANT EXECUTE ON FUNCTION project_with_relations(uuid) TO authenticated;
+GRANT EXECUTE ON FUNCTION project_with_relations(uuid) TO service_role;
+GRANT EXECUTE ON FUNCTION create_project_with_filters(text, uuid, uuid, uuid, boolean) TO anon;
+GRANT EXECUTE ON FUNCTION create_project_with_filters(text, uuid, uuid, uuid, boolean) TO authenticated;
+GRANT EXECUTE ON FUNCTION create_project_with_filters(text, uuid, uuid, uuid, boolean) TO service_role;
+GRANT EXECUTE ON FUNCTION reconcile_project_filters(uuid, boolean) TO anon;
+GRANT EXECUTE ON FUNCTION reconcile_project_filters(uuid, boolean) TO authenticated;
+GRANT EXECUTE ON FUNCTION reconcile_project_filters(uuid, boolean) TO service_role;
+GRANT EXECUTE ON FUNCTION clone_project(uuid, uuid, text, boolean, jsonb) TO anon;
+GRANT EXECUTE ON FUNCTION clone_project(uuid, uuid, text, boolean, jsonb) TO authenticated;
+GRANT EXECUTE ON FUNCTION clone_project(uuid, uuid, text, boolean, jsonb) TO service_role;
@@ -0,0 +1,29 @@
+-- Functions for bulk updates of user filters
+-- This function needs to be created in Supabase Dashboard or via SQL Editor
+
+-- Function to apply many partial user_filters updates in one statement.
+-- p_updates is a JSON array of objects with an "id" and any of filter_type,
+-- filter_data, db_column_name, display_name, order and is_open, e.g.
+-- [{"id": "...", "filter_data": {"min": 1, "max": 2}}, {"id": "...", "is_open": true}]
+-- Only the keys present in an object are changed. Returns the updated rows;
+-- ids that do not exist are simply not part of the result.
+CREATE OR REPLACE FUNCTION update_user_filters_batch(p_updates jsonb)
+RETURNS SETOF user_filters
+LANGUAGE sql
+AS $$
+    UPDATE user_filters uf
+    SET filter_type = CASE WHEN u.value ? 'filter_type' THEN u.value->>'filter_type' ELSE uf.filter_type END,
+        filter_data = CASE WHEN u.value ? 'filter_data' THEN u.value->'filter_data' ELSE uf.filter_data::jsonb END,
+        db_column_name = CASE WHEN u.value ? 'db_column_name' THEN u.value->>'db_column_name' ELSE uf.db_column_name END,
+        display_name = CASE WHEN u.value ? 'display_name' THEN u.value->>'display_name' ELSE uf.display_name END,
+        "order" = CASE WHEN u.value ? 'order' THEN (u.value->>'order')::int ELSE uf."order" END,
+        is_open = CASE WHEN u.value ? 'is_open' THEN (u.value->>'is_open')::boolean ELSE uf.is_open END
+    FROM jsonb_array_elements(p_updates) AS u(value)
+    WHERE uf.id = (u.value->>'id')::uuid
+    RETURNING uf.*;
+$$;
+
+-- Grant execute permissions on the functions
+GRANT EXECUTE ON FUNCTION update_user_filters_batch(jsonb) TO anon;
+GRANT EXECUTE ON FUNCTION update_user_filters_batch(jsonb) TO authenticated;
+GRANT EXECUTE ON FUNCTION update_user_filters_batch(jsonb) TO service_role;
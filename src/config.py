@@ -30,5 +30,136 @@ class Settings:
     X_API_KEY: str = os.getenv("X_API_KEY")
     RESEND_API_KEY: str = os.getenv("RESEND_API_KEY")
     SITE_URL: str = os.getenv("SITE_URL")
+
+    # Connection pool shared by the anon and service role Supabase clients
+    SUPABASE_POOL_MAX_CONNECTIONS: int = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "100"))
+    SUPABASE_POOL_MAX_KEEPALIVE: int = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20"))
+    SUPABASE_POOL_KEEPALIVE_EXPIRY: float = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+    SUPABASE_HTTP2: bool = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+    SUPABASE_TIMEOUT: float = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+    SUPABASE_CONNECT_TIMEOUT: float = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+    # Seconds a request may wait for a free connection before failing with PoolTimeout
+    SUPABASE_POOL_TIMEOUT: float = float(os.getenv("SUPABASE_POOL_TIMEOUT", "10"))
+
+    # Time budget of one API request, shared by all of its Supabase calls
+    REQUEST_TIMEOUT_BUDGET: float = float(os.getenv("REQUEST_TIMEOUT_BUDGET", "25"))
+    # Retries of idempotent reads after connection errors or 502/503/504, with full-jitter backoff
+    SUPABASE_RETRY_ATTEMPTS: int = int(os.getenv("SUPABASE_RETRY_ATTEMPTS", "2"))
+    SUPABASE_RETRY_BASE_DELAY: float = float(os.getenv("SUPABASE_RETRY_BASE_DELAY", "0.1"))
+    SUPABASE_RETRY_MAX_DELAY: float = float(os.getenv("SUPABASE_RETRY_MAX_DELAY", "1.0"))
+    # Circuit breaker: open after this many consecutive failures, try again after the reset timeout
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_TIMEOUT: float = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+    # Successful PostgREST reads kept to serve while Supabase is unavailable
+    STALE_CACHE_MAX_ENTRIES: int = int(os.getenv("STALE_CACHE_MAX_ENTRIES", "500"))
+    STALE_CACHE_MAX_AGE: float = float(os.getenv("STALE_CACHE_MAX_AGE", "600"))
+    STALE_CACHE_MAX_BYTES: int = int(os.getenv("STALE_CACHE_MAX_BYTES", "262144"))
+
+    # Read endpoints (e.g. Supabase read replica APIs) for read-only queries, comma separated with
+    # optional comma separated weights. The primary also serves reads with a weight above 0.
+    # Reads of a user who wrote within READ_AFTER_WRITE_WINDOW seconds stay on the primary.
+    SUPABASE_READ_URLS: str = os.getenv("SUPABASE_READ_URLS", "")
+    SUPABASE_READ_WEIGHTS: str = os.getenv("SUPABASE_READ_WEIGHTS", "")
+    SUPABASE_PRIMARY_READ_WEIGHT: int = int(os.getenv("SUPABASE_PRIMARY_READ_WEIGHT", "0"))
+    READ_HEALTH_CHECK_INTERVAL: float = float(os.getenv("READ_HEALTH_CHECK_INTERVAL", "10"))
+    READ_HEALTH_FAILURE_THRESHOLD: int = int(os.getenv("READ_HEALTH_FAILURE_THRESHOLD", "2"))
+    READ_AFTER_WRITE_WINDOW: float = float(os.getenv("READ_AFTER_WRITE_WINDOW", "5"))
+
+    # Data access for the hot read queries: "postgrest" (supabase-py) or "asyncpg" (direct Postgres
+    # connection through DATABASE_URL, falling back to PostgREST if the pool cannot be opened).
+    # Set PG_STATEMENT_CACHE_SIZE=0 when connecting through a transaction-mode pooler.
+    DATA_ACCESS_BACKEND: str = os.getenv("DATA_ACCESS_BACKEND", "postgrest").lower()
+    DATABASE_URL: str = os.getenv("DATABASE_URL")
+    PG_POOL_MIN_SIZE: int = int(os.getenv("PG_POOL_MIN_SIZE", "2"))
+    PG_POOL_MAX_SIZE: int = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+    PG_STATEMENT_CACHE_SIZE: int = int(os.getenv("PG_STATEMENT_CACHE_SIZE", "100"))
+
+    # Token verification: "remote" asks Supabase Auth for every uncached token,
+    # "local" checks the JWT signature and claims in-process
+    AUTH_VERIFICATION_MODE: str = os.getenv("AUTH_VERIFICATION_MODE", "remote").lower()
+    SUPABASE_JWT_SECRET: str = os.getenv("SUPABASE_JWT_SECRET")
+    SUPABASE_JWT_AUDIENCE: str = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+    SUPABASE_JWT_ISSUER: str = os.getenv("SUPABASE_JWT_ISSUER")
+    JWT_LEEWAY: float = float(os.getenv("JWT_LEEWAY", "10"))
+    JWKS_CACHE_TTL: float = float(os.getenv("JWKS_CACHE_TTL", "600"))
+    JWKS_MIN_REFRESH_INTERVAL: float = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+
+    # Cache of remotely validated tokens
+    TOKEN_CACHE_TTL: float = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+    TOKEN_CACHE_MAX_SIZE: int = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+    TOKEN_CACHE_SWEEP_INTERVAL: float = float(os.getenv("TOKEN_CACHE_SWEEP_INTERVAL", "60"))
+
+    # Auth user metadata (email, avatar) attached to profiles: served from memory, refreshed in
+    # the background after AUTH_USER_REFRESH_AFTER seconds and reloaded after AUTH_USER_CACHE_TTL
+    AUTH_USER_CACHE_TTL: float = float(os.getenv("AUTH_USER_CACHE_TTL", "3600"))
+    AUTH_USER_REFRESH_AFTER: float = float(os.getenv("AUTH_USER_REFRESH_AFTER", "300"))
+    AUTH_USER_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_USER_CACHE_MAX_SIZE", "10000"))
+
+    # CSV table upload: rows in the first batch, batches inserted concurrently, and the bounds
+    # within which the batch size adapts to keep each batch near CSV_INGEST_TARGET_BATCH_SECONDS
+    CSV_INGEST_BATCH_SIZE: int = int(os.getenv("CSV_INGEST_BATCH_SIZE", "1000"))
+    CSV_INGEST_MAX_IN_FLIGHT: int = int(os.getenv("CSV_INGEST_MAX_IN_FLIGHT", "4"))
+    CSV_INGEST_MIN_BATCH_SIZE: int = int(os.getenv("CSV_INGEST_MIN_BATCH_SIZE", "250"))
+    CSV_INGEST_MAX_BATCH_SIZE: int = int(os.getenv("CSV_INGEST_MAX_BATCH_SIZE", "10000"))
+    CSV_INGEST_TARGET_BATCH_SECONDS: float = float(os.getenv("CSV_INGEST_TARGET_BATCH_SECONDS", "1.0"))
+    CSV_INGEST_MAX_PAYLOAD_BYTES: int = int(os.getenv("CSV_INGEST_MAX_PAYLOAD_BYTES", "4194304"))
+    CSV_INGEST_RETRY_ATTEMPTS: int = int(os.getenv("CSV_INGEST_RETRY_ATTEMPTS", "3"))
+    # Bytes of the file parsed and checked at a time, and problems listed in a validation report
+    CSV_INGEST_BLOCK_BYTES: int = int(os.getenv("CSV_INGEST_BLOCK_BYTES", "1048576"))
+    CSV_VALIDATION_MAX_ERRORS: int = int(os.getenv("CSV_VALIDATION_MAX_ERRORS", "100"))
+    # Rows read at a time from Parquet and Arrow IPC uploads
+    INGEST_BLOCK_ROWS: int = int(os.getenv("INGEST_BLOCK_ROWS", "65536"))
+
+    # Background ingest jobs: concurrent jobs, where uploads are spooled, how long finished jobs
+    # are kept, and how long to wait for PostgREST to see a newly created table
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "2"))
+    INGEST_SPOOL_DIR: str = os.getenv("INGEST_SPOOL_DIR") or None
+    INGEST_JOB_RETENTION: float = float(os.getenv("INGEST_JOB_RETENTION", "86400"))
+    INGEST_SCHEMA_RELOAD_TIMEOUT: float = float(os.getenv("INGEST_SCHEMA_RELOAD_TIMEOUT", "15"))
+    # Delta uploads: existing row hashes read per page through PostgREST, ids deleted per request
+    DELTA_FETCH_PAGE_SIZE: int = int(os.getenv("DELTA_FETCH_PAGE_SIZE", "1000"))
+    DELTA_DELETE_BATCH_SIZE: int = int(os.getenv("DELTA_DELETE_BATCH_SIZE", "500"))
+
+    # Email outbox: concurrent senders, emails per batch request, requests per second allowed by
+    # the email provider, send attempts and the delay before the first retry, how long sent and
+    # failed messages are kept, recipients accepted by a bulk invitation, and how long shutdown
+    # waits for queued messages to be sent
+    EMAIL_OUTBOX_WORKERS: int = int(os.getenv("EMAIL_OUTBOX_WORKERS", "2"))
+    EMAIL_BATCH_SIZE: int = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+    EMAIL_RATE_LIMIT: float = float(os.getenv("EMAIL_RATE_LIMIT", "2"))
+    EMAIL_RETRY_ATTEMPTS: int = int(os.getenv("EMAIL_RETRY_ATTEMPTS", "4"))
+    EMAIL_RETRY_BACKOFF: float = float(os.getenv("EMAIL_RETRY_BACKOFF", "2"))
+    EMAIL_OUTBOX_RETENTION: float = float(os.getenv("EMAIL_OUTBOX_RETENTION", "86400"))
+    EMAIL_BULK_MAX_RECIPIENTS: int = int(os.getenv("EMAIL_BULK_MAX_RECIPIENTS", "1000"))
+    EMAIL_OUTBOX_DRAIN_TIMEOUT: float = float(os.getenv("EMAIL_OUTBOX_DRAIN_TIMEOUT", "30"))
+
+    # Seconds reference data (site types, market statuses, POI, template filters) stays cached
+    REFERENCE_CACHE_TTL: float = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+
+    # POI datasets: zoom of the persisted tile index, largest dataset loaded into memory after an
+    # upload, seconds tiles stay cached, rows per tile response, and rings of tiles searched
+    # around a point for its nearest neighbours
+    POI_TILE_ZOOM: int = int(os.getenv("POI_TILE_ZOOM", "12"))
+    POI_WARM_MAX_ROWS: int = int(os.getenv("POI_WARM_MAX_ROWS", "100000"))
+    POI_TILE_CACHE_TTL: float = float(os.getenv("POI_TILE_CACHE_TTL", "3600"))
+    POI_TILE_MAX_ROWS: int = int(os.getenv("POI_TILE_MAX_ROWS", "5000"))
+    POI_NEAREST_MAX_RINGS: int = int(os.getenv("POI_NEAREST_MAX_RINGS", "3"))
+
+    # Seconds the PostgREST table/column schema stays cached
+    SCHEMA_CACHE_TTL: float = float(os.getenv("SCHEMA_CACHE_TTL", "600"))
+    # Seconds the property table row count stays cached
+    PROPERTY_SNAPSHOT_TTL: float = float(os.getenv("PROPERTY_SNAPSHOT_TTL", "300"))
+
+    # Startup warm-up: the app waits up to WARMUP_TIMEOUT seconds before accepting traffic,
+    # then keeps retrying failed steps every WARMUP_RETRY_INTERVAL seconds in the background
+    WARMUP_TIMEOUT: float = float(os.getenv("WARMUP_TIMEOUT", "20"))
+    WARMUP_RETRY_INTERVAL: float = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+    WARMUP_PROPERTY_SNAPSHOT: bool = os.getenv("WARMUP_PROPERTY_SNAPSHOT", "false").lower() == "true"
+
+    # Write-behind buffering of user filter edits (see UserFilterService), and the number of
+    # filter owners remembered to check buffered edits without a lookup
+    FILTER_WRITE_BEHIND: bool = os.getenv("FILTER_WRITE_BEHIND", "false").lower() == "true"
+    FILTER_WRITE_BEHIND_INTERVAL: float = float(os.getenv("FILTER_WRITE_BEHIND_INTERVAL", "1.0"))
+    FILTER_OWNER_CACHE_SIZE: int = int(os.getenv("FILTER_OWNER_CACHE_SIZE", "10000"))
     
 settings = Settings()
@@ -1,5 +1,6 @@
 import uvicorn
 
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 from typing import Any
@@ -9,7 +10,16 @@ from fastapi import APIRouter, FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
-from src.middleware.auth import get_current_user
+from src.config import settings
+from src.middleware.auth import get_current_user, get_current_user_strict, token_cache
+from src.middleware.request_context import RequestContextMiddleware, request_deadline
+from src.services.ingest_job_service import ingest_job_service
+from src.services.email_outbox_service import email_outbox_service
+from src.services.pg_service import pg_service
+from src.services.resilience import CircuitOpenError, DeadlineExceededError
+from src.services.supabase_service import supabase_service
+from src.services.user_filter_service import user_filter_service
+from src.services.warmup_service import warmup_service
 
 from src.routers.poi_detail_router import poi_detail_router
 from src.routers.filter_router import filter_router
@@ -23,7 +33,35 @@ from src.routers.user_profile_router import user_profile_router
 from src.routers.agent_router import agent_router
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup
+    await supabase_service.open()
+    await pg_service.open()
+    token_cache.start_sweeper()
+    if settings.FILTER_WRITE_BEHIND:
+        user_filter_service.start_write_behind()
+    ingest_job_service.start()
+    email_outbox_service.start()
+    # Create the clients and prime caches before the first request
+    await warmup_service.start()
+
+    yield
+
+    # Shutdown: write buffered filter edits before the process exits
+    await warmup_service.stop()
+    await ingest_job_service.stop()
+    await email_outbox_service.stop()
+    await user_filter_service.stop_write_behind()
+    await token_cache.stop_sweeper()
+    await pg_service.close()
+    await supabase_service.close()
+
+
+# The time budget starts after the request body is read, before auth and the other dependencies
 app = FastAPI(
+    lifespan=lifespan,
+    dependencies=[Depends(request_deadline)],
     swagger_ui_parameters={},
     trust_env=True,
     redirect_slashes=False
@@ -48,6 +86,24 @@ app.add_middleware(
     max_age=3600,
 )
 
+# Per-request state such as DataLoaders
+app.add_middleware(RequestContextMiddleware)
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request, exc: CircuitOpenError):
+    return JSONResponse(
+        content={"detail": "Service temporarily unavailable, please retry shortly"},
+        status_code=503,
+        headers={"Retry-After": str(int(settings.CIRCUIT_RESET_TIMEOUT))}
+    )
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_exceeded_handler(request, exc: DeadlineExceededError):
+    return JSONResponse(
+        content={"detail": "Request timed out"},
+        status_code=504
+    )
+
 @api_router.get("/ping")
 async def ping():
     return JSONResponse(
@@ -58,6 +114,18 @@ async def ping():
         status_code=200
     )
 
+@api_router.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the startup warm-up has finished"""
+    status = warmup_service.status()
+    return JSONResponse(
+        content={
+            "status": "ready" if status["ready"] else "warming_up",
+            **status,
+        },
+        status_code=200 if status["ready"] else 503
+    )
+
 # Protected routes
 app.include_router(project_router, prefix="/api", dependencies=[Depends(get_current_user)])
 app.include_router(filter_router, prefix="/api", dependencies=[Depends(get_current_user)])
@@ -72,7 +140,8 @@ app.include_router(agent_router, prefix="/api", dependencies=[Depends(get_curren
 app.include_router(user_profile_router, prefix="/api")
 
 # Admin routes (you might want to add additional admin role checks)
-app.include_router(admin_router, prefix="/api", dependencies=[Depends(get_current_user)])
+# Tokens are always checked against Supabase Auth here so revoked sessions are rejected
+app.include_router(admin_router, prefix="/api", dependencies=[Depends(get_current_user_strict)])
 
 # Public routes
 app.include_router(api_router, prefix="/api")
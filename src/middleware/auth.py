@@ -1,15 +1,36 @@
 from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from src.services.supabase_service import supabase_service
+from src.services.auth_user_service import auth_user_service
+from src.middleware.jwt_verifier import jwt_verifier
+from src.middleware.token_cache import TokenCache
+from src.middleware.request_context import request_state
 from src.config import logger, settings
-from datetime import datetime
+from src.services.resilience import UPSTREAM_ERRORS
 from starlette.datastructures import MutableHeaders
 
 security = HTTPBearer()
 
 # Cache for storing validated tokens
-token_cache = {}
-TOKEN_CACHE_TTL = 300  # 5 minutes in seconds
+token_cache = TokenCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE,
+    ttl=settings.TOKEN_CACHE_TTL,
+    sweep_interval=settings.TOKEN_CACHE_SWEEP_INTERVAL
+)
+
+
+async def _validate_with_supabase(token: str) -> str:
+    """Validate a token with Supabase Auth and return the user ID"""
+    user = await supabase_service.get_user(token)
+    auth_user_service.remember_user(user.user)
+    return user.user.id
+
+def _set_request_user(user_id: str):
+    """Lets read routing keep this user's reads on the primary right after a write"""
+    state = request_state()
+    if state is not None:
+        state["user_id"] = user_id
+
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     """
@@ -17,26 +38,20 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     """
     try:
         token = credentials.credentials
-        
-        # Check cache first
-        cached_user = token_cache.get(token)
-        if cached_user:
-            if datetime.now().timestamp() - cached_user['timestamp'] < TOKEN_CACHE_TTL:
-                return cached_user['user_id']
-            else:
-                del token_cache[token]
 
-        # Validate with Supabase
-        user = await supabase_service.get_user(token)
-        user_id = user.user.id
-        
-        # Cache the result
-        token_cache[token] = {
-            'user_id': user_id,
-            'timestamp': datetime.now().timestamp()
-        }
-        
+        # Verify the signature and claims in-process, no network call
+        if settings.AUTH_VERIFICATION_MODE == "local":
+            claims = await jwt_verifier.verify(token)
+            auth_user_service.remember_claims(claims)
+            user_id = claims["sub"]
+        else:
+            # Check cache first, concurrent requests with the same uncached token share one validation
+            user_id = await token_cache.get_or_validate(token, _validate_with_supabase)
+
+        _set_request_user(user_id)
         return user_id
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Token validation error: {str(e)}")
         raise HTTPException(
@@ -44,15 +59,24 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Invalid authentication credentials"
         )
 
-# Clean up expired tokens periodically
-def cleanup_expired_tokens():
-    current_time = datetime.now().timestamp()
-    expired_tokens = [
-        token for token, data in token_cache.items()
-        if current_time - data['timestamp'] > TOKEN_CACHE_TTL
-    ]
-    for token in expired_tokens:
-        del token_cache[token]
+async def get_current_user_strict(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """
+    Validate the JWT token with Supabase Auth on every request and return the user ID.
+    Use for revocation-sensitive routes, where a signed-out or deleted user must be
+    rejected even though their token has not expired yet.
+    """
+    try:
+        user_id = await _validate_with_supabase(credentials.credentials)
+        _set_request_user(user_id)
+        return user_id
+    except UPSTREAM_ERRORS:
+        raise
+    except Exception as e:
+        logger.error(f"Token validation error: {str(e)}")
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication credentials"
+        )
 
 async def inject_api_key(request: Request):
     """Inject the internal API key for specific endpoints"""
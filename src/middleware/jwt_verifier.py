@@ -0,0 +1,120 @@
+from typing import Any, Dict, Optional
+import asyncio
+import time
+
+import httpx
+import jwt
+
+from src.config import logger, settings
+
+
+class JWTVerifier:
+    """
+    Verifies Supabase access tokens locally instead of asking the auth server.
+    HS256 tokens are checked with SUPABASE_JWT_SECRET, asymmetric tokens (RS256/ES256)
+    with the project's JWKS, which is fetched once and cached for JWKS_CACHE_TTL seconds. While
+    the JWKS cannot be fetched the cached keys are still used.
+    """
+    _instance = None
+
+    ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(JWTVerifier, cls).__new__(cls)
+            cls._instance._jwks = {}
+            cls._instance._jwks_fetched_at = float("-inf")
+            cls._instance._jwks_retry_at = float("-inf")
+            cls._instance._jwks_lock = asyncio.Lock()
+        return cls._instance
+
+    @property
+    def issuer(self) -> Optional[str]:
+        if settings.SUPABASE_JWT_ISSUER:
+            return settings.SUPABASE_JWT_ISSUER
+        if settings.SUPABASE_URL:
+            return f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1"
+        return None
+
+    async def _fetch_jwks(self) -> Dict[str, jwt.PyJWK]:
+        """Download the signing keys of the auth server, keyed by kid"""
+        url = f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json"
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.get(url, headers={"apikey": settings.SUPABASE_KEY or ""})
+            response.raise_for_status()
+
+        keys = {}
+        for key_data in response.json().get("keys", []):
+            try:
+                keys[key_data["kid"]] = jwt.PyJWK(key_data)
+            except (KeyError, jwt.PyJWKError) as e:
+                logger.warning(f"Skipping unusable JWKS key: {str(e)}")
+        return keys
+
+    async def _refresh_jwks(self):
+        self._jwks = await self._fetch_jwks()
+        self._jwks_fetched_at = time.monotonic()
+        logger.info(f"Fetched {len(self._jwks)} JWKS signing keys")
+
+    async def prefetch_jwks(self):
+        """Load the signing keys ahead of the first asymmetric token, used by the startup warm-up"""
+        async with self._jwks_lock:
+            await self._refresh_jwks()
+
+    async def _get_signing_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        """Return the JWKS key for kid, refreshing the cached key set when it is stale or the kid is unknown"""
+        is_fresh = time.monotonic() - self._jwks_fetched_at < settings.JWKS_CACHE_TTL
+        if is_fresh and kid in self._jwks:
+            return self._jwks[kid]
+
+        async with self._jwks_lock:
+            # Another request may have refreshed the keys while we waited for the lock.
+            # Unknown kids only trigger a refresh every JWKS_MIN_REFRESH_INTERVAL seconds,
+            # so tokens with made-up kids cannot hammer the auth server.
+            now = time.monotonic()
+            age = now - self._jwks_fetched_at
+            stale = age >= settings.JWKS_CACHE_TTL or (kid not in self._jwks and age >= settings.JWKS_MIN_REFRESH_INTERVAL)
+            if stale and now >= self._jwks_retry_at:
+                try:
+                    await self._refresh_jwks()
+                except (httpx.HTTPError, ValueError) as e:
+                    # Keep verifying with the cached keys, and only retry every JWKS_MIN_REFRESH_INTERVAL
+                    # seconds so requests do not queue up behind a failing auth server
+                    self._jwks_retry_at = now + settings.JWKS_MIN_REFRESH_INTERVAL
+                    logger.warning(f"Failed to refresh JWKS, using {len(self._jwks)} cached keys: {str(e)}")
+
+        if kid not in self._jwks:
+            raise jwt.InvalidTokenError(f"Unknown signing key: {kid}")
+        return self._jwks[kid]
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Check the signature, expiry, audience and issuer of a Supabase access token.
+        Returns the token claims; raises jwt.InvalidTokenError if the token is not valid.
+        """
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+
+        if algorithm == "HS256":
+            if not settings.SUPABASE_JWT_SECRET:
+                raise jwt.InvalidTokenError("SUPABASE_JWT_SECRET is not configured")
+            key = settings.SUPABASE_JWT_SECRET
+        elif algorithm in self.ASYMMETRIC_ALGORITHMS:
+            key = (await self._get_signing_key(header.get("kid"))).key
+        else:
+            raise jwt.InvalidTokenError(f"Unsupported token algorithm: {algorithm}")
+
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=settings.SUPABASE_JWT_AUDIENCE,
+            issuer=self.issuer,
+            leeway=settings.JWT_LEEWAY,
+            options={"require": ["exp", "sub"]}
+        )
+        return claims
+
+
+# Create a singleton instance
+jwt_verifier = JWTVerifier()
@@ -0,0 +1,59 @@
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+import time
+
+from src.config import settings
+
+
+# State that lives for the duration of one HTTP request (e.g. DataLoaders)
+_request_state: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_state", default=None)
+
+
+def request_state() -> Optional[Dict[str, Any]]:
+    """State of the current request, or None outside of a request"""
+    return _request_state.get()
+
+
+def start_deadline(budget: Optional[float] = None):
+    """Give the current request a deadline shared by all of its Supabase calls"""
+    state = request_state()
+    if state is not None:
+        budget = settings.REQUEST_TIMEOUT_BUDGET if budget is None else budget
+        state["deadline"] = time.monotonic() + budget
+
+
+async def request_deadline():
+    """
+    Route dependency starting the request's time budget. FastAPI reads the whole body before it
+    resolves dependencies, so time spent receiving a large upload is not taken from the budget.
+    """
+    start_deadline()
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left in the current request's budget, or None outside of a request"""
+    state = request_state()
+    if state is None or "deadline" not in state:
+        return None
+    return state["deadline"] - time.monotonic()
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI middleware giving every HTTP request its own request_state(), its time budget is
+    started by the request_deadline dependency
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_state.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_state.reset(token)
@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import hashlib
+import time
+
+import jwt
+
+from src.config import logger
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of validated tokens -> user ids.
+    Entries expire after ttl seconds or when the token itself expires, whichever comes
+    first, and the least recently used entry is evicted once max_size is reached.
+    Concurrent misses for the same token share a single validation call.
+    """
+
+    def __init__(self, max_size: int, ttl: float, sweep_interval: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "shared_validations": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    @staticmethod
+    def _key(token: str) -> str:
+        # Keep a digest rather than the raw bearer token in memory
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _expires_at(self, token: str) -> float:
+        """Cache expiry for a token: ttl from now, but never past the token's own exp claim"""
+        expires_at = time.time() + self.ttl
+        try:
+            exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+            if exp is not None:
+                expires_at = min(expires_at, float(exp))
+        except jwt.PyJWTError:
+            pass
+        return expires_at
+
+    def get(self, token: str) -> Optional[str]:
+        """Return the cached user id for a token, or None if it is missing or expired"""
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        user_id, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self._stats["expirations"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return user_id
+
+    def set(self, token: str, user_id: str):
+        key = self._key(token)
+        self._entries[key] = (user_id, self._expires_at(token))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    async def _validate_and_store(self, token: str, validate: Callable[[str], Awaitable[str]]) -> str:
+        user_id = await validate(token)
+        self.set(token, user_id)
+        return user_id
+
+    async def get_or_validate(self, token: str, validate: Callable[[str], Awaitable[str]]) -> str:
+        """
+        Return the user id for a token from the cache, or validate it with validate(token).
+        Only one validation per token runs at a time; concurrent callers await the same result.
+        """
+        user_id = self.get(token)
+        if user_id is not None:
+            self._stats["hits"] += 1
+            return user_id
+
+        self._stats["misses"] += 1
+        key = self._key(token)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._validate_and_store(token, validate))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self._stats["shared_validations"] += 1
+
+        # Shield so a cancelled request does not cancel the validation other requests wait on
+        return await asyncio.shield(task)
+
+    def sweep(self) -> int:
+        """Remove expired entries, returns how many were removed"""
+        now = time.time()
+        expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        self._stats["expirations"] += len(expired)
+        return len(expired)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.sweep()
+            if removed:
+                logger.info(f"Removed {removed} expired tokens from the token cache")
+
+    def start_sweeper(self):
+        """Start removing expired tokens every sweep_interval seconds"""
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop_sweeper(self):
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit/miss counters, current size and in-flight validations"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else None,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "in_flight": len(self._in_flight),
+        }
@@ -1,5 +1,5 @@
-from typing import List
-from fastapi import APIRouter, Body, HTTPException, Path, UploadFile, File, Form
+from typing import List, Optional
+from fastapi import APIRouter, Body, HTTPException, Path, Query, UploadFile, File, Form
 from pydantic import UUID4
 from uuid import UUID
 
@@ -9,7 +9,16 @@ from src.schemas.order import BatchOrderUpdate
 from src.schemas.poi import POI, POICreate, POIUpdate
 from src.schemas.site_type import SiteTypeCreate
 from src.services.admin_service import admin_service
+from src.services.auth_user_service import auth_user_service
+from src.services.cache_service import cache_service
+from src.services.email_outbox_service import email_outbox_service
+from src.services.ingest_job_service import ingest_job_service
+from src.services.pg_service import pg_service
+from src.services.supabase_service import supabase_service
+from src.services.user_filter_service import user_filter_service
+from src.middleware.auth import token_cache
 from src.config import logger
+from src.services.resilience import UPSTREAM_ERRORS
 
 
 admin_router = APIRouter(
@@ -29,6 +38,8 @@ admin_router = APIRouter(
 async def get_template_filters():
     try:
         return await admin_service.get_template_filters()
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error fetching template filters: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -51,6 +62,8 @@ async def create_filter(
 ):
     try:
         return await admin_service.create_filter(filter, market_status_id, site_type_id)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error creating filter: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -70,6 +83,8 @@ async def assign_filters_to_site_type_market_status(
 ):
     try:
         return await admin_service.assign_filters_to_site_type_market_status(site_type_id, market_status_id, filter_ids)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error assigning filters: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -84,6 +99,8 @@ async def assign_filters_to_site_type_market_status(
 async def get_all_filters():
     try:
         return await admin_service.get_all_filters()
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error fetching filters: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -103,6 +120,8 @@ async def update_filter(
         return await admin_service.update_filter(filter_id, filter_update)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating filter: {str(e)}")
         error_message = str(e)
@@ -120,6 +139,8 @@ async def update_filter(
 async def delete_filter(filter_id: UUID4):
     try:
         return await admin_service.delete_filter(filter_id)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error deleting filter: {str(e)}")
         error_message = str(e)
@@ -141,6 +162,8 @@ async def update_filters_order(
 ):
     try:
         return await admin_service.update_filters_order(site_type_id, market_status_id, updates)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating filters order: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -159,6 +182,8 @@ async def update_filters_order(
 async def create_site_type(site_type: SiteTypeCreate):
     try:
         return await admin_service.create_site_type(site_type)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error creating site type: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -174,6 +199,8 @@ async def create_site_type(site_type: SiteTypeCreate):
 async def update_site_type_name(site_type_id: UUID4, name: str = Body(..., embed=True)):
     try:
         return await admin_service.update_site_type_name(site_type_id, name)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating site type: {str(e)}")
         error_message = str(e)
@@ -191,6 +218,8 @@ async def update_site_type_name(site_type_id: UUID4, name: str = Body(..., embed
 async def delete_site_type(site_type_id: UUID4):
     try:
         return await admin_service.delete_site_type(site_type_id)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error deleting site type: {str(e)}")
         error_message = str(e)
@@ -208,6 +237,8 @@ async def delete_site_type(site_type_id: UUID4):
 async def update_site_types_order(updates: BatchOrderUpdate):
     try:
         return await admin_service.update_site_types_order(updates)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating site types order: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -227,6 +258,8 @@ async def update_site_types_order(updates: BatchOrderUpdate):
 async def create_market_status(market_status: MarketStatusCreate):
     try:
         return await admin_service.create_market_status(market_status)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error creating market status: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -242,6 +275,8 @@ async def create_market_status(market_status: MarketStatusCreate):
 async def update_market_status_name(market_status_id: UUID4, name: str = Body(..., embed=True)):
     try:
         return await admin_service.update_market_status_name(market_status_id, name)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating market status: {str(e)}")
         error_message = str(e)
@@ -259,6 +294,8 @@ async def update_market_status_name(market_status_id: UUID4, name: str = Body(..
 async def delete_market_status(market_status_id: UUID4):
     try:
         return await admin_service.delete_market_status(market_status_id)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error deleting market status: {str(e)}")
         error_message = str(e)
@@ -286,6 +323,8 @@ async def create_poi(
 ):
     try:
         return await admin_service.create_poi(site_type_id, poi)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error creating POI: {str(e)}")
         error_message = str(e)
@@ -309,6 +348,8 @@ async def update_poi(
         return await admin_service.update_poi(poi_id, poi)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating POI {poi_id}: {str(e)}")
         error_message = str(e)
@@ -328,6 +369,8 @@ async def delete_poi(
 ):
     try:
         return await admin_service.delete_poi(poi_id)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error deleting POI {poi_id}: {str(e)}")
         error_message = str(e)
@@ -345,6 +388,8 @@ async def delete_poi(
 async def update_pois_order(updates: BatchOrderUpdate):
     try:
         return await admin_service.update_pois_order(updates)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating POIs order: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -354,29 +399,118 @@ async def update_pois_order(updates: BatchOrderUpdate):
 # CSV TABLE UPLOAD CSV TABLE UPLOAD CSV TABLE UPLOAD CSV TABLE UPLOAD CSV TABLE UPLOAD
 
 @admin_router.post("/upload-csv-table",
+    status_code=202,
     tags=["admin/csv-upload"],
     operation_id="upload_csv_table",
-    summary="Create table from CSV upload",
-    description="Creates a new table in Supabase and populates it with CSV data"
+    summary="Create table from an upload",
+    description="Queues a background job that creates a new table in Supabase from a declared or inferred schema "
+                "and populates it with the uploaded data, "
+                "or replaces the data of an existing table without downtime, "
+                "or applies only the inserted, changed and removed rows to an existing table. "
+                "Tables with latitude and longitude columns get a tile index and can be registered as a POI. "
+                "Poll GET /admin/ingest-jobs/{job_id} for its progress"
 )
 async def upload_csv_table(
-    file: UploadFile = File(..., description="CSV file to upload"),
-    table_name: str = Form(..., description="Name for the new table")
+    file: UploadFile = File(..., description="File to upload: .csv, .csv.gz, .csv.zst, .parquet, .arrow or .feather"),
+    table_name: str = Form(..., description="Name for the new table"),
+    mode: str = Form(default="create", description="'create' a new table, 'replace' the rows of an existing one, or 'delta' to write only the differences"),
+    table_schema: Optional[str] = Form(
+        default=None,
+        description="Columns of the table as JSON, {\"columns\": [{\"name\", \"type\", \"role\", \"nullable\"}]}. "
+                    "Inferred from the file when omitted"
+    ),
+    register_poi: Optional[str] = Form(
+        default=None,
+        description="POI to create or update for the table once it is loaded, as JSON, "
+                    "{\"site_type_id\", \"name\", \"db_column_name\", \"icon_svg\", \"order\"}. "
+                    "The table must have latitude and longitude columns"
+    )
 ):
     try:
-        # Read the file content
-        content = await file.read()
-        filename = file.filename
-        
-        return await admin_service.upload_csv_table(content, table_name, filename)
+        return await admin_service.upload_csv_table(
+            file.file, table_name, file.filename, mode, table_schema, register_poi
+        )
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail=str(e))
         logger.error(f"Error uploading CSV table: {str(e)}")
-        error_message = str(e)
-        if "already exists" in error_message.lower():
-            raise HTTPException(status_code=400, detail=error_message)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@admin_router.get("/ingest-jobs",
+    tags=["admin/csv-upload"],
+    operation_id="list_ingest_jobs",
+    summary="List ingest jobs",
+    description="Lists the CSV upload jobs of this instance, newest first"
+)
+async def list_ingest_jobs():
+    return ingest_job_service.list_jobs()
+
+
+@admin_router.get("/ingest-jobs/{job_id}",
+    tags=["admin/csv-upload"],
+    operation_id="get_ingest_job",
+    summary="Get an ingest job",
+    description="Gets the status of a CSV upload job: rows parsed, validated, inserted and failed, throughput and ETA"
+)
+async def get_ingest_job(job_id: UUID4 = Path(..., description="ID of the ingest job")):
+    try:
+        return ingest_job_service.get_job(job_id)
+    except UPSTREAM_ERRORS:
+        raise
+    except Exception as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail="Ingest job not found")
+        logger.error(f"Error getting ingest job: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@admin_router.post("/ingest-jobs/{job_id}/cancel",
+    tags=["admin/csv-upload"],
+    operation_id="cancel_ingest_job",
+    summary="Cancel an ingest job",
+    description="Cancels a queued or running CSV upload job. The rows loaded so far are kept so the job can be "
+                "resumed, unless discard is set, which drops the table"
+)
+async def cancel_ingest_job(
+    job_id: UUID4 = Path(..., description="ID of the ingest job"),
+    discard: bool = Query(default=False, description="Drop the table and the uploaded file")
+):
+    try:
+        return await ingest_job_service.cancel_job(job_id, discard=discard)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UPSTREAM_ERRORS:
+        raise
+    except Exception as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail="Ingest job not found")
+        logger.error(f"Error cancelling ingest job: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@admin_router.post("/ingest-jobs/{job_id}/resume",
+    tags=["admin/csv-upload"],
+    operation_id="resume_ingest_job",
+    summary="Resume an ingest job",
+    description="Queues a cancelled or failed CSV upload job again, continuing after its last committed batch"
+)
+async def resume_ingest_job(job_id: UUID4 = Path(..., description="ID of the ingest job")):
+    try:
+        return ingest_job_service.resume_job(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UPSTREAM_ERRORS:
+        raise
+    except Exception as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail="Ingest job not found")
+        logger.error(f"Error resuming ingest job: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
@@ -393,6 +527,8 @@ async def delete_user(
 ):
     try:
         return await admin_service.delete_user(user_id)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error deleting user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to delete user: {str(e)}")
@@ -401,16 +537,19 @@ async def delete_user(
     tags=["admin/users"],
     operation_id="send_invitation_email",
     summary="Send an invitation email to a user",
-    description="Sends an invitation email to a user",
-    status_code=200
+    description="Queues an invitation email to a user and returns its outbox message id at once. "
+                "Poll GET /admin/email-outbox/{message_id} for its delivery",
+    status_code=202
 )
 async def send_invitation_email(
     email: str = Form(..., description="Email of the user to send the invitation to")
 ):
     try:
-        return await admin_service.send_invitation_email(email)
+        return admin_service.send_invitation_email(email)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error sending invitation email to {email}: {str(e)}")
         error_message = str(e)
@@ -418,4 +557,81 @@ async def send_invitation_email(
             raise HTTPException(status_code=500, detail="Email service not configured")
         raise HTTPException(status_code=500, detail="Internal server error while sending email")
 
-    
\ No newline at end of file
+
+@admin_router.post("/send-invitation-emails",
+    tags=["admin/users"],
+    operation_id="send_invitation_emails",
+    summary="Send invitation emails to many users",
+    description="Queues an invitation email to each address and returns at once. Invalid and repeated "
+                "addresses are skipped and listed. Poll GET /admin/email-outbox/batches/{batch_id} for their delivery",
+    status_code=202
+)
+async def send_invitation_emails(
+    emails: List[str] = Body(..., embed=True, description="Emails of the users to send the invitation to")
+):
+    try:
+        return admin_service.send_invitation_emails(emails)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UPSTREAM_ERRORS:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error sending invitation emails: {str(e)}")
+        if "not configured" in str(e).lower():
+            raise HTTPException(status_code=500, detail="Email service not configured")
+        raise HTTPException(status_code=500, detail="Internal server error while sending emails")
+
+
+@admin_router.get("/email-outbox/{message_id}",
+    tags=["admin/users"],
+    operation_id="get_email_outbox_message",
+    summary="Get the delivery status of an email",
+    description="Gets the status of a queued email: queued, sending, sent or failed, with its attempts and last error"
+)
+async def get_email_outbox_message(
+    message_id: str = Path(..., description="ID of the outbox message")
+):
+    try:
+        return email_outbox_service.get_message(message_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@admin_router.get("/email-outbox/batches/{batch_id}",
+    tags=["admin/users"],
+    operation_id="get_email_outbox_batch",
+    summary="Get the delivery status of a bulk invitation",
+    description="Gets the emails queued by a bulk invitation with their count by status"
+)
+async def get_email_outbox_batch(
+    batch_id: str = Path(..., description="ID of the bulk invitation")
+):
+    try:
+        return email_outbox_service.get_batch(batch_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    
+
+
+
+# METRICS METRICS METRICS METRICS METRICS METRICS METRICS METRICS METRICS METRICS METRICS
+
+@admin_router.get("/metrics",
+    tags=["admin/metrics"],
+    operation_id="get_metrics",
+    summary="Get runtime metrics",
+    description="Returns the in-process counters of the auth token cache, reference data cache, filter write-behind buffer, Supabase connection pool and resilience layer, and Postgres pool"
+)
+async def get_metrics():
+    return {
+        "auth_token_cache": token_cache.metrics(),
+        "auth_user_cache": auth_user_service.metrics(),
+        "reference_cache": cache_service.stats(),
+        "filter_write_behind": user_filter_service.write_behind_stats(),
+        "supabase_pool": supabase_service.pool_metrics(),
+        "supabase_resilience": supabase_service.resilience_metrics(),
+        "read_replicas": supabase_service.replica_metrics(),
+        "pg_pool": pg_service.pool_metrics(),
+        "email_outbox": email_outbox_service.stats()
+    }
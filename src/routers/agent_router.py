@@ -5,6 +5,7 @@ from uuid import UUID
 from src.middleware.auth import get_current_user
 from src.services.agent_listing_service import agent_listing_service
 from src.schemas.agent_listing import AgentListingCreate, AgentListingUpdate, AgentListingResponse
+from src.services.resilience import UPSTREAM_ERRORS
 
 agent_router = APIRouter(prefix="/agent", tags=["agent"])
 
@@ -18,6 +19,8 @@ async def create_listing(
         # Set the user_id from the current user
         listing.user_id = current_user_id
         return await agent_listing_service.create_listing(listing)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -41,6 +44,8 @@ async def get_listings(
     """Get all agent listings with pagination"""
     try:
         return await agent_listing_service.get_listings(current_user_id, page, page_size)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
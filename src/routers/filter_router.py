@@ -2,8 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import UUID4
 from typing import List
 from src.config import logger
+from src.middleware.auth import get_current_user
 from src.schemas.user_filter import UserFilterUpdate
+from src.services.reference_data_service import reference_data_service
 from src.services.supabase_service import supabase_service
+from src.services.user_filter_service import user_filter_service
+from src.services.resilience import UPSTREAM_ERRORS
 
 
 filter_router = APIRouter(prefix="/filters", tags=["filters"])
@@ -16,43 +20,28 @@ async def load_default_filters(
     market_status_id: UUID4
 ):
     try:
-        supabase = await supabase_service.client
-        response = await supabase.table("site_type_market_status_filters").select(
-            """
-            *,
-            filters(
-                id,
-                filter_type,
-                filter_data,
-                db_column_name,
-                order,
-                is_open,
-                display_name
-            )
-            """
-        ).eq("site_type_id", str(site_type_id)).eq("market_status_id", str(market_status_id)).execute()
+        filters = await reference_data_service.get_default_filters(site_type_id, market_status_id)
 
-        if not response.data:
+        if not filters:
             logger.info(f"No default filters found for site_type_id: {site_type_id} and market_status_id: {market_status_id}")
-            return []
 
-        # Extract filters and sort them by order
-        filters = []
-        for item in response.data:
-            if item["filters"]:
-                filters.append(item["filters"])
-        
-        sorted_filters = sorted(filters, key=lambda x: x["order"])
-        return sorted_filters
+        return filters
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error loading default filters: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
     
 
 @filter_router.patch("/batch")
-async def update_filters_batch(updates: List[dict]):
+async def update_filters_batch(updates: List[dict], user_id: str = Depends(get_current_user)):
     """
     Update multiple filters in a single request.
+    All ids and fields are validated up front and the valid updates are applied with
+    one bulk statement. Invalid or unknown filters are reported per item in "errors"
+    and do not prevent the rest of the batch from being saved.
+    With FILTER_WRITE_BEHIND enabled the updates are buffered and "data" holds their
+    pending values instead of the stored rows.
     Expected input format:
     [
         {
@@ -64,30 +53,16 @@ async def update_filters_batch(updates: List[dict]):
             "filter_data": { ... }
         }
     ]
+    Response format:
+    {
+        "data": [ ...updated filters... ],
+        "errors": [ { "index": 1, "id": "uuid-of-filter-2", "error": "..." } ]
+    }
     """
     try:
-        supabase = await supabase_service.client
-        results = []
-        for update in updates:
-            filter_id = update.get("id")
-            if not filter_id:
-                raise HTTPException(status_code=400, detail=f"Missing 'id' in update: {update}")
-                
-            # Convert the filter data to a dictionary
-            update_data = {k: v for k, v in update.items() if k != "id"}
-                
-            logger.info(f"Updating filter {filter_id} with data: {update_data}")
-            response = await supabase.table("user_filters").update(update_data).eq("id", str(filter_id)).execute()
-            
-            if not response.data:
-                logger.error(f"No data returned from update operation for filter {filter_id}")
-                raise HTTPException(status_code=404, detail=f"Filter not found or update failed for id: {filter_id}")
-                
-            results.append(response.data[0])
-            
-        return results
-    except HTTPException as e:
-        raise e
+        return await user_filter_service.update_filters_batch(updates, user_id)
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating filters batch: {str(e)}")
         logger.error(f"Update data was: {updates}")
@@ -95,11 +70,20 @@ async def update_filters_batch(updates: List[dict]):
 
 
 @filter_router.patch("/{filter_id}")
-async def update_filter(filter_id: UUID4, filter: UserFilterUpdate):
+async def update_filter(filter_id: UUID4, filter: UserFilterUpdate, user_id: str = Depends(get_current_user)):
+    update_data = filter.model_dump(exclude_unset=True)
     try:
+        if user_filter_service.write_behind_enabled:
+            # Acknowledge straight away, the buffered value is written on the next flush
+            valid_updates, _, errors = user_filter_service.validate_batch([{"id": str(filter_id), **update_data}])
+            if errors:
+                raise HTTPException(status_code=400, detail=errors[0]["error"])
+            acknowledged, unknown_ids = await user_filter_service.buffer_updates(user_id, valid_updates)
+            if unknown_ids:
+                raise HTTPException(status_code=404, detail="Filter not found or update failed")
+            return acknowledged[0]
+
         supabase = await supabase_service.client
-        # Convert the filter data to a dictionary
-        update_data = filter.model_dump(exclude_unset=True)
             
         logger.info(f"Updating filter with data: {update_data}")
         response = await supabase.table("user_filters").update(update_data).eq("id", str(filter_id)).execute()
@@ -109,6 +93,10 @@ async def update_filter(filter_id: UUID4, filter: UserFilterUpdate):
             raise HTTPException(status_code=404, detail="Filter not found or update failed")
             
         return response.data[0]
+    except HTTPException:
+        raise
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating filter {filter_id}: {str(e)}")
         logger.error(f"Update data was: {update_data}")
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
-from src.services.supabase_service import supabase_service
+from src.services.reference_data_service import reference_data_service
 from src.config import logger
+from src.services.resilience import UPSTREAM_ERRORS
 
 market_status_router = APIRouter(
     prefix="/market-status",
@@ -16,13 +17,9 @@ market_status_router = APIRouter(
 )
 async def get_all_market_statuses():
     try:
-        supabase = await supabase_service.client
-        response = await supabase.table("market_status").select("id, name").execute()
-        
-        if not response.data:
-            return []
-            
-        return response.data
+        return await reference_data_service.get_market_statuses()
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error fetching market statuses: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
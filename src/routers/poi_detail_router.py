@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException, Body
-from typing import List
+from fastapi import APIRouter, HTTPException, Body, Path, Query
+from typing import Any, Dict, List
 
+from src.services.poi_dataset_service import poi_dataset_service
 from src.services.supabase_service import supabase_service
 from src.config import logger
 from src.schemas.poi_detail import PoiDetailRequest, PoiDetailResponse
+from src.services.resilience import UPSTREAM_ERRORS
 
 poi_detail_router = APIRouter(
     prefix="/poi-detail",
@@ -47,7 +49,7 @@ async def query_poi_detail(
         #     )
 
         # Use service role client instead of regular client
-        supabase = await supabase_service.get_service_role_client()
+        supabase = await supabase_service.read_client(service_role=True)
         
         # Calculate pagination parameters
         start = (request.page - 1) * request.page_size
@@ -106,6 +108,8 @@ async def query_poi_detail(
 
     except HTTPException:
         raise
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error executing poi detail query: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -121,3 +125,57 @@ async def query_poi_detail(
 async def get_allowed_tables():
     """Get the list of tables that are allowed to be queried."""
     return ALLOWED_TABLES
+
+
+@poi_detail_router.get("/{table_name}/tiles/{z}/{x}/{y}",
+    response_model=List[Dict[str, Any]],
+    tags=["poi-detail"],
+    operation_id="get_poi_detail_tile",
+    summary="Get the rows of a table in a map tile",
+    description="Returns the rows of a table with latitude and longitude columns inside a web mercator tile, "
+                "served from the tile cache built when the table was uploaded"
+)
+async def get_poi_detail_tile(
+    table_name: str = Path(..., description="The name of the table to query"),
+    z: int = Path(..., ge=0, le=22, description="Zoom level"),
+    x: int = Path(..., ge=0, description="Tile column"),
+    y: int = Path(..., ge=0, description="Tile row")
+):
+    try:
+        return await poi_dataset_service.get_tile(table_name, z, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UPSTREAM_ERRORS:
+        raise
+    except Exception as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
+        logger.error(f"Error getting tile {z}/{x}/{y} of {table_name}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@poi_detail_router.get("/{table_name}/nearest",
+    response_model=List[Dict[str, Any]],
+    tags=["poi-detail"],
+    operation_id="get_poi_detail_nearest",
+    summary="Get the rows of a table nearest to a point",
+    description="Returns the rows of a table with latitude and longitude columns nearest to a point, "
+                "closest first, with their distance in meters"
+)
+async def get_poi_detail_nearest(
+    table_name: str = Path(..., description="The name of the table to query"),
+    latitude: float = Query(..., ge=-90, le=90, description="Latitude of the point"),
+    longitude: float = Query(..., ge=-180, le=180, description="Longitude of the point"),
+    limit: int = Query(default=10, ge=1, le=100, description="Number of rows to return")
+):
+    try:
+        return await poi_dataset_service.nearest(table_name, latitude, longitude, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UPSTREAM_ERRORS:
+        raise
+    except Exception as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
+        logger.error(f"Error getting rows of {table_name} nearest to {latitude},{longitude}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
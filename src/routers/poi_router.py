@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from typing import List
 
-from src.services.supabase_service import supabase_service
+from src.services.reference_data_service import reference_data_service
 from src.schemas.poi import POI
 from src.config import logger
+from src.services.resilience import UPSTREAM_ERRORS
 
 poi_router = APIRouter(
     prefix="/poi",
@@ -20,26 +21,9 @@ poi_router = APIRouter(
 )
 async def get_all_poi():
     try:
-        supabase = await supabase_service.client
-        response = await supabase.table("poi").select(
-            """
-            id,
-            created_at,
-            name,
-            db_column_name,
-            details_table_name,
-            icon_svg,
-            order,
-            site_type_id,
-            site_types(name),
-            details_table_name
-            """
-        ).order("order").execute()
-        
-        if not response.data:
-            return []
-            
-        return response.data
+        return await reference_data_service.get_poi()
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error fetching POI: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -1,14 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from typing import List
+from typing import List, Literal
 from pydantic import UUID4
 from uuid import UUID
 import asyncio
 
 from src.services.supabase_service import supabase_service
+from src.services.pg_service import pg_service
 from src.services.project_service import project_service
-from src.schemas.project import ProjectCreate, ProjectUpdate
+from src.services.reference_data_service import reference_data_service
+from src.services.user_filter_service import user_filter_service
+from src.schemas.project import ProjectCreate, ProjectUpdate, ProjectClone
 from src.config import logger
 from src.middleware.auth import get_current_user
+from src.services.resilience import UPSTREAM_ERRORS
  
 project_router = APIRouter(
     prefix="/projects",
@@ -18,50 +22,41 @@ project_router = APIRouter(
 
 # THIS RETURNS BOTH THE SAVED FILTER CONFIG AND THE DEFAULT CONFIGS
 @project_router.get("/{project_id}")
-async def get_project(project_id: UUID4):
+async def get_project(project_id: UUID4, user_id: str = Depends(get_current_user)):
     try:
-        supabase = await supabase_service.client
-        response = await supabase.table("projects").select(
-            """
-            id,
-            title,
-            site_type_id,
-            market_status_id,
-            market_status(*),
-            site_types(*),
-            user_filters(*)
-            """
-        ).eq("id", project_id).execute()
+        # Write any buffered filter edits of this user first so the read sees them
+        await user_filter_service.flush(user_id=user_id)
 
-        if not response.data:
+        if pg_service.enabled:
+            project = await pg_service.get_project(project_id)
+        else:
+            supabase = await supabase_service.read_client()
+            response = await supabase.table("projects").select(
+                """
+                id,
+                title,
+                site_type_id,
+                market_status_id,
+                market_status(*),
+                site_types(*),
+                user_filters(*)
+                """
+            ).eq("id", project_id).execute()
+            project = response.data[0] if response.data else None
+
+        if not project:
             logger.error(f"Project not found with id: {project_id}")
             raise HTTPException(status_code=404, detail="Project not found")
         
-        project = response.data[0]
-        
         # Fetch default filters for this project's site type and market status
-        default_filters_response = await supabase.table("site_type_market_status_filters").select(
-            """
-            *,
-            filters(
-                id,
-                filter_type,
-                filter_data,
-                db_column_name,
-                order,
-                display_name,
-                is_open
-            )
-            """
-        ).eq("site_type_id", str(project["site_type_id"])).eq("market_status_id", str(project["market_status_id"])).execute()
-        
-        # Extract the default filters
-        default_filters = [item["filters"] for item in default_filters_response.data] if default_filters_response.data else []
+        default_filters = await reference_data_service.get_default_filters(project["site_type_id"], project["market_status_id"])
         
         # Add default filters to the project data
         project["default_filters"] = default_filters
         
         return project
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error fetching project {project_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -72,7 +67,7 @@ async def get_all_projects(
     user_id: str = Depends(get_current_user)
 ):
     try:
-        supabase = await supabase_service.client
+        supabase = await supabase_service.read_client()
         query = supabase.table("projects").select(
         """
         id,
@@ -83,6 +78,8 @@ async def get_all_projects(
         response = await query.execute()
 
         return response.data
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error fetching projects: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -91,88 +88,70 @@ async def get_all_projects(
 @project_router.post("/")
 async def create_project(project: ProjectCreate, user_id: str = Depends(get_current_user)):
     try:
-        supabase = await supabase_service.client
-        # Convert the project data to a dictionary and ensure UUIDs are strings
-        project_data = project.model_dump(exclude={"id", "created_at"})
-        
-        # Add user_id from authentication
-        project_data["user_id"] = user_id
-        
-        for key, value in project_data.items():
-            if isinstance(value, UUID):
-                project_data[key] = str(value)
-        
-        # Let Supabase handle id and created_at
-        response = await supabase.table("projects").insert(project_data).execute()
+        # Insert the project, copy its template filters and return it with all relations in one call
+        project_result = await project_service.create_project(
+            user_id=user_id,
+            title=project.title,
+            site_type_id=project.site_type_id,
+            market_status_id=project.market_status_id,
+            is_active=project.is_active
+        )
         
-        if not response.data:
-            logger.error(f"Failed to create project: {project_data}")
+        if not project_result:
+            logger.error(f"Failed to create project: {project.model_dump()}")
             raise HTTPException(status_code=400, detail="Failed to create project")
         
-        # Get the created project data
-        project_result = response.data[0]
-        
-        # Fetch the matching filters for this site type and market status
-        filters_response = await supabase.table("site_type_market_status_filters").select(
-            """
-            *,
-            filters(*)
-            """
-        ).eq("site_type_id", str(project.site_type_id)).eq("market_status_id", str(project.market_status_id)).execute()
-        
-        if filters_response.data:
-            # Create user_filters entries for each filter
-            user_filters = []
-            for filter_association in filters_response.data:
-                filter_data = filter_association["filters"]
-                user_filter = {
-                    "project_id": str(project_result["id"]),
-                    "filter_type": filter_data["filter_type"],
-                    "filter_data": filter_data["filter_data"],
-                    "db_column_name": filter_data["db_column_name"],
-                    "order": filter_data["order"],
-                    "display_name": filter_data["display_name"],
-                    "is_open": filter_data["is_open"]
-                }
-                user_filters.append(user_filter)
-                
-            if user_filters:
-                await supabase.table("user_filters").insert(user_filters).execute()
+        return project_result
+    except HTTPException:
+        raise
+    except UPSTREAM_ERRORS:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating project: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@project_router.post("/{project_id}/clone")
+async def clone_project(
+    project_id: UUID4,
+    clone: ProjectClone = Body(default=ProjectClone()),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Duplicate a project and all of its filters in a single call, optionally overriding
+    the title, is_active and individual filter values of the copy
+    """
+    try:
+        # Write any buffered filter edits of this user first so the copy has them
+        await user_filter_service.flush(user_id=user_id)
+
+        project_result = await project_service.clone_project(project_id, user_id, clone)
         
-        # Get the final project data with all relations
-        final_response = await supabase.table("projects").select(
-            """
-            id,
-            created_at,
-            title,
-            market_status!inner(
-                id,
-                name
-            ),
-            site_types!inner(
-                id,
-                name
-            ),
-            user_filters(
-                id,
-                filter_type,
-                filter_data,
-                db_column_name,
-                display_name,
-                order,
-                is_open
-            )
-            """
-        ).eq("id", project_result["id"]).execute()
+        if project_result is None:
+            raise HTTPException(status_code=404, detail="Project not found")
         
-        return final_response.data[0]
+        return project_result
+    except HTTPException:
+        raise
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
-        logger.error(f"Error creating project: {str(e)}")
+        logger.error(f"Error cloning project {project_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @project_router.patch("/{project_id}")
-async def update_project(project_id: UUID4, project: ProjectUpdate):
+async def update_project(
+    project_id: UUID4,
+    project: ProjectUpdate,
+    filter_mode: Literal["reset", "reconcile"] = Query(
+        default="reset",
+        description="How user filters are updated when the site type or market status changes: "
+                    "'reset' restores the template values, 'reconcile' keeps the values of filters "
+                    "that exist in both the old and the new template"
+    ),
+    user_id: str = Depends(get_current_user)
+):
     try:
         supabase = await supabase_service.client
         
@@ -210,43 +189,21 @@ async def update_project(project_id: UUID4, project: ProjectUpdate):
         
         updated_project = response.data[0]
         
-        # If site_type_id or market_status_id changed, reset user filters to default
+        # If site_type_id or market_status_id changed, diff the user filters against the new template
         if site_type_changed or market_status_changed:
-            # Delete all existing user filters for this project
-            await supabase.table("user_filters").delete().eq("project_id", str(project_id)).execute()
-            
-            # Get the new site_type_id and market_status_id (use updated values or current values)
-            new_site_type_id = project_data.get("site_type_id", current_project["site_type_id"])
-            new_market_status_id = project_data.get("market_status_id", current_project["market_status_id"])
-            
-            # Fetch the default filters for the new combination
-            filters_response = await supabase.table("site_type_market_status_filters").select(
-                """
-                *,
-                filters(*)
-                """
-            ).eq("site_type_id", str(new_site_type_id)).eq("market_status_id", str(new_market_status_id)).execute()
-            
-            if filters_response.data:
-                # Create new user_filters entries based on default filters
-                user_filters = []
-                for filter_association in filters_response.data:
-                    filter_data = filter_association["filters"]
-                    user_filter = {
-                        "project_id": str(project_id),
-                        "filter_type": filter_data["filter_type"],
-                        "filter_data": filter_data["filter_data"],
-                        "display_name": filter_data["display_name"],
-                        "db_column_name": filter_data["db_column_name"],
-                        "order": filter_data["order"],
-                        "is_open": filter_data["is_open"]
-                    }
-                    user_filters.append(user_filter)
-                    
-                if user_filters:
-                    await supabase.table("user_filters").insert(user_filters).execute()
+            # Write buffered filter edits first, a later flush would undo the reset or touch removed filters
+            await user_filter_service.flush(user_id=user_id)
+            await project_service.reconcile_filters(
+                project_id,
+                keep_values=filter_mode == "reconcile",
+                client=supabase
+            )
         
         return updated_project
+    except HTTPException:
+        raise
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error updating project {project_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -262,18 +219,23 @@ async def delete_project(project_id: UUID4):
             logger.error(f"Project not found for deletion with id: {project_id}")
             raise HTTPException(status_code=404, detail="Project not found")
         return {"message": "Project deleted successfully"}
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error deleting project {project_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @project_router.get("/combined-data/{project_id}")
-async def get_project_with_related_data(project_id: UUID4):
+async def get_project_with_related_data(project_id: UUID4, user_id: str = Depends(get_current_user)):
     """
     Get project data along with related market statuses, site types, and POIs in a single call
     """
     try:
-        supabase = await supabase_service.client
+        # Write any buffered filter edits of this user first so the read sees them
+        await user_filter_service.flush(user_id=user_id)
+
+        supabase = await supabase_service.read_client()
         
         # Fetch all data concurrently using asyncio.gather
         async def get_project_data():
@@ -292,59 +254,18 @@ async def get_project_with_related_data(project_id: UUID4):
                 raise HTTPException(status_code=404, detail="Project not found")
             return response.data[0]
             
-        async def get_default_filters(site_type_id, market_status_id):
-            response = await supabase.table("site_type_market_status_filters").select(
-                """
-                *,
-                filters(
-                    id,
-                    filter_type,
-                    filter_data,
-                    db_column_name,
-                    order,
-                    display_name,
-                    is_open
-                )
-                """
-            ).eq("site_type_id", site_type_id).eq("market_status_id", market_status_id).execute()
-            return [item["filters"] for item in response.data] if response.data else []
-            
-        async def get_market_statuses():
-            response = await supabase.table("market_status").select("id, name").execute()
-            return response.data if response.data else []
-            
-        async def get_site_types():
-            response = await supabase.table("site_types").select("id, name, icon, order").order("order").execute()
-            return response.data if response.data else []
-            
-        async def get_poi():
-            response = await supabase.table("poi").select(
-                """
-                id,
-                name,
-                db_column_name,
-                details_table_name,
-                icon_svg,
-                order,
-                site_type_id,
-                site_types(name),
-                details_table_name
-                """
-            ).order("order").execute()
-            return response.data if response.data else []
-        
         # Execute all queries concurrently
         project, market_statuses, site_types, poi = await asyncio.gather(
             get_project_data(),
-            get_market_statuses(),
-            get_site_types(),
-            get_poi()
+            reference_data_service.get_market_statuses(),
+            reference_data_service.get_site_types(),
+            reference_data_service.get_poi()
         )
         
         # Fetch default filters after we have the project data
-        default_filters = await get_default_filters(
-            str(project["site_type_id"]), 
-            str(project["market_status_id"])
+        default_filters = await reference_data_service.get_default_filters(
+            project["site_type_id"],
+            project["market_status_id"]
         )
         
         # Combine all data
@@ -357,6 +278,8 @@ async def get_project_with_related_data(project_id: UUID4):
         
     except HTTPException as he:
         raise he
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error fetching combined data for project {project_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -3,6 +3,8 @@ from typing import List, Optional, Dict, Any
 from postgrest.exceptions import APIError
 
 from src.services.supabase_service import supabase_service
+from src.services.reference_data_service import reference_data_service
+from src.services.pg_service import pg_service
 from src.config import settings, logger
 from src.schemas.filter import FilterBase
 from src.middleware.auth import get_current_user
@@ -14,6 +16,7 @@ from src.services.filter_service import (
     apply_zone_filter,
     is_column_not_exist_error
 )
+from src.services.resilience import UPSTREAM_ERRORS
 
 
 property_router = APIRouter(prefix="/properties", tags=["properties"])
@@ -21,6 +24,50 @@ property_router = APIRouter(prefix="/properties", tags=["properties"])
 
 TABLE_NAME = settings.PROPERTY_TABLE_NAME
 
+# Columns returned by the property search
+PROPERTY_LIST_COLUMNS = (
+    # PROPERTY LISTING DETAILS
+    "id",
+    "land_area_m2",
+    "days_on_market",
+    "listing_date",
+    "agent_name",
+    "agent_phone_number",
+    "description",
+    "property_images",
+    "asking_price",
+    "max_price_range",
+    "address",
+    "net_income",
+    "yield_percentage",
+    "sold_price",
+    "sold_on",
+    "lease_terms",
+
+    # TESTING DATA
+    "latitude",  # use for testing now
+    "longitude", # use for testing now
+
+    # FILTERS 
+    "property_type",
+    "category",
+    "area",
+    "zones",
+    "traffic_total",
+    "overlays",
+    "min_dist_to_kfc",
+    "min_dist_to_mcdonalds",
+    "distance_to_hj",
+    "distance_to_gyg",
+    "distance_to_grilld",
+    "distance_to_cbd",
+    "distance_to_redrooster",
+    "distance_to_tram",
+    "distance_to_train",
+    "distance_to_primary",
+    "distance_to_secondary",
+)
+
 
 async def get_property_count(query):
     """Helper to get current query count for performance tracking"""
@@ -32,10 +79,49 @@ async def get_property_count(query):
             # If the error is due to a non-existent column, return None to indicate we should skip this count
             return None
         raise
+    except UPSTREAM_ERRORS:
+        raise
     except Exception:
         return 0
 
 
+def pagination(total_count: int, page: int, page_size: int) -> Dict[str, Any]:
+    total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 0
+    return {
+        "total_count": total_count,
+        "total_pages": total_pages,
+        "current_page": page,
+        "page_size": page_size,
+        "has_next": page < total_pages,
+        "has_previous": page > 1
+    }
+
+
+async def search_properties_with_pg(
+    filters: Optional[List[FilterBase]],
+    market_status: Optional[str],
+    page: int,
+    page_size: int
+) -> Dict[str, Any]:
+    """Property search over the direct Postgres connection, one count and one page query"""
+    rows, total_count = await pg_service.search_properties(
+        PROPERTY_LIST_COLUMNS,
+        filters or [],
+        market_status,
+        offset=(page - 1) * page_size,
+        limit=page_size
+    )
+    response_pagination = pagination(total_count, page, page_size)
+
+    logger.info(f"🏁 FILTER SESSION END (postgres) - Final: {total_count:,}")
+    logger.info(f"📄 PAGINATION - Page: {page}/{response_pagination['total_pages']} | Items: {len(rows)}/{page_size}")
+
+    return {
+        "data": rows,
+        "pagination": response_pagination
+    }
+
+
 @property_router.post("/")
 async def get_properties(
     filters: Optional[List[FilterBase]] = Body(default=None, description="List of filters to apply"),
@@ -43,7 +129,7 @@ async def get_properties(
     page: int = Body(default=1, ge=1, description="Page number (1-based)"),
     page_size: int = Body(default=50, ge=1, le=50, description="Number of records per page, fixed at 50")
 ) -> Dict[str, Any]:
-    supabase = await supabase_service.client
+    supabase = await supabase_service.read_client()
     
     # Log pagination request
     logger.info(f"📄 Received request for page {page} with page size {page_size}")
@@ -56,56 +142,27 @@ async def get_properties(
     end = start + page_size - 1
     
     logger.info(f"📄 Fetching records {start} to {end}")
+
+    if pg_service.enabled:
+        try:
+            return await search_properties_with_pg(filters, market_status, page, page_size)
+        except Exception as e:
+            logger.error(f"⚠️ Postgres property search failed, falling back to PostgREST: {str(e)}")
     
-    query = supabase.table(TABLE_NAME).select(
-        # PROPERTY LISTING DETAILS
-        "id",
-        "land_area_m2",
-        "days_on_market",
-        "listing_date",
-        "agent_name",
-        "agent_phone_number",
-        "description",
-        "property_images",
-        "asking_price",
-        "max_price_range",
-        "address",
-        "net_income",
-        "yield_percentage",
-        "sold_price",
-        "sold_on",
-        "lease_terms",
-
-        # TESTING DATA
-        "latitude",  # use for testing now
-        "longitude", # use for testing now
-
-        # FILTERS 
-        "property_type",
-        "category",
-        "area",
-        "zones",
-        "traffic_total",
-        "overlays",
-        "min_dist_to_kfc",
-        "min_dist_to_mcdonalds",
-        "distance_to_hj",
-        "distance_to_gyg",
-        "distance_to_grilld",
-        "distance_to_cbd",
-        "distance_to_redrooster",
-        "distance_to_tram",
-        "distance_to_train",
-        "distance_to_primary",
-        "distance_to_secondary",
-    )
+    query = supabase.table(TABLE_NAME).select(*PROPERTY_LIST_COLUMNS)
 
     # Create count query for performance tracking
     count_query = supabase.table(TABLE_NAME).select("*", count="exact")
     
-    # Get initial count and start filter session
-    initial_count = await get_property_count(supabase.table(TABLE_NAME).select("id", count="exact"))
-    if initial_count is None:
+    # Known columns of the property table, so filters on missing columns are skipped without test queries
+    columns = await reference_data_service.get_table_columns(TABLE_NAME)
+
+    # Get initial count (cached snapshot) and start filter session
+    try:
+        initial_count = await reference_data_service.get_property_count()
+    except UPSTREAM_ERRORS:
+        raise
+    except Exception:
         initial_count = 0
     logger.info(f"🚀 FILTER SESSION START - Initial properties: {initial_count:,}")
     
@@ -142,11 +199,11 @@ async def get_properties(
                     query = apply_zone_filter(query, filter_obj.db_column_name, filter_obj.filter_data)
                     count_query = apply_zone_filter(count_query, filter_obj.db_column_name, filter_obj.filter_data)
                 elif filter_type.lower() == "distance_to_poi":
-                    query = await apply_distance_to_poi_filter(query, filter_obj.filter_data)
-                    count_query = await apply_distance_to_poi_filter(count_query, filter_obj.filter_data)
+                    query = await apply_distance_to_poi_filter(query, filter_obj.filter_data, columns)
+                    count_query = await apply_distance_to_poi_filter(count_query, filter_obj.filter_data, columns)
                 elif filter_type.lower() == "supply_demand_ratio":
-                    query = await apply_supply_demand_ratio_filter(query, filter_obj.db_column_name, filter_obj.filter_data)
-                    count_query = await apply_supply_demand_ratio_filter(count_query, filter_obj.db_column_name, filter_obj.filter_data)
+                    query = await apply_supply_demand_ratio_filter(query, filter_obj.db_column_name, filter_obj.filter_data, columns)
+                    count_query = await apply_supply_demand_ratio_filter(count_query, filter_obj.db_column_name, filter_obj.filter_data, columns)
                 
                 # Track performance after filter
                 current_count = await get_property_count(count_query)
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
-from src.services.supabase_service import supabase_service
+from src.services.reference_data_service import reference_data_service
 from src.config import logger
+from src.services.resilience import UPSTREAM_ERRORS
 
 site_type_router = APIRouter(prefix="/site-types", tags=["site-types"])
 
@@ -13,13 +14,9 @@ site_type_router = APIRouter(prefix="/site-types", tags=["site-types"])
 )
 async def get_all_site_types():
     try:
-        supabase = await supabase_service.client
-        response = await supabase.table("site_types").select("id, name, icon, order").order("order").execute()
-        
-        if not response.data:
-            return []
-            
-        return response.data
+        return await reference_data_service.get_site_types()
+    except UPSTREAM_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error fetching site types: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
@@ -71,13 +71,13 @@ async def update_profile(
     current_user_id: str = Depends(get_current_user)
 ) -> UserProfileResponse:
     """Update a user profile"""
-    # Get the existing profile
-    existing_profile = await user_profile_service.get_profile(profile_id)
-    if not existing_profile:
+    # Get the owner of the existing profile
+    owner_id = await user_profile_service.get_profile_owner(profile_id)
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Profile not found")
     
     # Ensure the user can only update their own profile
-    if str(existing_profile.user_id) != current_user_id:
+    if owner_id != current_user_id:
         raise HTTPException(status_code=403, detail="Cannot update another user's profile")
     
     return await user_profile_service.update_profile(profile_id, profile_update)
@@ -0,0 +1,65 @@
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+
+# Column types of an uploaded dataset, mapped to Postgres types by create_dataset_table
+COLUMN_TYPES = ("integer", "float", "boolean", "text", "date", "timestamp")
+
+
+class DatasetColumn(BaseModel):
+    name: str = Field(..., pattern=r"^[a-zA-Z_][a-zA-Z0-9_]*$", max_length=40, description="Column name")
+    type: Literal["integer", "float", "boolean", "text", "date", "timestamp"] = Field(..., description="Column type")
+    role: Optional[Literal["key", "geo", "filterable"]] = Field(
+        default=None,
+        description="'key' for the primary key, 'geo' for the latitude and longitude columns (in that order), "
+                    "'filterable' for columns that get an index"
+    )
+    nullable: bool = Field(default=True, description="Whether values may be empty, key and geo columns never are")
+
+
+class DatasetSchema(BaseModel):
+    columns: List[DatasetColumn] = Field(..., min_length=1, description="Columns of the table, in order")
+
+    @model_validator(mode="after")
+    def check_roles(self):
+        names = [column.name for column in self.columns]
+        if len(set(names)) != len(names):
+            raise ValueError("Column names must be unique")
+        if "row_hash" in names:
+            raise ValueError("Column name row_hash is reserved")
+
+        keys = [column for column in self.columns if column.role == "key"]
+        if len(keys) != 1:
+            raise ValueError("Schema must have exactly one key column")
+        if keys[0].type not in ("integer", "text"):
+            raise ValueError("Key column must be of type integer or text")
+
+        geo = [column for column in self.columns if column.role == "geo"]
+        if geo and (len(geo) != 2 or any(column.type != "float" for column in geo)):
+            raise ValueError("Schema must have no geo columns or two float geo columns, latitude then longitude")
+
+        for column in keys + geo:
+            column.nullable = False
+        return self
+
+    @property
+    def names(self) -> List[str]:
+        return [column.name for column in self.columns]
+
+    @property
+    def key(self) -> DatasetColumn:
+        return next(column for column in self.columns if column.role == "key")
+
+    @property
+    def geo(self) -> List[DatasetColumn]:
+        return [column for column in self.columns if column.role == "geo"]
+
+
+# Layout of the POI tables created by create_csv_table
+POI_SCHEMA = DatasetSchema(columns=[
+    DatasetColumn(name="id", type="integer", role="key"),
+    DatasetColumn(name="latitude", type="float", role="geo"),
+    DatasetColumn(name="longitude", type="float", role="geo"),
+    DatasetColumn(name="business_name", type="text", nullable=False),
+])
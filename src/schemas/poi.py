@@ -1,5 +1,5 @@
 from typing import Optional
-from pydantic import UUID4, Field
+from pydantic import UUID4, BaseModel, Field
 from src.schemas import BaseSchema
 
 
@@ -31,6 +31,15 @@ class POIUpdate(BaseSchema):
         exclude_unset = True
 
 
+class POIRegistration(BaseModel):
+    """Registers an uploaded table as a POI of a site type, details_table_name is the uploaded table"""
+    site_type_id: UUID4
+    name: str
+    db_column_name: str
+    icon_svg: str
+    order: int = Field(default=0, description="Order for displaying POI")
+
+
 class POI(POIBase):
     id: UUID4
     site_type_id: UUID4
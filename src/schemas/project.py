@@ -1,8 +1,8 @@
 from typing import Optional, List
-from pydantic import UUID4, Field
+from pydantic import UUID4, BaseModel, Field
 from src.schemas import BaseSchema
 from src.schemas.site_type import SiteType
-from src.schemas.user_filter import UserFilter
+from src.schemas.user_filter import UserFilter, UserFilterOverride
 from src.schemas.market_status import MarketStatus
 
 
@@ -27,6 +27,12 @@ class ProjectUpdate(ProjectBase):
         exclude_unset = True
 
 
+class ProjectClone(BaseModel):
+    title: Optional[str] = Field(default=None, description="Title of the copy, defaults to the source title with ' (copy)' appended")
+    is_active: Optional[bool] = Field(default=None, description="Whether the copy is active, defaults to the source value")
+    filter_overrides: List[UserFilterOverride] = Field(default=[], description="Filter values to change in the copy")
+
+
 class Project(ProjectBase):
     id: UUID4
 
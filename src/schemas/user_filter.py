@@ -1,5 +1,5 @@
 from typing import Any, Dict, Optional
-from pydantic import UUID4, Field
+from pydantic import UUID4, BaseModel, Field
 from src.schemas import BaseSchema
 
 
@@ -29,3 +29,10 @@ class UserFilter(BaseUserFilter):
 
     class Config:
         from_attributes = True
+
+
+class UserFilterOverride(BaseModel):
+    id: UUID4 = Field(..., description="Id of the filter in the source project")
+    filter_data: Optional[Dict[str, Any]] = Field(default=None, description="Filter data to use instead of the copied value")
+    order: Optional[int] = Field(default=None, description="Order to use instead of the copied value")
+    is_open: Optional[bool] = Field(default=None, description="Open state to use instead of the copied value")
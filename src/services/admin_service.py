@@ -1,23 +1,33 @@
-from typing import List, Dict, Any
-from pydantic import UUID4
+from typing import BinaryIO, List, Dict, Any, Optional
+from pydantic import UUID4, ValidationError
 from uuid import UUID
-import csv
-import io
 import re
-import asyncio
-
-import resend
 
+from src.schemas.dataset import DatasetSchema
 from src.schemas.filter import FilterCreate, FilterUpdate
 from src.schemas.market_status import MarketStatusCreate
 from src.schemas.order import BatchOrderUpdate
-from src.schemas.poi import POI, POICreate, POIUpdate
+from src.schemas.poi import POI, POICreate, POIRegistration, POIUpdate
 from src.schemas.site_type import SiteTypeCreate
+from src.services.data_loader import get_loader
+from src.services.email_outbox_service import email_outbox_service
+from src.services.csv_ingest import upload_format
+from src.services.ingest_job_service import UPLOAD_MODES, ingest_job_service
+from src.services.order_service import order_service
+from src.services.reference_data_service import reference_data_service
 from src.services.supabase_service import supabase_service
 from src.config import logger, settings
 from src.utils.emails import invitation_email_template
 
 
+# Fields of a POI returned by the admin endpoints, together with its site type
+POI_FIELDS = ("id", "created_at", "name", "db_column_name", "details_table_name", "icon_svg", "order", "site_type_id")
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+INVITATION_SENDER = "onboarding@resend.dev"
+INVITATION_SUBJECT = "Welcome to Buy Advocate"
+
+
 class AdminService:
     _instance = None
 
@@ -68,6 +78,7 @@ class AdminService:
             logger.error(f"Failed to create filter association: {filter_data}")
             raise Exception("Failed to create filter association")
 
+        reference_data_service.invalidate_table("site_type_market_status_filters")
         return response.data[0]
 
     async def assign_filters_to_site_type_market_status(self, site_type_id: UUID4, market_status_id: UUID4, filter_ids: List[UUID4]) -> List[Dict[str, Any]]:
@@ -91,6 +102,7 @@ class AdminService:
             logger.error(f"Failed to assign filters for site_type_id: {site_type_id} and market_status_id: {market_status_id}")
             raise Exception("Failed to assign filters")
         
+        reference_data_service.invalidate_table("site_type_market_status_filters")
         return response.data
 
     async def get_all_filters(self) -> List[Dict[str, Any]]:
@@ -124,6 +136,7 @@ class AdminService:
             logger.error(f"Failed to update filter: {filter_id}")
             raise Exception("Filter not found")
             
+        reference_data_service.invalidate_table("filters")
         return response.data[0]
 
     async def delete_filter(self, filter_id: UUID4) -> Dict[str, str]:
@@ -140,31 +153,12 @@ class AdminService:
             logger.error(f"Failed to delete filter: {filter_id}")
             raise Exception("Filter not found")
             
+        reference_data_service.invalidate_table("filters")
         return {"message": "Filter deleted successfully"}
 
     async def update_filters_order(self, site_type_id: UUID4, market_status_id: UUID4, updates: BatchOrderUpdate) -> Dict[str, str]:
         """Update orders of multiple filters for a specific site type and market status"""
-        supabase = await supabase_service.client
-        
-        # Create a list of updates
-        update_operations = []
-        for item in updates.updates:
-            update_operations.append(
-                supabase.table("filters")
-                .update({"order": item.order})
-                .eq("id", item.id)
-                .execute()
-            )
-        
-        # Execute all updates in parallel
-        results = await asyncio.gather(*update_operations, return_exceptions=True)
-        
-        # Check for errors
-        errors = [r for r in results if isinstance(r, Exception)]
-        if errors:
-            logger.error(f"Errors updating filters order: {errors}")
-            raise Exception("Failed to update some filters")
-            
+        await order_service.apply_batch_order("filters", updates)
         return {"message": "Orders updated successfully"}
 
     # SITE TYPES
@@ -183,6 +177,7 @@ class AdminService:
             logger.error(f"Failed to create site type: {site_type_data}")
             raise Exception("Failed to create site type")
 
+        reference_data_service.invalidate_table("site_types")
         return response.data[0]
 
     async def update_site_type_name(self, site_type_id: UUID4, name: str) -> Dict[str, Any]:
@@ -194,6 +189,7 @@ class AdminService:
             logger.error(f"Failed to update site type: {site_type_id}")
             raise Exception("Site type not found")
             
+        reference_data_service.invalidate_table("site_types")
         return response.data[0]
 
     async def delete_site_type(self, site_type_id: UUID4) -> Dict[str, str]:
@@ -210,31 +206,12 @@ class AdminService:
             logger.error(f"Failed to delete site type: {site_type_id}")
             raise Exception("Site type not found")
             
+        reference_data_service.invalidate_table("site_types")
         return {"message": "Site type deleted successfully"}
 
     async def update_site_types_order(self, updates: BatchOrderUpdate) -> Dict[str, str]:
         """Update orders of multiple site types in a single operation"""
-        supabase = await supabase_service.client
-        
-        # Create a list of updates
-        update_operations = []
-        for item in updates.updates:
-            update_operations.append(
-                supabase.table("site_types")
-                .update({"order": item.order})
-                .eq("id", item.id)
-                .execute()
-            )
-        
-        # Execute all updates in parallel
-        results = await asyncio.gather(*update_operations, return_exceptions=True)
-        
-        # Check for errors
-        errors = [r for r in results if isinstance(r, Exception)]
-        if errors:
-            logger.error(f"Errors updating site types order: {errors}")
-            raise Exception("Failed to update some site types")
-            
+        await order_service.apply_batch_order("site_types", updates)
         return {"message": "Orders updated successfully"}
 
     # MARKET STATUSES
@@ -253,6 +230,7 @@ class AdminService:
             logger.error(f"Failed to create market status: {market_status_data}")
             raise Exception("Failed to create market status")
 
+        reference_data_service.invalidate_table("market_status")
         return response.data[0]
 
     async def update_market_status_name(self, market_status_id: UUID4, name: str) -> Dict[str, Any]:
@@ -264,6 +242,7 @@ class AdminService:
             logger.error(f"Failed to update market status: {market_status_id}")
             raise Exception("Market status not found")
             
+        reference_data_service.invalidate_table("market_status")
         return response.data[0]
 
     async def delete_market_status(self, market_status_id: UUID4) -> Dict[str, str]:
@@ -280,6 +259,7 @@ class AdminService:
             logger.error(f"Failed to delete market status: {market_status_id}")
             raise Exception("Market status not found")
             
+        reference_data_service.invalidate_table("market_status")
         return {"message": "Market status deleted successfully"}
 
     # POI
@@ -288,8 +268,8 @@ class AdminService:
         supabase = await supabase_service.client
         
         # First check if site_type_id exists
-        site_type_check = await supabase.table("site_types").select("id").eq("id", str(site_type_id)).execute()
-        if not site_type_check.data:
+        site_type = await get_loader("site_types").load(site_type_id)
+        if not site_type:
             raise Exception("Site type not found")
         
         # Convert the POI data to a dictionary and add site_type_id
@@ -308,31 +288,22 @@ class AdminService:
             logger.error(f"Failed to create POI: {poi_data}")
             raise Exception("Failed to create POI")
         
-        # Get the created POI with site type data
-        poi_id = response.data[0]["id"]
-        final_response = await supabase.table("poi").select(
-            """
-            id,
-            created_at,
-            name,
-            db_column_name,
-            details_table_name,
-            icon_svg,
-            order,
-            site_type_id,
-            site_types(name)
-            """
-        ).eq("id", poi_id).execute()
-        
-        return final_response.data[0]
+        # Return the created POI with its site type name, from the rows already loaded
+        created_poi = {field: response.data[0].get(field) for field in POI_FIELDS}
+        created_poi["site_types"] = {"name": site_type["name"]}
+        get_loader("poi").prime(created_poi["id"], response.data[0])
+        
+        reference_data_service.invalidate_table("poi")
+        return created_poi
 
     async def update_poi(self, poi_id: UUID4, poi: POIUpdate) -> POI:
         """Update an existing point of interest"""
         supabase = await supabase_service.client
         
         # Check if POI exists
-        existing_poi = await supabase.table("poi").select("id").eq("id", str(poi_id)).execute()
-        if not existing_poi.data:
+        poi_loader = get_loader("poi")
+        existing_poi = await poi_loader.load(poi_id)
+        if not existing_poi:
             raise Exception("POI not found")
         
         # Convert the POI data to a dictionary
@@ -353,30 +324,21 @@ class AdminService:
             logger.error(f"Failed to update POI {poi_id}: {poi_data}")
             raise Exception("Failed to update POI")
         
-        # Get the updated POI with site type data
-        final_response = await supabase.table("poi").select(
-            """
-            id,
-            created_at,
-            name,
-            db_column_name,
-            details_table_name,
-            icon_svg,
-            order,
-            site_type_id,
-            site_types(*)
-            """
-        ).eq("id", str(poi_id)).execute()
-        
-        return final_response.data[0]
+        # Return the updated POI with its site type, loaded through the request's site type loader
+        poi_loader.prime(poi_id, response.data[0])
+        updated_poi = {field: response.data[0].get(field) for field in POI_FIELDS}
+        updated_poi["site_types"] = await get_loader("site_types").load(updated_poi["site_type_id"]) if updated_poi["site_type_id"] else None
+        
+        reference_data_service.invalidate_table("poi")
+        return updated_poi
 
     async def delete_poi(self, poi_id: UUID4) -> Dict[str, str]:
         """Delete an existing point of interest"""
         supabase = await supabase_service.client
         
         # Check if POI exists
-        existing_poi = await supabase.table("poi").select("id").eq("id", str(poi_id)).execute()
-        if not existing_poi.data:
+        poi_loader = get_loader("poi")
+        if not await poi_loader.load(poi_id):
             raise Exception("POI not found")
         
         # Delete the POI
@@ -386,224 +348,65 @@ class AdminService:
             logger.error(f"Failed to delete POI {poi_id}")
             raise Exception("Failed to delete POI")
         
+        poi_loader.clear(poi_id)
+        reference_data_service.invalidate_table("poi")
         return {"message": "POI deleted successfully", "id": str(poi_id)}
 
     async def update_pois_order(self, updates: BatchOrderUpdate) -> Dict[str, str]:
         """Update orders of multiple POIs in a single operation"""
-        supabase = await supabase_service.client
-        
-        # Create a list of updates
-        update_operations = []
-        for item in updates.updates:
-            update_operations.append(
-                supabase.table("poi")
-                .update({"order": item.order})
-                .eq("id", item.id)
-                .execute()
-            )
-        
-        # Execute all updates in parallel
-        results = await asyncio.gather(*update_operations, return_exceptions=True)
-        
-        # Check for errors
-        errors = [r for r in results if isinstance(r, Exception)]
-        if errors:
-            logger.error(f"Errors updating POIs order: {errors}")
-            raise Exception("Failed to update some POIs")
-            
+        await order_service.apply_batch_order("poi", updates)
         return {"message": "Orders updated successfully"}
 
     # CSV TABLE UPLOAD
-    async def upload_csv_table(self, content: bytes, table_name: str, filename: str) -> Dict[str, Any]:
-        """Create table from CSV upload and populate it with CSV data"""
+    async def upload_csv_table(
+        self,
+        file: BinaryIO,
+        table_name: str,
+        filename: str,
+        mode: str = "create",
+        schema: Optional[str] = None,
+        poi: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Queue a background job that creates a table from an upload (CSV, gzip or zstd compressed
+        CSV, Parquet or Arrow IPC) and populates it. With
+        mode "replace" it loads a staging table and swaps it in for the existing table atomically,
+        with mode "delta" it only writes the rows that differ from the existing table.
+        schema is a DatasetSchema as JSON; without it the schema is inferred from the file.
+        poi is a POIRegistration as JSON, the POI created or updated for the table once it is loaded.
+        Returns the job, whose progress is polled through the ingest job endpoints.
+        """
         # Validate table name (alphanumeric and underscores only)
         if not re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', table_name):
             raise ValueError("Table name must start with a letter or underscore and contain only letters, numbers, and underscores")
         
-        # Check if file is CSV
-        if not (filename and filename.endswith('.csv')):
-            raise ValueError("File must be a CSV file")
-        
-        # Read and decode the CSV file
-        csv_content = content.decode('utf-8-sig')  # Handle BOM if present
-        csv_reader = csv.DictReader(io.StringIO(csv_content))
-        
-        # Expected column names
-        expected_columns = {'id', 'latitude', 'longitude', 'business_name'}
+        # CSV, compressed CSV, Parquet or Arrow IPC, by extension
+        file_format = upload_format(filename)
         
-        # Validate column headers
-        if not csv_reader.fieldnames:
-            raise ValueError("CSV file appears to be empty or invalid")
+        if mode not in UPLOAD_MODES:
+            raise ValueError(f"Mode must be one of: {', '.join(UPLOAD_MODES)}")
         
-        csv_columns = set(csv_reader.fieldnames)
-        if csv_columns != expected_columns:
-            missing_columns = expected_columns - csv_columns
-            extra_columns = csv_columns - expected_columns
-            
-            error_parts = []
-            if missing_columns:
-                error_parts.append(f"Missing columns: {', '.join(missing_columns)}")
-            if extra_columns:
-                error_parts.append(f"Extra columns: {', '.join(extra_columns)}")
-            
-            raise ValueError(f"Invalid CSV columns. Expected: {', '.join(sorted(expected_columns))}. {' | '.join(error_parts)}")
-        
-        # Read all rows into memory and validate data types
-        rows = []
-        for row_idx, row in enumerate(csv_reader, start=1):
-            # Skip empty rows (where all values are empty or just whitespace)
-            if not any(str(value).strip() for value in row.values()):
-                continue
-                
-            cleaned_row = row   
-            
-            # Validate id (must be a valid integer)
-            try:
-                if not cleaned_row['id']:
-                    raise ValueError("Empty ID value")
-                int(cleaned_row['id'])  # Try to convert to int to validate
-            except ValueError as e:
-                raise ValueError(f"Invalid ID in row {row_idx}: {cleaned_row['id']}. ID must be a valid integer.")
-            
-            # Validate latitude (must be a valid float between -90 and 90)
+        dataset_schema = None
+        if schema:
             try:
-                if not cleaned_row['latitude']:
-                    raise ValueError("Empty latitude value")
-                lat = float(cleaned_row['latitude'])
-                if lat < -90 or lat > 90:
-                    raise ValueError("Latitude must be between -90 and 90")
-            except ValueError as e:
-                raise ValueError(f"Invalid latitude in row {row_idx}: {cleaned_row['latitude']}. {str(e)}")
-            
-            # Validate longitude (must be a valid float between -180 and 180)
-            try:
-                if not cleaned_row['longitude']:
-                    raise ValueError("Empty longitude value")
-                lon = float(cleaned_row['longitude'])
-                if lon < -180 or lon > 180:
-                    raise ValueError("Longitude must be between -180 and 180")
-            except ValueError as e:
-                raise ValueError(f"Invalid longitude in row {row_idx}: {cleaned_row['longitude']}. {str(e)}")
-            
-            # Validate business_name (must not be empty)
-            if not cleaned_row['business_name']:
-                raise ValueError(f"Empty business name in row {row_idx}")
-            
-            rows.append(cleaned_row)
-            
-        if not rows:
-            raise ValueError("CSV file contains no data rows")
+                dataset_schema = DatasetSchema.model_validate_json(schema)
+            except ValidationError as e:
+                raise ValueError(f"Invalid schema: {e.errors()[0]['msg']}")
         
-        try:
-            # Get service_role client for admin operations
-            supabase = await supabase_service.get_service_role_client()
-            
-            # Create the table
-            logger.info(f"Creating table: {table_name}")
-            create_result = await supabase.rpc('create_csv_table', {
-                'p_table_name': table_name
-            }).execute()
-            
-            if not create_result.data:
-                logger.error(f"Failed to create table: {table_name}")
-                raise Exception("Failed to create table")
-            
-            # Add a small delay to ensure table is ready
-            await asyncio.sleep(2)
-            
-            # Verify table exists and is accessible
+        registration = None
+        if poi:
             try:
-                await supabase.from_(table_name).select("*", count="exact").limit(0).execute()
-                logger.info(f"Table created successfully: {table_name}")
-            except Exception as ve:
-                logger.error(f"Table verification failed: {table_name} - {str(ve)}")
-                try:
-                    await supabase.rpc('drop_table', {'p_table_name': table_name}).execute()
-                except Exception as e:
-                    logger.error(f"Failed to cleanup table after verification error: {table_name} - {str(e)}")
-                raise Exception("Table created but not accessible. Please try again.")
-                
-        except Exception as e:
-            error_message = str(e).lower()
-            if "already exists" in error_message or "duplicate" in error_message:
-                raise ValueError(f"Table '{table_name}' already exists")
-            else:
-                logger.error(f"Error creating table: {table_name} - {str(e)}")
-                raise Exception(f"Failed to create table: {str(e)}")
-        
-        # Prepare data for batch insert
-        insert_data = []
-        for row in rows:
-            try:
-                # Clean and normalize the business name
-                business_name = str(row['business_name'])
-                # Replace smart quotes with regular quotes if present
-                business_name = business_name.replace('"', '"').replace('"', '"')
-                business_name = business_name.replace("'", "'").replace("'", "'")
-                
-                insert_data.append({
-                    'id': int(row['id']),
-                    'latitude': float(row['latitude']),
-                    'longitude': float(row['longitude']),
-                    'business_name': business_name
-                })
-            except (ValueError, TypeError) as e:
-                logger.error(f"Data conversion error: Row ID {row.get('id', 'unknown')} - {str(e)}")
-                raise Exception(f"Data conversion error: {str(e)} for row with ID {row.get('id', 'unknown')}")
-
-        # Insert data in batches
-        batch_size = 1000
-        total_rows = len(insert_data)
-        inserted_rows = 0
-        total_batches = (total_rows + batch_size - 1) // batch_size
-        
-        logger.info(f"Starting data insertion: {total_rows} rows in {total_batches} batches")
-        
-        for i in range(0, total_rows, batch_size):
-            batch = insert_data[i:i + batch_size]
-            batch_number = (i // batch_size) + 1
-            
-            try:
-                # Convert the batch to a list of dicts with basic types
-                sanitized_batch = []
-                for row in batch:
-                    sanitized_row = {
-                        'id': row['id'],
-                        'latitude': row['latitude'],
-                        'longitude': row['longitude'],
-                        'business_name': row['business_name']
-                    }
-                    sanitized_batch.append(sanitized_row)
-                
-                # Try inserting with from_ method instead of table
-                insert_result = await supabase.from_(table_name).insert(sanitized_batch).execute()
-                
-                # Check if the response is valid
-                if not insert_result or not hasattr(insert_result, 'data'):
-                    error_msg = f"Invalid response from server for batch {batch_number}/{total_batches}"
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-                
-                if insert_result.data is None:
-                    error_msg = f"Batch {batch_number}/{total_batches} insert failed"
-                    if hasattr(insert_result, 'error'):
-                        error_msg += f": {insert_result.error}"
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-                
-                inserted_rows += len(batch)
-                logger.info(f"Inserted batch {batch_number}/{total_batches} ({len(batch)} rows)")
-                
-            except Exception as e:
-                logger.error(f"Error inserting batch {batch_number}/{total_batches}: {str(e)}")
-                raise Exception(f"Failed to insert data (batch {batch_number}/{total_batches}): {str(e)}")
-        
-        logger.info(f"Upload completed: {inserted_rows} rows inserted into table {table_name}")
-        return {
-            "message": f"Table '{table_name}' created successfully",
-            "table_name": table_name,
-            "rows_processed": inserted_rows
-        }
+                registration = POIRegistration.model_validate_json(poi)
+            except ValidationError as e:
+                raise ValueError(f"Invalid POI: {e.errors()[0]['msg']}")
+            # Check the site type now rather than after the whole upload
+            site_types = await reference_data_service.get_site_types()
+            if not any(site_type["id"] == str(registration.site_type_id) for site_type in site_types):
+                raise Exception("Site type not found")
+        
+        return await ingest_job_service.submit_csv_upload(
+            file, table_name, mode, file_format, dataset_schema, registration
+        )
 
     # USER MANAGEMENT
     async def delete_user(self, user_id: UUID) -> Dict[str, str]:
@@ -617,46 +420,60 @@ class AdminService:
         # If we reach here, the deletion was successful (no exception was thrown)
         return {"message": "User deleted successfully", "id": str(user_id)}
 
-    async def send_invitation_email(self, email: str) -> Dict[str, Any]:
-        """Send an invitation email to a user"""
-        logger.info(f"Attempting to send invitation email to: {email}")
+    def send_invitation_email(self, email: str) -> Dict[str, Any]:
+        """Queue an invitation email to a user, returns the outbox message to poll for delivery"""
+        logger.info(f"Queueing invitation email to: {email}")
         
         # Validate email format
-        if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email):
+        if not EMAIL_PATTERN.match(email):
             logger.warning(f"Invalid email format provided: {email}")
             raise ValueError("Invalid email format")
         
-        # Set up Resend API key
-        resend.api_key = settings.RESEND_API_KEY
-        
-        if not settings.RESEND_API_KEY:
-            logger.error("RESEND_API_KEY not configured")
-            raise Exception("Email service not configured")
-
-        # Prepare email parameters
-        try:
-            # Send email using the correct API
-            response = resend.Emails.send({
-                "from": "onboarding@resend.dev",
-                "to": email,
-                "subject": "Welcome to Buy Advocate",
-                "html": invitation_email_template(email)
-            })
-            
-            if response and response.get('id'):
-                logger.info(f"Invitation email successfully sent to: {email}, Email ID: {response.get('id', 'N/A')}")
-                return {
-                    "success": True,
-                    "message": "Invitation email sent successfully",
-                    "email": email,
-                    "email_id": response.get('id')
-                }
-            else:
-                logger.error(f"Failed to send invitation email to: {email} - No valid response from email service")
-                raise Exception("Failed to send email - invalid response")
-        except Exception as e:
-            logger.error(f"Failed to send invitation email to: {email} - {str(e)}")
-            raise Exception(f"Failed to send email: {str(e)}")
+        queued = email_outbox_service.enqueue(
+            INVITATION_SENDER, [email], INVITATION_SUBJECT, [invitation_email_template(email)]
+        )
+        message = queued["messages"][0]
+        return {
+            "success": True,
+            "message": "Invitation email queued",
+            "email": email,
+            "message_id": message["message_id"],
+            "status": message["status"]
+        }
+
+    def send_invitation_emails(self, emails: List[str]) -> Dict[str, Any]:
+        """
+        Queue invitation emails to many users at once. Invalid and repeated addresses are
+        reported and skipped rather than failing the whole request.
+        """
+        if len(emails) > settings.EMAIL_BULK_MAX_RECIPIENTS:
+            raise ValueError(f"At most {settings.EMAIL_BULK_MAX_RECIPIENTS} emails can be invited at once")
+        
+        recipients, invalid, seen = [], [], set()
+        for email in emails:
+            email = email.strip()
+            if not EMAIL_PATTERN.match(email):
+                invalid.append(email)
+            elif email.lower() not in seen:
+                seen.add(email.lower())
+                recipients.append(email)
+        if not recipients:
+            raise ValueError("No valid emails to invite")
+        
+        queued = email_outbox_service.enqueue(
+            INVITATION_SENDER, recipients, INVITATION_SUBJECT,
+            [invitation_email_template(email) for email in recipients]
+        )
+        logger.info(f"Queued {len(recipients)} invitation emails, skipped {len(invalid)} invalid addresses")
+        return {
+            "batch_id": queued["batch_id"],
+            "queued": len(recipients),
+            "invalid": invalid,
+            "messages": [
+                {"email": message["email"], "message_id": message["message_id"]}
+                for message in queued["messages"]
+            ]
+        }
 
 
 # Create a singleton instance
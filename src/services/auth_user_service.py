@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import asyncio
+import time
+
+from src.config import logger, settings
+from src.services.supabase_service import supabase_service
+
+
+class AuthUserService:
+    """
+    Bounded LRU cache of auth user metadata (email, image_url) keyed by user id, so profile
+    reads do not call the auth admin API. Entries are filled from the access token when a
+    request is authenticated, or from the admin API on a miss. Entries older than
+    AUTH_USER_REFRESH_AFTER seconds are served while being refreshed in the background,
+    entries older than AUTH_USER_CACHE_TTL seconds are reloaded.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AuthUserService, cls).__new__(cls)
+            cls._instance._entries = OrderedDict()
+            cls._instance._in_flight = {}
+            cls._instance._stats = {"hits": 0, "misses": 0, "refreshes": 0, "from_token": 0}
+        return cls._instance
+
+    @staticmethod
+    def _metadata(email: Optional[str], user_metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        # Check for image_url in user_metadata (common with OAuth providers)
+        user_metadata = user_metadata or {}
+        return {
+            "email": email,
+            "image_url": user_metadata.get("avatar_url") or user_metadata.get("picture"),
+        }
+
+    def _set(self, user_id: str, metadata: Dict[str, Any]):
+        self._entries[user_id] = (time.monotonic(), metadata)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > settings.AUTH_USER_CACHE_MAX_SIZE:
+            self._entries.popitem(last=False)
+
+    def remember_claims(self, claims: Dict[str, Any]):
+        """Fill the cache from the claims of a verified access token, if the user is not cached yet"""
+        user_id = claims.get("sub")
+        if user_id and "email" in claims and user_id not in self._entries:
+            self._set(user_id, self._metadata(claims.get("email"), claims.get("user_metadata")))
+            self._stats["from_token"] += 1
+
+    def remember_user(self, user: Any):
+        """Fill the cache from an auth user returned by Supabase Auth"""
+        self._set(str(user.id), self._metadata(user.email, user.user_metadata))
+
+    async def _fetch(self, user_id: str) -> Dict[str, Any]:
+        admin_client = await supabase_service.get_service_role_client()
+        auth_result = await admin_client.auth.admin.get_user_by_id(user_id)
+        user = auth_result.user
+        metadata = self._metadata(user.email, user.user_metadata) if user else self._metadata(None, None)
+        self._set(user_id, metadata)
+        return metadata
+
+    def _load(self, user_id: str) -> asyncio.Task:
+        """Fetch a user from the admin API, concurrent loads of the same user share one call"""
+        task = self._in_flight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(user_id))
+            self._in_flight[user_id] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(user_id, None))
+        return task
+
+    def _refresh_in_background(self, user_id: str):
+        self._stats["refreshes"] += 1
+        task = self._load(user_id)
+
+        def log_failure(done: asyncio.Task):
+            # Keep serving the cached entry, the next read past the refresh age tries again
+            if not done.cancelled() and done.exception() is not None:
+                logger.warning(f"Could not refresh auth user data for user {user_id}: {str(done.exception())}")
+
+        task.add_done_callback(log_failure)
+
+    async def get(self, user_id: Any) -> Dict[str, Any]:
+        """Get the email and image_url of an auth user"""
+        user_id = str(user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            fetched_at, metadata = entry
+            age = time.monotonic() - fetched_at
+            if age < settings.AUTH_USER_CACHE_TTL:
+                self._stats["hits"] += 1
+                self._entries.move_to_end(user_id)
+                if age >= settings.AUTH_USER_REFRESH_AFTER and user_id not in self._in_flight:
+                    self._refresh_in_background(user_id)
+                return metadata
+
+        self._stats["misses"] += 1
+        # Shield so a cancelled request does not cancel the load other requests wait on
+        return await asyncio.shield(self._load(user_id))
+
+    def invalidate(self, user_id: Any):
+        """Drop a user so the next read loads it again"""
+        self._entries.pop(str(user_id), None)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        return {
+            **self._stats,
+            "size": len(self._entries),
+            "max_size": settings.AUTH_USER_CACHE_MAX_SIZE,
+            "in_flight": len(self._in_flight),
+        }
+
+
+# Create a singleton instance
+auth_user_service = AuthUserService()
@@ -0,0 +1,77 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import time
+
+from src.config import logger, settings
+
+
+class CacheService:
+    """
+    In-process TTL cache grouped by namespace.
+    Entries are invalidated explicitly by the code that changes the underlying data and
+    expire after their TTL, which bounds staleness across instances.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(CacheService, cls).__new__(cls)
+            cls._instance._entries = {}
+            cls._instance._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        return cls._instance
+
+    def get(self, namespace: str, key: Hashable = None) -> Tuple[bool, Any]:
+        """Return (found, value) for a cached entry that has not expired"""
+        entry = self._entries.get(namespace, {}).get(key)
+        if entry is None:
+            return False, None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[namespace][key]
+            return False, None
+
+        return True, value
+
+    def set(self, namespace: str, value: Any, key: Hashable = None, ttl: Optional[float] = None):
+        """Store a value under namespace/key"""
+        ttl = settings.REFERENCE_CACHE_TTL if ttl is None else ttl
+        self._entries.setdefault(namespace, {})[key] = (time.monotonic() + ttl, value)
+
+    async def get_or_load(
+        self,
+        namespace: str,
+        loader: Callable[[], Awaitable[Any]],
+        key: Hashable = None,
+        ttl: Optional[float] = None
+    ) -> Any:
+        """Return the cached value for namespace/key, calling loader and caching its result on a miss"""
+        found, value = self.get(namespace, key)
+        if found:
+            self._stats["hits"] += 1
+            return value
+
+        self._stats["misses"] += 1
+        value = await loader()
+        self.set(namespace, value, key=key, ttl=ttl)
+        return value
+
+    def invalidate(self, *namespaces: str, key: Hashable = None):
+        """Drop a single key, or every entry when no key is given, from each namespace"""
+        for namespace in namespaces:
+            if key is None:
+                self._entries.pop(namespace, None)
+            else:
+                self._entries.get(namespace, {}).pop(key, None)
+            self._stats["invalidations"] += 1
+        logger.info(f"Invalidated cache: {', '.join(namespaces)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and entry counts per namespace"""
+        return {
+            **self._stats,
+            "entries": {namespace: len(entries) for namespace, entries in self._entries.items()},
+        }
+
+
+# Create a singleton instance
+cache_service = CacheService()
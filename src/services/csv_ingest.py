@@ -0,0 +1,792 @@
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple, Union
+from hashlib import blake2b
+import asyncio
+import json
+import random
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from postgrest.types import ReturnMethod
+from pydantic import ValidationError
+
+from src.config import logger, settings
+from src.schemas.dataset import POI_SCHEMA, DatasetColumn, DatasetSchema
+
+
+# Column holding a hash of the other columns, compared by delta uploads to find changed rows
+ROW_HASH_COLUMN = "row_hash"
+# Text accepted for integer, float, date and timestamp columns, after trimming whitespace
+INTEGER_PATTERN = r"^[+-]?\d{1,18}$"
+FLOAT_PATTERN = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+TIMESTAMP_PATTERN = r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}(:?\d{2})?)?$"
+# Text accepted for boolean columns, case insensitive
+TRUE_VALUES = ("true", "t", "yes", "y", "1")
+FALSE_VALUES = ("false", "f", "no", "n", "0")
+# Largest integer accepted, the same bound as the 18 digits of INTEGER_PATTERN
+MAX_INTEGER = 10 ** 18 - 1
+# Column names given the key and geo roles when the schema of an upload is inferred
+KEY_NAMES = ("id",)
+LATITUDE_NAMES = ("latitude", "lat")
+LONGITUDE_NAMES = ("longitude", "lng", "lon")
+
+# Upload formats by file extension, with the compression of CSV uploads
+CSV = "csv"
+PARQUET = "parquet"
+ARROW = "arrow"
+UPLOAD_FORMATS = {
+    ".csv": (CSV, None),
+    ".csv.gz": (CSV, "gzip"),
+    ".csv.zst": (CSV, "zstd"),
+    ".parquet": (PARQUET, None),
+    ".arrow": (ARROW, None),
+    ".feather": (ARROW, None),
+}
+
+
+def upload_format(filename: Optional[str]) -> str:
+    """The UPLOAD_FORMATS extension of an uploaded file"""
+    for extension in sorted(UPLOAD_FORMATS, key=len, reverse=True):
+        if filename and filename.lower().endswith(extension):
+            return extension
+    raise ValueError(f"File must be one of: {', '.join(UPLOAD_FORMATS)}")
+
+
+def _is_text(data_type: pa.DataType) -> bool:
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+
+def _numeric(data_type: pa.DataType) -> bool:
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type)
+
+
+def _accepts(column_type: str, data_type: pa.DataType) -> bool:
+    """Whether values of an Arrow type can be loaded into a column of a schema type"""
+    if _is_text(data_type):
+        return True
+    if column_type in ("integer", "float"):
+        return _numeric(data_type)
+    if column_type == "boolean":
+        return pa.types.is_boolean(data_type)
+    if column_type in ("date", "timestamp"):
+        return pa.types.is_date(data_type) or pa.types.is_timestamp(data_type)
+    return _numeric(data_type) or pa.types.is_boolean(data_type) or pa.types.is_temporal(data_type)
+
+
+def _parse_text(text: pa.Array, column_type: str) -> Tuple[pa.Array, pa.Array]:
+    """Parse trimmed text for a column type, returns the values and a mask of well-formed ones"""
+    if column_type == "integer":
+        ok = pc.match_substring_regex(text, INTEGER_PATTERN)
+        return pc.cast(pc.if_else(ok, pc.replace_substring_regex(text, r"^\+", ""), None), pa.int64()), ok
+    if column_type == "float":
+        ok = pc.match_substring_regex(text, FLOAT_PATTERN)
+        return pc.cast(pc.if_else(ok, text, None), pa.float64()), ok
+    if column_type == "boolean":
+        lowered = pc.utf8_lower(text)
+        ok = pc.is_in(lowered, value_set=pa.array(TRUE_VALUES + FALSE_VALUES))
+        return pc.if_else(ok, pc.is_in(lowered, value_set=pa.array(TRUE_VALUES)), None), ok
+    if column_type == "date":
+        dates = pc.cast(pc.strptime(text, format="%Y-%m-%d", unit="s", error_is_null=True), pa.date32())
+        # strptime rolls invalid days over (2024-02-30 becomes March 1st), keep exact round trips only
+        dates = pc.cast(dates, pa.string())
+        ok = pc.fill_null(pc.equal(dates, text), False)
+        return pc.if_else(ok, dates, None), ok
+    if column_type == "timestamp":
+        # Loaded as text, Postgres parses the offsets and fractions
+        ok = pc.match_substring_regex(text, TIMESTAMP_PATTERN)
+        return pc.if_else(ok, text, None), ok
+    ok = pc.not_equal(text, "")
+    return pc.if_else(ok, text, None), ok
+
+
+def _parse_column(values: pa.Array, column_type: str) -> Tuple[pa.Array, pa.Array, pa.Array, pa.Array]:
+    """
+    Parse a column for a schema type. Returns the values to load, a mask of empty values, a
+    mask of well-formed values, and the values as text for the error report. Text (CSV) is
+    trimmed and parsed; typed values (Parquet, Arrow) are used as they are. Dates and
+    timestamps are loaded as ISO text.
+    """
+    if _is_text(values.type):
+        text = pc.fill_null(pc.utf8_trim_whitespace(values), "")
+        parsed, ok = _parse_text(text, column_type)
+        return parsed, pc.equal(text, ""), ok, text
+
+    text = pc.cast(values, pa.string())
+    ok = pc.is_valid(values)
+    if column_type in ("integer", "float"):
+        if pa.types.is_floating(values.type):
+            ok = pc.and_(ok, pc.is_finite(values))
+            if column_type == "integer":
+                ok = pc.and_(ok, pc.equal(values, pc.floor(values)))
+                ok = pc.and_(ok, pc.less_equal(pc.abs(values), float(MAX_INTEGER)))
+        elif column_type == "integer" and values.type.bit_width == 64:
+            # Narrower integers cannot exceed MAX_INTEGER
+            ok = pc.and_(ok, pc.less_equal(pc.abs(values), MAX_INTEGER))
+        target = pa.int64() if column_type == "integer" else pa.float64()
+        parsed = pc.cast(pc.if_else(ok, values, None), target, safe=False)
+    elif column_type == "boolean":
+        parsed = values
+    elif column_type == "date":
+        parsed = pc.cast(pc.cast(values, pa.date32()), pa.string())
+    else:
+        parsed = text
+    return parsed, pc.is_null(values), pc.fill_null(ok, False), text
+
+
+def _infer_type(values: pa.Array) -> str:
+    """Schema type of a column, from its Arrow type or from the text in it"""
+    data_type = values.type
+    if pa.types.is_integer(data_type):
+        return "integer"
+    if pa.types.is_floating(data_type):
+        return "float"
+    if pa.types.is_boolean(data_type):
+        return "boolean"
+    if pa.types.is_date(data_type):
+        return "date"
+    if pa.types.is_timestamp(data_type):
+        return "timestamp"
+    if not _is_text(data_type):
+        return "text"
+
+    text = pc.utf8_trim_whitespace(values.drop_null())
+    text = pc.filter(text, pc.not_equal(text, ""))
+    if not len(text):
+        return "text"
+    for column_type, pattern in (("integer", INTEGER_PATTERN), ("float", FLOAT_PATTERN), ("date", DATE_PATTERN), ("timestamp", TIMESTAMP_PATTERN)):
+        if pc.all(pc.match_substring_regex(text, pattern)).as_py():
+            return column_type
+    if pc.all(pc.is_in(pc.utf8_lower(text), value_set=pa.array(TRUE_VALUES + FALSE_VALUES))).as_py():
+        return "boolean"
+    return "text"
+
+
+def infer_schema(sample: pa.RecordBatch) -> DatasetSchema:
+    """
+    Infer the schema of an upload from its first block. Files with the POI columns get
+    POI_SCHEMA. Otherwise a column named id is the key and latitude/longitude columns
+    (or lat/lng) are geo; other columns are nullable and get no index.
+    """
+    if set(sample.schema.names) == set(POI_SCHEMA.names):
+        return POI_SCHEMA
+
+    columns = []
+    latitude = longitude = None
+    for name, values in zip(sample.schema.names, sample.columns):
+        column_type = _infer_type(values)
+        lowered = name.lower()
+        role = None
+        if lowered in KEY_NAMES and column_type in ("integer", "text"):
+            role = "key"
+        elif lowered in LATITUDE_NAMES + LONGITUDE_NAMES and column_type in ("integer", "float"):
+            role, column_type = "geo", "float"
+        column = {"name": name, "type": column_type, "role": role}
+        if role == "geo" and lowered in LATITUDE_NAMES:
+            latitude = column
+        elif role == "geo":
+            longitude = column
+        columns.append(column)
+
+    if not any(column["role"] == "key" for column in columns):
+        raise ValueError("Could not find a key column in the file, name it id or declare a schema")
+    if latitude is None or longitude is None:
+        for column in (latitude, longitude):
+            if column is not None:
+                column["role"] = None
+    elif columns.index(latitude) > columns.index(longitude):
+        # Geo columns are latitude then longitude
+        columns.remove(latitude)
+        columns.insert(columns.index(longitude), latitude)
+
+    try:
+        return DatasetSchema(columns=[DatasetColumn(**column) for column in columns])
+    except ValidationError as e:
+        raise ValueError(f"Could not infer a schema from the file, declare one: {e.errors()[0]['msg']}")
+
+
+def hash_rows(rows: Union[pa.RecordBatch, pa.Table], key: str) -> pa.Array:
+    """blake2b hash of the non-key columns of each row"""
+    text = pc.binary_join_element_wise(
+        *(pc.cast(rows.column(name), pa.string()) for name in rows.schema.names if name != key),
+        "\x1f",
+        null_handling="replace"
+    )
+    return pa.array(
+        [blake2b(value.encode(), digest_size=16).hexdigest() for value in text.to_pylist()],
+        pa.string()
+    )
+
+
+def diff_rows(ids: pa.Array, hashes: pa.Array, existing_ids: pa.Array, existing_hashes: pa.Array) -> Tuple[pa.Array, Dict[str, int], List[int]]:
+    """
+    Compare incoming rows with the rows of a table by id and row hash. Returns a mask of the
+    incoming rows to upsert, the count of each change type, and the ids to delete. Existing
+    rows without a hash count as updated.
+    """
+    positions = pc.index_in(ids, value_set=existing_ids)
+    found = pc.is_valid(positions)
+    changed = pc.fill_null(pc.not_equal(hashes, pc.take(existing_hashes, positions)), True)
+    updated = pc.and_(changed, found)
+    deleted = pc.filter(existing_ids, pc.invert(pc.is_in(existing_ids, value_set=ids)))
+
+    def count(mask: pa.Array) -> int:
+        return pc.sum(mask).as_py() or 0
+
+    changes = {
+        "inserted": len(ids) - count(found),
+        "updated": count(updated),
+        "unchanged": count(pc.invert(changed)),
+        "deleted": len(deleted),
+    }
+    return changed, changes, deleted.to_pylist()
+
+
+class _UploadFile:
+    """Wraps the upload for pyarrow streams, which close the file they wrap when they are freed"""
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def close(self):
+        # The upload is closed by its owner
+        pass
+
+
+class CsvValidationError(ValueError):
+    """Raised when rows of an upload are invalid, with up to CSV_VALIDATION_MAX_ERRORS of the problems"""
+
+    def __init__(self, error_count: int, errors: List[Dict[str, Any]]):
+        self.error_count = error_count
+        self.errors = errors
+        first = errors[0]
+        location = f"row {first['row']}" if first["row"] is not None else f"line {first['line']}"
+        super().__init__(f"File has {error_count} invalid values. First in {location}: {first['error']}")
+
+
+class CsvBatchReader:
+    """
+    Reads an upload with pyarrow and checks whole columns at a time against a DatasetSchema,
+    declared or inferred from the first block: CSV (optionally gzip or zstd compressed) in
+    blocks of CSV_INGEST_BLOCK_BYTES, Parquet and Arrow IPC in blocks of INGEST_BLOCK_ROWS,
+    whose typed columns are used without going through text. validate() checks every row in
+    one pass, including duplicate keys, and reports up to CSV_VALIDATION_MAX_ERRORS problems;
+    batches() then yields the converted rows in batches, each with its ROW_HASH_COLUMN.
+    Memory stays bounded by the block and batch sizes, plus the keys for the duplicate check
+    (and the row hashes, with keep_hashes). Parsing runs in a worker thread.
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        batch_size: int,
+        schema: Optional[DatasetSchema] = None,
+        keep_hashes: bool = False,
+        file_format: str = ".csv"
+    ):
+        self.batch_size = batch_size
+        self.schema = schema
+        self.file_format = file_format
+        self.keep_hashes = keep_hashes
+        # Ids and hashes of the valid rows in file order, kept by validate() with keep_hashes
+        self.row_ids: Optional[pa.ChunkedArray] = None
+        self.row_hashes: Optional[pa.ChunkedArray] = None
+        # Which valid rows batches() yields, in file order; all of them when None
+        self.row_filter: Optional[pa.Array] = None
+        self._file = file
+        self._file_schema: Optional[pa.Schema] = None
+        self._blocks: Optional[Iterator[pa.RecordBatch]] = None
+        # Rows in the file when known up front (Parquet, Arrow IPC file), and rows read so far,
+        # to estimate the progress where the file is not read front to back
+        self._total_rows: Optional[int] = None
+        self._rows_read = 0
+        self.total_bytes = 0
+        self._pending: List[pa.RecordBatch] = []
+        self._pending_rows = 0
+        self._parse_errors: List[Dict[str, Any]] = []
+        # Non-empty data rows read from the file, rows that passed validation,
+        # and the position in the file, for progress reporting
+        self.rows_parsed = 0
+        self.rows_validated = 0
+        self.bytes_read = 0
+        # Position at which this read started, after any rows skipped to resume
+        self.start_bytes = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def _skip_invalid_row(self, row) -> str:
+        # Rows with the wrong number of fields are reported instead of failing the whole block
+        # row.number counts lines of the file, not data rows
+        self._parse_errors.append({
+            "row": None,
+            "line": row.number,
+            "column": None,
+            "value": row.text[:200],
+            "error": f"Expected {row.expected_columns} fields, got {row.actual_columns}",
+        })
+        return "skip"
+
+    def _csv_reader(self, compression: Optional[str], names: Optional[List[str]]) -> pa_csv.CSVStreamingReader:
+        self._file.seek(0)
+        source = self._file
+        if compression:
+            source = pa.CompressedInputStream(pa.PythonFile(_UploadFile(self._file), mode="r"), compression)
+        return pa_csv.open_csv(
+            source,
+            read_options=pa_csv.ReadOptions(block_size=settings.CSV_INGEST_BLOCK_BYTES),
+            parse_options=pa_csv.ParseOptions(
+                invalid_row_handler=self._skip_invalid_row if names is not None else lambda row: "skip"
+            ),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: pa.string() for name in names or []},
+                strings_can_be_null=False
+            )
+        )
+
+    def _open_csv(self, compression: Optional[str]):
+        # Every column is read as text and parsed by _parse_column, open once to get the names
+        names = self._csv_reader(compression, None).schema.names
+        reader = self._csv_reader(compression, names)
+        self._file_schema = reader.schema
+        self._blocks = iter(reader)
+
+    def _open_parquet(self):
+        parquet = pq.ParquetFile(self._file)
+        self._file_schema = parquet.schema_arrow
+        self._total_rows = parquet.metadata.num_rows
+        # Only the schema columns are read, validate_header() rejects files with others
+        columns = [name for name in self.schema.names if name in self._file_schema.names] if self.schema else None
+        self._blocks = parquet.iter_batches(batch_size=settings.INGEST_BLOCK_ROWS, columns=columns)
+
+    def _open_arrow(self):
+        try:
+            ipc_file = pa.ipc.open_file(self._file)
+            self._total_rows = ipc_file.count_rows()
+            self._blocks = (ipc_file.get_batch(index) for index in range(ipc_file.num_record_batches))
+            self._file_schema = ipc_file.schema
+        except pa.ArrowInvalid:
+            # Not the random access format, read it as an IPC stream
+            self._file.seek(0)
+            ipc_stream = pa.ipc.open_stream(self._file)
+            self._blocks = iter(ipc_stream)
+            self._file_schema = ipc_stream.schema
+
+    def _open(self):
+        self.total_bytes = self._file.seek(0, 2)
+        self._file.seek(0)
+        kind, compression = UPLOAD_FORMATS[self.file_format]
+        # Before opening: the CSV reader parses its first block, and reports its bad lines, right away
+        self._parse_errors = []
+        try:
+            if kind == PARQUET:
+                self._open_parquet()
+            elif kind == ARROW:
+                self._open_arrow()
+            else:
+                self._open_csv(compression)
+        except (pa.ArrowInvalid, OSError, UnicodeDecodeError) as e:
+            raise ValueError(f"File appears to be empty or invalid: {str(e)}")
+        self._pending = []
+        self._pending_rows = 0
+        self._rows_read = 0
+        self.rows_parsed = 0
+
+    def _infer_schema(self):
+        sample = self._next_block()
+        if sample is None:
+            raise ValueError("File contains no data rows")
+        self.schema = infer_schema(sample)
+        self._open()
+
+    def validate_header(self):
+        """Check that the file has exactly the schema columns, with types that can be loaded into them"""
+        expected_columns = set(self.schema.names)
+        file_columns = set(self._file_schema.names)
+        if file_columns != expected_columns:
+            missing_columns = expected_columns - file_columns
+            extra_columns = file_columns - expected_columns
+
+            error_parts = []
+            if missing_columns:
+                error_parts.append(f"Missing columns: {', '.join(missing_columns)}")
+            if extra_columns:
+                error_parts.append(f"Extra columns: {', '.join(extra_columns)}")
+
+            raise ValueError(f"Invalid columns. Expected: {', '.join(sorted(expected_columns))}. {' | '.join(error_parts)}")
+
+        for column in self.schema.columns:
+            data_type = self._file_schema.field(column.name).type
+            if pa.types.is_dictionary(data_type):
+                data_type = data_type.value_type
+            if not _accepts(column.type, data_type):
+                raise ValueError(f"Column {column.name} of type {data_type} cannot be loaded as {column.type}")
+
+    def _add_errors(self, mask: pa.Array, values: pa.Array, column: str, message: str, first_row: int):
+        """Record the rows selected by mask, keeping at most CSV_VALIDATION_MAX_ERRORS entries"""
+        count = pc.sum(mask).as_py() or 0
+        if not count:
+            return
+        self.error_count += count
+        room = settings.CSV_VALIDATION_MAX_ERRORS - len(self.errors)
+        if room > 0:
+            indices = pc.indices_nonzero(mask).slice(0, room)
+            for index, value in zip(indices.to_pylist(), pc.take(values, indices).to_pylist()):
+                self.errors.append({"row": first_row + index + 1, "column": column, "value": value, "error": message})
+
+    def _add_duplicate_errors(self, id_chunks: List[pa.Array], row_chunks: List[pa.Array]):
+        """Sort the valid keys with their row numbers and report every repeat of an earlier key"""
+        key = self.schema.key.name
+        ids = pa.table({
+            "id": pa.chunked_array(id_chunks, self._key_type()),
+            "row": pa.chunked_array(row_chunks, pa.int64())
+        }).sort_by([("id", "ascending"), ("row", "ascending")]).combine_chunks()
+        if ids.num_rows < 2:
+            return
+
+        sorted_ids, rows = ids.column("id"), ids.column("row")
+        duplicate = pc.equal(sorted_ids.slice(1), sorted_ids.slice(0, ids.num_rows - 1))
+        count = pc.sum(duplicate).as_py() or 0
+        self.error_count += count
+        room = settings.CSV_VALIDATION_MAX_ERRORS - len(self.errors)
+        if count and room > 0:
+            indices = pc.indices_nonzero(duplicate).slice(0, room)
+            repeats = pc.take(rows.slice(1), indices).to_pylist()
+            earlier = pc.take(rows.slice(0, ids.num_rows - 1), indices).to_pylist()
+            values = pc.take(sorted_ids.slice(1), indices).to_pylist()
+            for row, earlier_row, value in zip(repeats, earlier, values):
+                self.errors.append({"row": row, "column": key, "value": value, "error": f"Duplicate {key}, also in row {earlier_row}"})
+
+    def _check_block(self, block: pa.RecordBatch, first_row: int, collect: bool) -> Tuple[pa.RecordBatch, pa.Array]:
+        """
+        Validate and convert a block of rows column by column. Returns the converted valid rows
+        and their row numbers; with collect the problems are added to the error report.
+        """
+        parsed = {column.name: _parse_column(block.column(column.name), column.type) for column in self.schema.columns}
+
+        # Skip empty rows (where all values are empty or just whitespace)
+        empty = None
+        for _, is_empty, _, _ in parsed.values():
+            empty = is_empty if empty is None else pc.and_(empty, is_empty)
+        present = pc.invert(empty)
+
+        # The geo columns are latitude then longitude
+        limits = dict(zip((column.name for column in self.schema.geo), (90, 180)))
+        keep = present
+        for column in self.schema.columns:
+            values, is_empty, ok, text = parsed[column.name]
+            column_ok = ok
+            limit = limits.get(column.name)
+            if limit is not None:
+                in_range = pc.and_(pc.greater_equal(values, -limit), pc.less_equal(values, limit))
+                column_ok = pc.fill_null(pc.and_(ok, in_range), False)
+            if column.nullable:
+                column_ok = pc.or_(column_ok, is_empty)
+            keep = pc.and_(keep, column_ok)
+
+            if collect:
+                if not column.nullable:
+                    self._add_errors(pc.and_(present, is_empty), text, column.name, f"Empty {column.name} value", first_row)
+                self._add_errors(
+                    pc.and_(present, pc.and_(pc.invert(is_empty), pc.invert(ok))), text, column.name,
+                    f"Invalid {column.name}", first_row
+                )
+                if limit is not None:
+                    self._add_errors(
+                        pc.and_(present, pc.and_(ok, pc.invert(in_range))), text, column.name,
+                        f"{column.name.capitalize()} must be between -{limit} and {limit}", first_row
+                    )
+
+        rows = pa.RecordBatch.from_arrays(
+            [parsed[name][0] for name in self.schema.names],
+            names=self.schema.names
+        ).filter(keep)
+        row_numbers = pc.add(pc.indices_nonzero(keep), first_row + 1)
+        return rows, row_numbers
+
+    def _next_block(self) -> Optional[pa.RecordBatch]:
+        try:
+            block = next(self._blocks)
+        except StopIteration:
+            return None
+        except (pa.ArrowInvalid, OSError, UnicodeDecodeError) as e:
+            raise ValueError(f"Could not parse the file: {str(e)}")
+        self._rows_read += block.num_rows
+        if self._total_rows:
+            self.bytes_read = self.total_bytes * self._rows_read // self._total_rows
+        else:
+            # Compressed CSV advances through the upload as it is decompressed
+            self.bytes_read = self._file.tell()
+        names = self.schema.names if self.schema else block.schema.names
+        columns = [
+            column.dictionary_decode() if pa.types.is_dictionary(column.type) else column
+            for column in block.select(names).columns
+        ]
+        return pa.RecordBatch.from_arrays(columns, names=names)
+
+    def _validate(self):
+        id_chunks = []
+        row_chunks = []
+        hash_chunks = []
+        first_row = 0
+        while (block := self._next_block()) is not None:
+            rows, row_numbers = self._check_block(block, first_row, collect=True)
+            first_row += block.num_rows
+            self.rows_parsed = first_row
+            self.rows_validated += rows.num_rows
+            id_chunks.append(rows.column(self.schema.key.name))
+            row_chunks.append(row_numbers)
+            if self.keep_hashes:
+                hash_chunks.append(hash_rows(rows, self.schema.key.name))
+
+        if self.keep_hashes:
+            self.row_ids = pa.chunked_array(id_chunks, self._key_type())
+            self.row_hashes = pa.chunked_array(hash_chunks, pa.string())
+
+        for error in self._parse_errors:
+            self.error_count += 1
+            if len(self.errors) < settings.CSV_VALIDATION_MAX_ERRORS:
+                self.errors.append(error)
+
+        if id_chunks:
+            self._add_duplicate_errors(id_chunks, row_chunks)
+
+        if self.error_count:
+            raise CsvValidationError(self.error_count, sorted(self.errors, key=lambda error: error["row"] or 0))
+
+    def _key_type(self) -> pa.DataType:
+        return pa.int64() if self.schema.key.type == "integer" else pa.string()
+
+    async def open(self):
+        """Read and validate the header, inferring the schema from the first block when none is given"""
+        await asyncio.to_thread(self._open)
+        if self.schema is None:
+            await asyncio.to_thread(self._infer_schema)
+        self.validate_header()
+
+    async def validate(self):
+        """Check every row of the file, raising CsvValidationError with the problems found"""
+        await asyncio.to_thread(self._validate)
+
+    async def rewind(self):
+        """Go back to the first row, after validate()"""
+        await asyncio.to_thread(self._open)
+        self.bytes_read = 0
+
+    def _take_rows(self, count: int) -> Optional[pa.Table]:
+        """The next count valid rows, or None at the end of the file"""
+        while self._pending_rows < count:
+            block = self._next_block()
+            if block is None:
+                break
+            rows, _ = self._check_block(block, 0, collect=False)
+            if rows.num_rows:
+                self._pending.append(rows)
+                self._pending_rows += rows.num_rows
+        if not self._pending_rows:
+            return None
+
+        pending = pa.Table.from_batches(self._pending)
+        taken = pending.slice(0, count)
+        rest = pending.slice(count)
+        self._pending = rest.to_batches()
+        self._pending_rows = rest.num_rows
+        self.rows_parsed += taken.num_rows
+        return taken
+
+    def _read_batch(self) -> List[Dict[str, Any]]:
+        selected = []
+        selected_rows = 0
+        while selected_rows < self.batch_size:
+            rows = self._take_rows(self.batch_size - selected_rows)
+            if rows is None:
+                break
+            if self.row_filter is not None:
+                rows = rows.filter(self.row_filter.slice(self.rows_parsed - rows.num_rows, rows.num_rows))
+            selected.append(rows)
+            selected_rows += rows.num_rows
+        if not selected_rows:
+            return []
+
+        batch = pa.concat_tables(selected)
+        return batch.append_column(ROW_HASH_COLUMN, hash_rows(batch, self.schema.key.name)).to_pylist()
+
+    def _skip(self, rows: int):
+        while self.rows_parsed < rows:
+            if self._take_rows(min(rows - self.rows_parsed, settings.CSV_INGEST_MAX_BATCH_SIZE)) is None:
+                break
+
+    async def skip(self, rows: int):
+        """Skip the first rows valid rows, used to resume an upload"""
+        if rows > 0:
+            await asyncio.to_thread(self._skip, rows)
+
+    async def batches(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield converted rows, batch_size at a time. Rows failing validation are left out, so
+        validate() should pass first. While a batch is being handled rows_parsed is the number
+        of valid rows up to and including it.
+        """
+        while True:
+            batch = await asyncio.to_thread(self._read_batch)
+            if not batch:
+                return
+            yield batch
+
+    def close(self):
+        # Leave the underlying upload open, it is closed by its owner
+        self._blocks = None
+        self._pending = []
+
+
+class BatchInserter:
+    """
+    Upserts batches of rows into a table on its key column, keeping up to
+    CSV_INGEST_MAX_IN_FLIGHT batches in flight so the upload is not bound by round-trip
+    latency. Failed batches are retried, which is safe because an upsert on the key is idempotent.
+    The batch size grows while batches finish well under CSV_INGEST_TARGET_BATCH_SECONDS,
+    shrinks when they take much longer, and never exceeds CSV_INGEST_MAX_PAYLOAD_BYTES.
+    """
+
+    def __init__(self, supabase, table_name: str, batch_size: int, committed_row: int = 0, key: str = "id"):
+        self.supabase = supabase
+        self.table_name = table_name
+        self.key = key
+        self.batch_size = batch_size
+        self.rows_inserted = 0
+        self.rows_failed = 0
+        # Last data row of the file up to which every batch is committed, and the rows in them
+        self.committed_row = committed_row
+        self.committed_rows = 0
+        self._batch_ends: Dict[int, Tuple[int, int]] = {}
+        self._completed: Set[int] = set()
+        self._next_commit = 1
+        self.timings: List[Dict[str, Any]] = []
+        self._slots = asyncio.Semaphore(settings.CSV_INGEST_MAX_IN_FLIGHT)
+        self._tasks: Set[asyncio.Task] = set()
+        self._error: Optional[BaseException] = None
+        self._batch_number = 0
+        self._row_bytes: Optional[float] = None
+
+    def _estimate_row_bytes(self, batch: List[Dict[str, Any]]):
+        if self._row_bytes is None:
+            sample = batch[:50]
+            self._row_bytes = len(json.dumps(sample)) / len(sample)
+
+    def _adapt(self, rows: int, seconds: float):
+        """Adjust the size of the next batches to the latency of a finished one"""
+        target = settings.CSV_INGEST_TARGET_BATCH_SECONDS
+        size = self.batch_size
+        if seconds > target * 1.5:
+            size = size // 2
+        elif seconds < target / 2 and rows >= self.batch_size:
+            # Only grow on full batches, a short last batch says nothing about larger ones
+            size = int(size * 1.5)
+
+        max_size = settings.CSV_INGEST_MAX_BATCH_SIZE
+        if self._row_bytes:
+            max_size = min(max_size, int(settings.CSV_INGEST_MAX_PAYLOAD_BYTES / self._row_bytes))
+        self.batch_size = max(settings.CSV_INGEST_MIN_BATCH_SIZE, min(size, max_size))
+
+    async def _send(self, batch_number: int, batch: List[Dict[str, Any]]):
+        try:
+            attempt = 1
+            while True:
+                started = time.perf_counter()
+                try:
+                    await self.supabase.from_(self.table_name).upsert(
+                        batch, on_conflict=self.key, returning=ReturnMethod.minimal
+                    ).execute()
+                    break
+                except Exception as e:
+                    if attempt >= settings.CSV_INGEST_RETRY_ATTEMPTS:
+                        self.rows_failed += len(batch)
+                        logger.error(f"Error inserting batch {batch_number}: {str(e)}")
+                        raise Exception(f"Failed to insert data (batch {batch_number}): {str(e)}")
+                    logger.warning(f"Retrying batch {batch_number} after attempt {attempt} failed: {str(e)}")
+                    await asyncio.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+                    attempt += 1
+
+            seconds = time.perf_counter() - started
+            self.rows_inserted += len(batch)
+            self._commit(batch_number)
+            self.timings.append({
+                "batch": batch_number,
+                "rows": len(batch),
+                "ms": round(seconds * 1000, 1),
+                "attempts": attempt,
+            })
+            self._adapt(len(batch), seconds)
+            logger.info(
+                f"Inserted batch {batch_number} ({len(batch)} rows in {seconds * 1000:.0f}ms, "
+                f"{self.rows_inserted} total, next batch size {self.batch_size})"
+            )
+        finally:
+            self._slots.release()
+
+    def _commit(self, batch_number: int):
+        """Advance the committed position over every batch finished in order so far"""
+        self._completed.add(batch_number)
+        while self._next_commit in self._completed:
+            self._completed.discard(self._next_commit)
+            self.committed_row, rows = self._batch_ends.pop(self._next_commit)
+            self.committed_rows += rows
+            self._next_commit += 1
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None and self._error is None:
+            self._error = task.exception()
+
+    async def submit(self, batch: List[Dict[str, Any]], end_row: int = 0):
+        """
+        Start inserting a batch, waiting while CSV_INGEST_MAX_IN_FLIGHT batches are in flight.
+        end_row is the last data row of the file in the batch, used to track the committed position.
+        """
+        await self._slots.acquire()
+        if self._error is not None:
+            self._slots.release()
+            raise self._error
+
+        self._estimate_row_bytes(batch)
+        self._batch_number += 1
+        self._batch_ends[self._batch_number] = (end_row, len(batch))
+        task = asyncio.create_task(self._send(self._batch_number, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    async def finish(self) -> int:
+        """Wait for the batches in flight, returns the number of rows inserted"""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._error is not None:
+            raise self._error
+        return self.rows_inserted
+
+    async def abort(self):
+        """Cancel the batches in flight"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def timing_summary(self) -> Dict[str, Any]:
+        """Batch count and latency percentiles, plus the timing of every batch"""
+        durations = sorted(timing["ms"] for timing in self.timings)
+        if not durations:
+            return {"batches": 0}
+        return {
+            "batches": len(durations),
+            "avg_ms": round(sum(durations) / len(durations), 1),
+            "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            "max_ms": durations[-1],
+            "retried_batches": sum(1 for timing in self.timings if timing["attempts"] > 1),
+            "final_batch_size": self.batch_size,
+            "per_batch": sorted(self.timings, key=lambda timing: timing["batch"]),
+        }
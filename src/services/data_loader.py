@@ -0,0 +1,108 @@
+from typing import Any, Dict, Iterable, List, Optional, Set
+import asyncio
+
+from src.config import logger
+from src.middleware.request_context import request_state
+from src.services.supabase_service import supabase_service
+
+
+# Upper bound of keys per in_ query, keeps the request URL short
+MAX_BATCH_SIZE = 200
+
+
+class DataLoader:
+    """
+    Loads rows of one table by key. Lookups made in the same event-loop tick are sent as a
+    single in_ query, and every row is memoized for the lifetime of the loader (one request,
+    see get_loader). Code that writes a row should prime() or clear() it afterwards.
+    """
+
+    def __init__(self, table: str, key_column: str = "id", columns: str = "*", service_role: bool = False):
+        self.table = table
+        self.key_column = key_column
+        self.columns = columns if columns == "*" or key_column in columns.split(",") else f"{columns},{key_column}"
+        self.service_role = service_role
+        self._cache: Dict[str, asyncio.Future] = {}
+        self._queue: Dict[str, asyncio.Future] = {}
+        self._dispatch_scheduled = False
+        # Running fetches, referenced until they finish so they are not garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, key: Any) -> Optional[Dict[str, Any]]:
+        """Get the row with this key, or None if there is none"""
+        key = str(key)
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._cache[key] = future
+            self._queue[key] = future
+            if not self._dispatch_scheduled:
+                self._dispatch_scheduled = True
+                loop.call_soon(self._dispatch)
+
+        # Shield so a cancelled caller does not fail the lookup for the others sharing it
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: Iterable[Any]) -> List[Optional[Dict[str, Any]]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: Any, row: Optional[Dict[str, Any]]):
+        """Store a row that is already known, e.g. the result of an insert or update"""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(row)
+        self._cache[str(key)] = future
+
+    def clear(self, key: Any):
+        self._cache.pop(str(key), None)
+
+    def _dispatch(self):
+        batch, self._queue = self._queue, {}
+        self._dispatch_scheduled = False
+        if batch:
+            task = asyncio.create_task(self._fetch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, batch: Dict[str, asyncio.Future]):
+        keys = list(batch)
+        try:
+            if self.service_role:
+                client = await supabase_service.get_service_role_client()
+            else:
+                client = await supabase_service.client
+
+            rows = []
+            for start in range(0, len(keys), MAX_BATCH_SIZE):
+                response = await client.table(self.table).select(self.columns).in_(
+                    self.key_column, keys[start:start + MAX_BATCH_SIZE]
+                ).execute()
+                rows.extend(response.data or [])
+
+            rows_by_key = {str(row[self.key_column]): row for row in rows}
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(rows_by_key.get(key))
+        except Exception as e:
+            logger.error(f"Error loading {self.table} by {self.key_column}: {str(e)}")
+            for key, future in batch.items():
+                # Failed lookups are not memoized
+                self._cache.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+
+
+def get_loader(table: str, key_column: str = "id", columns: str = "*", service_role: bool = False) -> DataLoader:
+    """
+    Get the DataLoader of the current request for a table and key column.
+    Outside of a request a new loader is returned, so nothing is memoized across calls.
+    """
+    state = request_state()
+    if state is None:
+        return DataLoader(table, key_column, columns, service_role)
+
+    loaders = state.setdefault("loaders", {})
+    loader_key = (table, key_column, columns, service_role)
+    if loader_key not in loaders:
+        loaders[loader_key] = DataLoader(table, key_column, columns, service_role)
+    return loaders[loader_key]
@@ -0,0 +1,259 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+import asyncio
+import time
+
+import resend
+
+from src.config import logger, settings
+
+
+# Message statuses; failed messages ran out of attempts or were rejected by the provider
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+# Most emails the provider accepts in one batch request
+MAX_BATCH_SIZE = 100
+
+
+class OutboxMessage:
+    """An email waiting in the outbox, with its delivery attempts"""
+
+    def __init__(self, sender: str, to: str, subject: str, html: str, batch_id: Optional[str] = None):
+        self.id = str(uuid4())
+        self.batch_id = batch_id
+        self.sender = sender
+        self.to = to
+        self.subject = subject
+        self.html = html
+        self.status = QUEUED
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.email_id: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+
+    def params(self) -> Dict[str, Any]:
+        return {"from": self.sender, "to": self.to, "subject": self.subject, "html": self.html}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message_id": self.id,
+            "batch_id": self.batch_id,
+            "email": self.to,
+            "subject": self.subject,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "email_id": self.email_id,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class EmailOutboxService:
+    """
+    Sends emails in the background so requests only queue them. EMAIL_OUTBOX_WORKERS workers
+    send queued messages in batch requests of up to EMAIL_BATCH_SIZE, at most EMAIL_RATE_LIMIT
+    requests per second between them, retrying rate limited and failed requests with backoff.
+    The blocking email client runs in a thread. Messages live in memory for
+    EMAIL_OUTBOX_RETENTION seconds after they are sent or fail, on shutdown the queue is drained
+    for up to EMAIL_OUTBOX_DRAIN_TIMEOUT seconds.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(EmailOutboxService, cls).__new__(cls)
+            cls._instance._messages = {}
+            cls._instance._queue = None
+            cls._instance._workers = []
+            cls._instance._retries = {}
+            cls._instance._draining = False
+            cls._instance._rate_lock = None
+            cls._instance._next_request = 0.0
+        return cls._instance
+
+    def start(self):
+        """Start the outbox workers"""
+        if not self._workers:
+            self._queue = asyncio.Queue()
+            self._rate_lock = asyncio.Lock()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.EMAIL_OUTBOX_WORKERS)]
+
+    async def stop(self):
+        """
+        Send what is left in the queue, retries waiting on their backoff included, then stop the
+        workers. Messages not sent within EMAIL_OUTBOX_DRAIN_TIMEOUT are dropped.
+        """
+        if self._workers:
+            self._draining = True
+            for message_id, handle in list(self._retries.items()):
+                handle.cancel()
+                self._queue.put_nowait(self._messages[message_id])
+            self._retries.clear()
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=settings.EMAIL_OUTBOX_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Email outbox not drained within {settings.EMAIL_OUTBOX_DRAIN_TIMEOUT}s")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._draining = False
+        pending = sum(1 for message in self._messages.values() if message.status in (QUEUED, SENDING))
+        if pending:
+            logger.warning(f"Email outbox stopped with {pending} unsent messages")
+
+    def _prune(self):
+        """Forget sent and failed messages older than EMAIL_OUTBOX_RETENTION"""
+        now = datetime.now(timezone.utc)
+        for message in list(self._messages.values()):
+            if message.finished_at and (now - message.finished_at).total_seconds() > settings.EMAIL_OUTBOX_RETENTION:
+                del self._messages[message.id]
+
+    def enqueue(self, sender: str, to: List[str], subject: str, html: List[str]) -> Dict[str, Any]:
+        """
+        Queue one email per recipient, html holding the body of each. Returns the messages and,
+        for more than one recipient, the batch id they are listed under.
+        """
+        if self._queue is None:
+            raise Exception("Email outbox is not running")
+        if not settings.RESEND_API_KEY:
+            logger.error("RESEND_API_KEY not configured")
+            raise Exception("Email service not configured")
+
+        self._prune()
+        batch_id = str(uuid4()) if len(to) > 1 else None
+        messages = [OutboxMessage(sender, address, subject, body, batch_id) for address, body in zip(to, html)]
+        for message in messages:
+            self._messages[message.id] = message
+            self._queue.put_nowait(message)
+        logger.info(f"Queued {len(messages)} emails: {subject}")
+        return {"batch_id": batch_id, "messages": [message.to_dict() for message in messages]}
+
+    def get_message(self, message_id: str) -> Dict[str, Any]:
+        message = self._messages.get(message_id)
+        if message is None:
+            raise Exception("Message not found")
+        return message.to_dict()
+
+    def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Messages of a batch with their count by status"""
+        messages = [message for message in self._messages.values() if message.batch_id == batch_id]
+        if not messages:
+            raise Exception("Batch not found")
+        counts = {status: 0 for status in (QUEUED, SENDING, SENT, FAILED)}
+        for message in messages:
+            counts[message.status] += 1
+        return {
+            "batch_id": batch_id,
+            "total": len(messages),
+            "counts": counts,
+            "messages": [message.to_dict() for message in messages],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status: 0 for status in (QUEUED, SENDING, SENT, FAILED)}
+        for message in self._messages.values():
+            counts[message.status] += 1
+        return {"workers": len(self._workers), "queue_size": self._queue.qsize() if self._queue else 0, **counts}
+
+    async def _worker(self):
+        batch_size = max(1, min(settings.EMAIL_BATCH_SIZE, MAX_BATCH_SIZE))
+        while True:
+            # Wait for a message, then take whatever else is already queued into the same request
+            batch = [await self._queue.get()]
+            while len(batch) < batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._send(batch)
+            except Exception as e:
+                # Never let a bad batch stop the worker
+                logger.error(f"Email outbox worker failed on {len(batch)} messages: {str(e)}")
+                for message in batch:
+                    if message.status == SENDING:
+                        self._finish(message, FAILED, error=str(e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _throttle(self):
+        """Wait for the next request slot, keeping all workers under EMAIL_RATE_LIMIT requests per second"""
+        async with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + 1 / settings.EMAIL_RATE_LIMIT
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        """Rate limits, provider errors and network failures are retried, rejected emails are not"""
+        code = str(getattr(error, "code", ""))
+        if isinstance(error, resend.exceptions.ResendError):
+            return code == "429" or code.startswith("5")
+        return not isinstance(error, ValueError)
+
+    async def _send(self, batch: List[OutboxMessage]):
+        for message in batch:
+            message.status = SENDING
+            message.attempts += 1
+
+        await self._throttle()
+        try:
+            resend.api_key = settings.RESEND_API_KEY
+            response = await asyncio.to_thread(resend.Batch.send, [message.params() for message in batch])
+            results = (response or {}).get("data") or []
+            if len(results) != len(batch):
+                raise Exception("Invalid response from email service")
+        except Exception as e:
+            if not self._retryable(e) and len(batch) > 1:
+                # One bad address rejects the whole request, send the messages one by one
+                logger.warning(f"Email batch of {len(batch)} rejected, sending individually: {str(e)}")
+                for message in batch:
+                    message.attempts -= 1
+                    await self._send([message])
+                return
+            if self._retryable(e):
+                logger.warning(f"Email batch of {len(batch)} failed: {str(e)}")
+            for message in batch:
+                self._retry_or_fail(message, e)
+            return
+
+        for message, result in zip(batch, results):
+            message.email_id = result.get("id")
+            self._finish(message, SENT)
+        logger.info(f"Sent {len(batch)} emails")
+
+    def _retry_or_fail(self, message: OutboxMessage, error: Exception):
+        if self._retryable(error) and message.attempts < settings.EMAIL_RETRY_ATTEMPTS:
+            delay = settings.EMAIL_RETRY_BACKOFF * 2 ** (message.attempts - 1)
+            message.status = QUEUED
+            message.error = str(error)
+            if self._draining:
+                # Shutting down, retry at once so the drain waits for it
+                self._queue.put_nowait(message)
+            else:
+                # Requeue after the backoff without holding up the worker, stop() requeues it at once
+                self._retries[message.id] = asyncio.get_running_loop().call_later(delay, self._requeue, message)
+        else:
+            logger.error(f"Failed to send email {message.id} to {message.to}: {str(error)}")
+            self._finish(message, FAILED, error=str(error))
+
+    def _requeue(self, message: OutboxMessage):
+        self._retries.pop(message.id, None)
+        self._queue.put_nowait(message)
+
+    @staticmethod
+    def _finish(message: OutboxMessage, status: str, error: Optional[str] = None):
+        message.status = status
+        message.error = error
+        message.finished_at = datetime.now(timezone.utc)
+
+
+# Create a singleton instance
+email_outbox_service = EmailOutboxService()
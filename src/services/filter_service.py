@@ -12,6 +12,7 @@ MISSING FILTERS FOR:
 """
 
 import logging
+from typing import Collection, Optional
 from postgrest.exceptions import APIError
 
 logger = logging.getLogger(__name__)
@@ -162,11 +163,12 @@ filter_data format:
     ]
 }
 """
-async def apply_distance_to_poi_filter(query, filter_data):
+async def apply_distance_to_poi_filter(query, filter_data, columns: Optional[Collection[str]] = None):
     """
     Applies a distance to POI filter to a Supabase query.
     :param query: The Supabase query object
     :param filter_data: Dict with 'values' key containing list of filters, each with 'db_column_name', 'value', and 'isCloserTo'
+    :param columns: Known columns of the queried table; when omitted each column is checked with a test query
     :return: Modified query object
     """
     filters = filter_data.get('values', [])
@@ -189,14 +191,19 @@ async def apply_distance_to_poi_filter(query, filter_data):
             
             try:
                 # Check if column exists
-                try:
-                    test_query = query.select(column)
-                    await test_query.execute()
-                except APIError as e:
-                    if is_column_not_exist_error(e):
+                if columns is not None:
+                    if column not in columns:
                         skipped_filters.append(column)
                         continue
-                    raise e
+                else:
+                    try:
+                        test_query = query.select(column)
+                        await test_query.execute()
+                    except APIError as e:
+                        if is_column_not_exist_error(e):
+                            skipped_filters.append(column)
+                            continue
+                        raise e
 
                 # Filter out records where distance is 0 (invalid data)
                 query = query.not_.eq(column, 0)
@@ -230,12 +237,13 @@ filter_data format:
     'value': 0.5,
 }
 """
-async def apply_supply_demand_ratio_filter(query, db_column_name, filter_data):
+async def apply_supply_demand_ratio_filter(query, db_column_name, filter_data, columns: Optional[Collection[str]] = None):
     """
     Applies a supply demand ratio filter to a Supabase query.
     :param query: The Supabase query object
     :param db_column_name: The column name to filter on
     :param filter_data: Dict with 'is_higher_than' key, 'value' key
+    :param columns: Known columns of the queried table; when omitted the column is checked with a test query
     :return: Modified query object
     """
     is_higher_than = filter_data.get('is_higher_than')
@@ -246,15 +254,20 @@ async def apply_supply_demand_ratio_filter(query, db_column_name, filter_data):
         return query
     
     try:
-        # First check if the column exists by attempting a simple select
-        try:
-            test_query = query.select(db_column_name)
-            await test_query.execute()
-        except APIError as e:
-            if is_column_not_exist_error(e):
+        # First check if the column exists, from the cached schema or by attempting a simple select
+        if columns is not None:
+            if db_column_name not in columns:
                 logger.warning(f"⚠️ Skipping filter for non-existent column: {db_column_name}")
                 return query
-            raise e
+        else:
+            try:
+                test_query = query.select(db_column_name)
+                await test_query.execute()
+            except APIError as e:
+                if is_column_not_exist_error(e):
+                    logger.warning(f"⚠️ Skipping filter for non-existent column: {db_column_name}")
+                    return query
+                raise e
 
         if is_higher_than:
             query = query.gte(db_column_name, value)
@@ -0,0 +1,79 @@
+from typing import Any, Dict, Optional
+import time
+
+import httpx
+
+from src.config import logger
+
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """
+    Connection pool shared by every Supabase client, instrumented for saturation metrics.
+    Pool wait time is measured from the moment a request enters the transport until its
+    headers are sent, minus the time spent opening a new connection.
+    """
+
+    def __init__(self, limits: httpx.Limits, http2: bool = True, retries: int = 0):
+        super().__init__(limits=limits, http2=http2, retries=retries)
+        self.limits = limits
+        self.http2 = http2
+        self._stats = {
+            "requests": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "connections_opened": 0,
+            "pool_timeouts": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started_at = time.perf_counter()
+        timings = {"connect": 0.0, "connect_started": None, "waited": False}
+        parent_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            if event_name == "connection.connect_tcp.started":
+                timings["connect_started"] = time.perf_counter()
+                self._stats["connections_opened"] += 1
+            elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                if timings["connect_started"] is not None:
+                    timings["connect"] = time.perf_counter() - timings["connect_started"]
+            elif event_name.endswith("send_request_headers.started") and not timings["waited"]:
+                timings["waited"] = True
+                wait_ms = max(0.0, (time.perf_counter() - started_at - timings["connect"]) * 1000)
+                self._stats["wait_ms_total"] += wait_ms
+                self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+            if parent_trace is not None:
+                await parent_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+
+        self._stats["requests"] += 1
+        self._stats["in_flight"] += 1
+        self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._stats["in_flight"])
+        try:
+            return await super().handle_async_request(request)
+        except httpx.PoolTimeout:
+            self._stats["pool_timeouts"] += 1
+            logger.warning(f"Supabase connection pool exhausted ({self.limits.max_connections} connections)")
+            raise
+        finally:
+            self._stats["in_flight"] -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Pool size, saturation and wait-time counters"""
+        pool = getattr(self, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        max_connections: Optional[int] = self.limits.max_connections
+        requests = self._stats["requests"]
+        return {
+            **self._stats,
+            "wait_ms_avg": round(self._stats["wait_ms_total"] / requests, 3) if requests else None,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+            "max_connections": max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "saturation": round(self._stats["in_flight"] / max_connections, 4) if max_connections else None,
+            "http2": self.http2,
+        }
@@ -0,0 +1,581 @@
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from uuid import uuid4
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import pyarrow as pa
+from postgrest.types import ReturnMethod
+
+from src.config import logger, settings
+from src.schemas.dataset import DatasetSchema
+from src.schemas.poi import POIRegistration
+from src.services.csv_ingest import BatchInserter, CsvBatchReader, CsvValidationError, ROW_HASH_COLUMN, diff_rows
+from src.services.pg_service import pg_service
+from src.services.poi_dataset_service import poi_dataset_service
+from src.services.reference_data_service import reference_data_service
+from src.services.supabase_service import supabase_service
+
+
+# Job statuses; failed jobs are resumable unless their data was invalid
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Upload modes: create a new table, load a staging table and swap it in for an existing one,
+# or write only the rows that differ from an existing table
+CREATE = "create"
+REPLACE = "replace"
+DELTA = "delta"
+UPLOAD_MODES = (CREATE, REPLACE, DELTA)
+# Suffix of the staging table of a replace, see create_dataset_table
+STAGING_SUFFIX = "__staging"
+
+
+class IngestJob:
+    """A CSV table upload running in the background, with its progress and resume position"""
+
+    def __init__(
+        self,
+        table_name: str,
+        path: str,
+        total_bytes: int,
+        schema: DatasetSchema,
+        mode: str = CREATE,
+        file_format: str = ".csv",
+        poi: Optional[POIRegistration] = None
+    ):
+        self.id = str(uuid4())
+        self.table_name = table_name
+        self.schema = schema
+        # POI to create or update for the table once it is loaded
+        self.poi = poi
+        self.mode = mode
+        self.file_format = file_format
+        self.path = path
+        self.total_bytes = total_bytes
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.resumable = False
+        self.table_created = False
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[Dict[str, Any]] = None
+        # Rows inserted, updated, unchanged and deleted by a delta upload, from its first diff
+        self.changes: Optional[Dict[str, int]] = None
+        # "validating" the whole file first, then "inserting"
+        self.phase: Optional[str] = None
+        self.validated = False
+        self.rows_parsed = 0
+        self.rows_validated = 0
+        self.error_count = 0
+        self.validation_errors: List[Dict[str, Any]] = []
+        # Valid row of the file and rows inserted up to which earlier runs committed every batch
+        self.committed_row = 0
+        self.committed_rows = 0
+        self.rows_failed = 0
+        self.bytes_read = 0
+        self.reader: Optional[CsvBatchReader] = None
+        self.inserter: Optional[BatchInserter] = None
+        self.started_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def load_table(self) -> str:
+        """Table the rows are loaded into"""
+        return self.table_name + STAGING_SUFFIX if self.mode == REPLACE else self.table_name
+
+    def progress(self) -> Dict[str, Any]:
+        """Row counters, throughput and estimated time left of the current or last run"""
+        reader, inserter = self.reader, self.inserter
+        validating = reader is not None and not self.validated
+        progress = {
+            "phase": self.phase,
+            "rows_parsed": reader.rows_parsed if validating else self.rows_parsed,
+            "rows_validated": reader.rows_validated if validating else self.rows_validated,
+            "rows_inserted": self.committed_rows + (inserter.rows_inserted if inserter else 0),
+            "rows_failed": inserter.rows_failed if inserter else self.rows_failed,
+            "bytes_read": reader.bytes_read if reader else self.bytes_read,
+            "total_bytes": self.total_bytes,
+            "rows_per_second": None,
+            "eta_seconds": None,
+        }
+
+        if self.started_at is not None and reader is not None and self.status == RUNNING:
+            elapsed = time.monotonic() - self.started_at
+            if elapsed > 0:
+                rows = reader.rows_parsed if validating else inserter.rows_inserted if inserter else 0
+                progress["rows_per_second"] = round(rows / elapsed, 1)
+            # Estimate the rest of the current phase from the share of the file read in it
+            run_bytes = reader.bytes_read - reader.start_bytes
+            if run_bytes > 0:
+                progress["eta_seconds"] = round(elapsed * (self.total_bytes - reader.bytes_read) / run_bytes, 1)
+        return progress
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "table_name": self.table_name,
+            "mode": self.mode,
+            "file_format": self.file_format,
+            "schema": self.schema.model_dump(),
+            "poi": self.poi.model_dump(mode="json") if self.poi else None,
+            "status": self.status,
+            "error": self.error,
+            "resumable": self.resumable,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "progress": self.progress(),
+            "result": self.result,
+            "error_count": self.error_count,
+            "validation_errors": self.validation_errors,
+        }
+
+
+class IngestJobService:
+    """
+    Runs CSV table uploads as background jobs on INGEST_WORKERS workers, so large uploads
+    do not run inside the HTTP request and several uploads cannot starve the API. Uploads
+    are spooled to disk until their job completes or is discarded. Jobs live in memory
+    for INGEST_JOB_RETENTION seconds after they finish.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(IngestJobService, cls).__new__(cls)
+            cls._instance._jobs = {}
+            cls._instance._queue = None
+            cls._instance._workers = []
+        return cls._instance
+
+    def start(self):
+        """Start the ingest workers"""
+        if not self._workers:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.INGEST_WORKERS)]
+
+    async def stop(self):
+        """Cancel running jobs, they stay resumable while the process lives, and stop the workers"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _prune(self):
+        """Forget finished jobs older than INGEST_JOB_RETENTION, deleting their spooled uploads"""
+        now = datetime.now(timezone.utc)
+        for job in list(self._jobs.values()):
+            if job.finished_at and (now - job.finished_at).total_seconds() > settings.INGEST_JOB_RETENTION:
+                self._remove_file(job)
+                del self._jobs[job.id]
+
+    @staticmethod
+    def _remove_file(job: IngestJob):
+        try:
+            os.remove(job.path)
+        except FileNotFoundError:
+            pass
+
+    def _check_table_free(self, table_name: str, job_id: Optional[str] = None):
+        """
+        Only one job per table: replace jobs share the staging table, and a second job could
+        drop it under the first or mix rows of both files into a resumed load
+        """
+        for job in self._jobs.values():
+            if job.id == job_id or job.table_name != table_name:
+                continue
+            if job.status in (QUEUED, RUNNING) or job.resumable:
+                raise ValueError(
+                    f"Table '{table_name}' already has an upload job ({job.id}, {job.status}), "
+                    f"wait for it or cancel it with discard"
+                )
+
+    def _spool(self, file: BinaryIO, suffix: str) -> str:
+        with tempfile.NamedTemporaryFile(prefix="ingest-", suffix=suffix, dir=settings.INGEST_SPOOL_DIR, delete=False) as spooled:
+            shutil.copyfileobj(file, spooled, 1024 * 1024)
+            return spooled.name
+
+    async def submit_csv_upload(
+        self,
+        file: BinaryIO,
+        table_name: str,
+        mode: str = CREATE,
+        file_format: str = ".csv",
+        schema: Optional[DatasetSchema] = None,
+        poi: Optional[POIRegistration] = None
+    ) -> Dict[str, Any]:
+        """Spool an upload to disk, check its header against the schema, or infer one, and queue a job for it"""
+        if poi is not None and schema is not None and not schema.geo:
+            raise ValueError("Only tables with latitude and longitude columns can be registered as POI")
+        self._prune()
+        self._check_table_free(table_name)
+        path = await asyncio.to_thread(self._spool, file, file_format)
+        try:
+            # Reject files with the wrong columns right away rather than in the job
+            with open(path, "rb") as spooled:
+                reader = CsvBatchReader(spooled, settings.CSV_INGEST_BATCH_SIZE, schema=schema, file_format=file_format)
+                try:
+                    await reader.open()
+                finally:
+                    reader.close()
+        except Exception:
+            os.remove(path)
+            raise
+
+        if poi is not None and not reader.schema.geo:
+            os.remove(path)
+            raise ValueError("Only tables with latitude and longitude columns can be registered as POI")
+
+        job = IngestJob(table_name, path, os.path.getsize(path), reader.schema, mode, file_format, poi)
+        # Checked again, another upload of the table may have been queued while this one was spooled
+        try:
+            self._check_table_free(table_name)
+        except ValueError:
+            os.remove(path)
+            raise
+        self._jobs[job.id] = job
+        self._enqueue(job)
+        logger.info(f"Queued ingest job {job.id} to {mode} table {table_name} from {file_format} ({job.total_bytes} bytes)")
+        return job.to_dict()
+
+    def _enqueue(self, job: IngestJob):
+        if self._queue is None:
+            raise Exception("Ingest workers are not running")
+        job.status = QUEUED
+        job.error = None
+        job.resumable = False
+        job.finished_at = None
+        self._queue.put_nowait(job)
+
+    def _get(self, job_id: str) -> IngestJob:
+        job = self._jobs.get(str(job_id))
+        if job is None:
+            raise Exception("Ingest job not found")
+        return job
+
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        return self._get(job_id).to_dict()
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """All jobs, newest first"""
+        self._prune()
+        jobs = sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+        return [job.to_dict() for job in jobs]
+
+    async def cancel_job(self, job_id: str, discard: bool = False) -> Dict[str, Any]:
+        """
+        Cancel a queued or running job. The loaded rows and the spooled upload are kept so the
+        job can be resumed, unless discard is set, which also drops the table and the upload.
+        """
+        job = self._get(job_id)
+        if job.status == COMPLETED:
+            raise ValueError("Job has already completed")
+
+        if job.status == RUNNING and job.task is not None:
+            job.task.cancel()
+            await asyncio.gather(job.task, return_exceptions=True)
+        elif job.status == QUEUED:
+            self._finish(job, CANCELLED, resumable=True)
+
+        if discard:
+            if job.table_created:
+                await self._drop_table(job)
+            self._remove_file(job)
+            job.resumable = False
+        return job.to_dict()
+
+    def resume_job(self, job_id: str) -> Dict[str, Any]:
+        """Queue a cancelled or failed job again, it continues after the last committed batch"""
+        job = self._get(job_id)
+        if not job.resumable:
+            raise ValueError("Job cannot be resumed")
+        self._check_table_free(job.table_name, job.id)
+        self._enqueue(job)
+        logger.info(f"Resuming ingest job {job.id} from row {job.committed_row}")
+        return job.to_dict()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                # Skip jobs cancelled while queued
+                if job.status != QUEUED:
+                    continue
+                # Run in a task of its own so cancelling the job does not stop the worker
+                task = job.task = asyncio.create_task(self._run(job))
+                try:
+                    await asyncio.shield(task)
+                except asyncio.CancelledError:
+                    if not task.done():
+                        # The worker itself is being stopped
+                        task.cancel()
+                        await asyncio.gather(task, return_exceptions=True)
+                        raise
+            finally:
+                self._queue.task_done()
+
+    def _finish(self, job: IngestJob, status: str, error: Optional[str] = None, resumable: bool = False):
+        job.status = status
+        job.error = error
+        job.resumable = resumable
+        job.finished_at = datetime.now(timezone.utc)
+        if job.inserter is not None:
+            # Keep what this run committed for the next run and for the final counters
+            job.committed_row = job.inserter.committed_row
+            job.committed_rows += job.inserter.committed_rows
+            job.rows_failed = job.inserter.rows_failed
+        if job.reader is not None:
+            job.bytes_read = job.reader.bytes_read
+        job.reader = None
+        job.inserter = None
+        job.task = None
+        if not resumable:
+            self._remove_file(job)
+
+    async def _run(self, job: IngestJob):
+        job.status = RUNNING
+        try:
+            with open(job.path, "rb") as file:
+                reader = CsvBatchReader(
+                    file, settings.CSV_INGEST_BATCH_SIZE, schema=job.schema,
+                    keep_hashes=job.mode == DELTA, file_format=job.file_format
+                )
+                try:
+                    await reader.open()
+                    job.reader = reader
+                    # A delta compares the row hashes of the file, which are only kept while validating
+                    if not job.validated or job.mode == DELTA:
+                        await self._validate(job, reader)
+
+                    supabase = await supabase_service.get_service_role_client()
+                    if job.mode == DELTA:
+                        deleted_ids = await self._diff(supabase, job, reader)
+                    elif not job.table_created:
+                        await self._create_table(supabase, job)
+
+                    job.phase = "inserting"
+                    await reader.skip(job.committed_row)
+                    reader.start_bytes = reader.bytes_read
+                    job.started_at = time.monotonic()
+                    job.inserter = BatchInserter(
+                        supabase, job.load_table, reader.batch_size, job.committed_row, key=job.schema.key.name
+                    )
+                    await self._insert(job)
+                finally:
+                    reader.close()
+
+            if job.schema.geo:
+                # Before the swap, so the live table is never without its index
+                job.phase = "indexing"
+                await poi_dataset_service.build_index(supabase, job.load_table, job.schema)
+            if job.mode == REPLACE:
+                await self._swap_table(supabase, job)
+            elif job.mode == DELTA:
+                await self._delete_rows(supabase, job, deleted_ids)
+            reference_data_service.invalidate_dataset(job.table_name)
+            publish = await self._publish(job)
+
+            rows_processed = job.committed_rows + job.inserter.rows_inserted
+            action = {CREATE: "created", REPLACE: "replaced", DELTA: "updated"}[job.mode]
+            job.result = {
+                "message": f"Table '{job.table_name}' {action} successfully",
+                "table_name": job.table_name,
+                "rows_processed": rows_processed,
+                "batch_timings": job.inserter.timing_summary(),
+            }
+            if job.mode == DELTA:
+                job.result["changes"] = job.changes
+            job.result.update(publish)
+            self._finish(job, COMPLETED)
+            logger.info(f"Ingest job {job.id} completed: {rows_processed} rows inserted into table {job.table_name}")
+        except asyncio.CancelledError:
+            logger.info(f"Ingest job {job.id} cancelled")
+            self._finish(job, CANCELLED, resumable=True)
+            raise
+        except ValueError as e:
+            # Invalid data, a new upload is needed: do not leave a partially loaded table behind
+            logger.error(f"Ingest job {job.id} failed: {str(e)}")
+            if job.table_created:
+                await self._drop_table(job)
+            self._finish(job, FAILED, error=str(e))
+        except Exception as e:
+            logger.error(f"Ingest job {job.id} failed: {str(e)}")
+            # A delta only ever writes to the existing table, so it can always be resumed
+            self._finish(job, FAILED, error=str(e), resumable=job.table_created or job.mode == DELTA)
+
+    async def _publish(self, job: IngestJob) -> Dict[str, Any]:
+        """
+        Register the POI of a loaded table and warm its tile cache. The table is already live,
+        so failures here are reported on the job rather than failing it.
+        """
+        result: Dict[str, Any] = {}
+        if not job.schema.geo:
+            return result
+
+        job.phase = "publishing"
+        warnings = []
+        if job.poi is not None:
+            try:
+                result["poi"] = await poi_dataset_service.register(job.table_name, job.poi)
+            except Exception as e:
+                logger.error(f"Failed to register table {job.table_name} as POI: {str(e)}")
+                warnings.append(f"POI registration failed: {str(e)}")
+        try:
+            result["rows_cached"] = await poi_dataset_service.warm(job.table_name, job.schema)
+        except Exception as e:
+            logger.warning(f"Failed to warm tiles of {job.table_name}: {str(e)}")
+            warnings.append(f"Tile cache warm-up failed: {str(e)}")
+        if warnings:
+            result["warnings"] = warnings
+        return result
+
+    async def _validate(self, job: IngestJob, reader: CsvBatchReader):
+        """Check the whole file before anything is created, keeping the error report on the job"""
+        job.phase = "validating"
+        job.started_at = time.monotonic()
+        try:
+            await reader.validate()
+        except CsvValidationError as e:
+            job.error_count = e.error_count
+            job.validation_errors = e.errors
+            raise
+        finally:
+            job.rows_parsed = reader.rows_parsed
+            job.rows_validated = reader.rows_validated
+            job.validated = True
+
+        if not job.rows_validated:
+            raise ValueError("File contains no data rows")
+        await reader.rewind()
+        logger.info(f"Ingest job {job.id} validated {job.rows_validated} rows")
+
+    async def _insert(self, job: IngestJob):
+        """Insert the rows of the upload as they are read, with several batches in flight"""
+        reader, inserter = job.reader, job.inserter
+        logger.info(f"Starting data insertion into {job.load_table} from row {job.committed_row}, first batch of {reader.batch_size} rows")
+        try:
+            async for batch in reader.batches():
+                await inserter.submit(batch, end_row=reader.rows_parsed)
+                # The next batch is read with the size adapted to the latency so far
+                reader.batch_size = inserter.batch_size
+            await inserter.finish()
+        except BaseException:
+            await inserter.abort()
+            raise
+
+    async def _create_table(self, supabase, job: IngestJob):
+        """Create the table the upload is loaded into and wait until PostgREST has reloaded its schema"""
+        logger.info(f"Creating table: {job.load_table}")
+        try:
+            create_result = await supabase.rpc('create_dataset_table', {
+                'p_table_name': job.table_name,
+                'p_columns': [column.model_dump() for column in job.schema.columns],
+                'p_staging': job.mode == REPLACE
+            }).execute()
+        except Exception as e:
+            error_message = str(e).lower()
+            if "already exists" in error_message or "duplicate" in error_message:
+                raise ValueError(f"Table '{job.table_name}' already exists")
+            raise Exception(f"Failed to create table: {str(e)}")
+
+        if not create_result.data:
+            raise Exception("Failed to create table")
+        job.table_created = True
+        await self._wait_for_table(supabase, job.load_table, job.schema.key.name)
+        logger.info(f"Table created successfully: {job.load_table}")
+
+    @staticmethod
+    async def _wait_for_table(supabase, table_name: str, key: str):
+        """The SQL functions notify PostgREST to reload its schema, poll until the table and its columns are visible"""
+        deadline = time.monotonic() + settings.INGEST_SCHEMA_RELOAD_TIMEOUT
+        delay = 0.05
+        while True:
+            try:
+                await supabase.from_(table_name).select(f"{key},{ROW_HASH_COLUMN}", count="exact").limit(0).execute()
+                return
+            except Exception as e:
+                if time.monotonic() + delay > deadline:
+                    logger.error(f"Table verification failed: {table_name} - {str(e)}")
+                    raise Exception("Table is not accessible yet. Please try again.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    async def _fetch_row_hashes(self, supabase, table_name: str, key: str, key_type: pa.DataType) -> Tuple[pa.Array, pa.Array]:
+        """Keys and row hashes of the existing rows of a table"""
+        if pg_service.enabled:
+            ids, hashes = await pg_service.get_row_hashes(table_name, key)
+        else:
+            # Keyset pagination, so every page is an index range scan
+            ids, hashes = [], []
+            while True:
+                query = supabase.from_(table_name).select(f"{key},{ROW_HASH_COLUMN}").order(key).limit(settings.DELTA_FETCH_PAGE_SIZE)
+                if ids:
+                    query = query.gt(key, ids[-1])
+                page = (await query.execute()).data
+                # Pages may be capped below the requested size by the server, stop at the first empty one
+                if not page:
+                    break
+                ids.extend(row[key] for row in page)
+                hashes.extend(row[ROW_HASH_COLUMN] for row in page)
+        return pa.array(ids, key_type), pa.array(hashes, pa.string())
+
+    async def _diff(self, supabase, job: IngestJob, reader: CsvBatchReader) -> List[int]:
+        """
+        Compare the validated rows with the table and restrict the reader to the inserted and
+        changed rows. Returns the ids to delete. A resumed job diffs again, rows written by the
+        earlier run are then unchanged, but keeps the counts of its first diff.
+        """
+        logger.info(f"Comparing upload with table {job.table_name}")
+        try:
+            await supabase.rpc('prepare_csv_delta', {'p_table_name': job.table_name}).execute()
+        except Exception as e:
+            if "does not exist" in str(e).lower():
+                raise ValueError(f"Table '{job.table_name}' does not exist")
+            raise Exception(f"Failed to prepare table: {str(e)}")
+        await self._wait_for_table(supabase, job.table_name, job.schema.key.name)
+
+        existing_ids, existing_hashes = await self._fetch_row_hashes(
+            supabase, job.table_name, job.schema.key.name, reader.row_ids.type
+        )
+        row_filter, changes, deleted_ids = await asyncio.to_thread(
+            diff_rows, reader.row_ids.combine_chunks(), reader.row_hashes.combine_chunks(), existing_ids, existing_hashes
+        )
+        reader.row_filter = row_filter
+        if job.changes is None:
+            job.changes = changes
+        logger.info(f"Ingest job {job.id} diff for {job.table_name}: {changes}")
+        return deleted_ids
+
+    async def _delete_rows(self, supabase, job: IngestJob, ids: List[int]):
+        """Delete the rows no longer in the upload, DELTA_DELETE_BATCH_SIZE keys per request"""
+        for start in range(0, len(ids), settings.DELTA_DELETE_BATCH_SIZE):
+            await supabase.from_(job.table_name).delete(returning=ReturnMethod.minimal).in_(
+                job.schema.key.name, ids[start:start + settings.DELTA_DELETE_BATCH_SIZE]
+            ).execute()
+        if ids:
+            logger.info(f"Deleted {len(ids)} rows from table {job.table_name}")
+
+    async def _swap_table(self, supabase, job: IngestJob):
+        """Index the loaded staging table and swap it in for the live table"""
+        logger.info(f"Swapping {job.load_table} in for {job.table_name}")
+        await supabase.rpc('swap_csv_table', {'p_table_name': job.table_name}).execute()
+        # The staging table is now the live one and must not be dropped as a leftover
+        job.table_created = False
+
+    async def _drop_table(self, job: IngestJob):
+        try:
+            supabase = await supabase_service.get_service_role_client()
+            await supabase.rpc('drop_table', {'p_table_name': job.load_table}).execute()
+            job.table_created = False
+        except Exception as e:
+            logger.error(f"Failed to cleanup table after upload error: {job.load_table} - {str(e)}")
+
+
+# Create a singleton instance
+ingest_job_service = IngestJobService()
@@ -0,0 +1,51 @@
+from typing import Dict
+
+from src.config import logger
+from src.schemas.order import BatchOrderUpdate
+from src.services.reference_data_service import reference_data_service
+from src.services.supabase_service import supabase_service
+
+
+class OrderService:
+    """Applies drag-and-drop reordering of admin managed tables as one atomic write"""
+    _instance = None
+
+    # Tables whose "order" column can be updated in bulk (must match apply_batch_order in sql/order_functions.sql)
+    ORDERED_TABLES = ("filters", "site_types", "poi")
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(OrderService, cls).__new__(cls)
+        return cls._instance
+
+    async def apply_batch_order(self, table_name: str, updates: BatchOrderUpdate) -> int:
+        """
+        Update the order of many rows of table_name with a single transactional call to the
+        apply_batch_order function and invalidate the caches that hold the table.
+        Returns the number of updated rows.
+        """
+        if table_name not in self.ORDERED_TABLES:
+            raise ValueError(f"Ordering is not supported for table {table_name}")
+
+        # Later updates of the same id win
+        orders: Dict[str, int] = {}
+        for item in updates.updates:
+            orders[str(item.id)] = item.order
+
+        if not orders:
+            return 0
+
+        supabase = await supabase_service.client
+        response = await supabase.rpc("apply_batch_order", {
+            "p_table_name": table_name,
+            "p_updates": [{"id": row_id, "order": order} for row_id, order in orders.items()]
+        }).execute()
+
+        reference_data_service.invalidate_table(table_name)
+
+        logger.info(f"Updated order of {response.data} rows in {table_name}")
+        return response.data
+
+
+# Create a singleton instance
+order_service = OrderService()
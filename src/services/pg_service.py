@@ -0,0 +1,239 @@
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+import json
+
+import asyncpg
+
+from src.config import logger, settings
+from src.services.cache_service import cache_service
+
+
+# Cache namespace of table columns read from information_schema
+PG_TABLE_COLUMNS = "pg_table_columns"
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class PgService:
+    """
+    Direct Postgres access for the hot read queries (property search, project load, template
+    filters), used instead of PostgREST when DATA_ACCESS_BACKEND=asyncpg.
+    Statements are prepared once per pooled connection and reused through asyncpg's statement
+    cache; callers fall back to the supabase-py path when the pool is not available.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(PgService, cls).__new__(cls)
+            cls._instance._pool = None
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return self._pool is not None
+
+    @staticmethod
+    async def _init_connection(connection):
+        # Return json/jsonb as Python objects, the same as PostgREST responses
+        for type_name in ("json", "jsonb"):
+            await connection.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+    async def open(self):
+        """Create the connection pool when the asyncpg backend is configured, called on application startup"""
+        if settings.DATA_ACCESS_BACKEND != "asyncpg" or self._pool is not None:
+            return
+        if not settings.DATABASE_URL:
+            logger.error("DATA_ACCESS_BACKEND=asyncpg requires DATABASE_URL, using PostgREST")
+            return
+
+        try:
+            self._pool = await asyncpg.create_pool(
+                settings.DATABASE_URL,
+                min_size=settings.PG_POOL_MIN_SIZE,
+                max_size=settings.PG_POOL_MAX_SIZE,
+                statement_cache_size=settings.PG_STATEMENT_CACHE_SIZE,
+                command_timeout=settings.SUPABASE_TIMEOUT,
+                init=self._init_connection
+            )
+            logger.info(f"Opened Postgres pool (min_size={settings.PG_POOL_MIN_SIZE}, max_size={settings.PG_POOL_MAX_SIZE})")
+        except Exception as e:
+            logger.error(f"Failed to open Postgres pool, using PostgREST: {str(e)}")
+            self._pool = None
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+            logger.info("Closed Postgres pool")
+
+    def pool_metrics(self) -> Dict[str, Any]:
+        """Size and idle connections of the Postgres pool"""
+        if self._pool is None:
+            return {"open": False, "backend": settings.DATA_ACCESS_BACKEND}
+        return {
+            "open": True,
+            "backend": settings.DATA_ACCESS_BACKEND,
+            "size": self._pool.get_size(),
+            "idle": self._pool.get_idle_size(),
+            "min_size": self._pool.get_min_size(),
+            "max_size": self._pool.get_max_size(),
+        }
+
+    async def get_table_columns(self, table_name: str) -> FrozenSet[str]:
+        """Get the column names of a table in the public schema"""
+        async def load():
+            rows = await self._pool.fetch(
+                """
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = $1
+                """,
+                table_name
+            )
+            return frozenset(row["column_name"] for row in rows)
+
+        return await cache_service.get_or_load(PG_TABLE_COLUMNS, load, key=table_name, ttl=settings.SCHEMA_CACHE_TTL)
+
+    async def get_row_hashes(self, table_name: str, key: str = "id") -> Tuple[List[Any], List[Optional[str]]]:
+        """Get the keys and row hashes of an uploaded table, ordered by key"""
+        rows = await self._pool.fetch(f"SELECT {_quote(key)} AS key, row_hash FROM {_quote(table_name)} ORDER BY 1")
+        return [row["key"] for row in rows], [row["row_hash"] for row in rows]
+
+    async def get_default_filters(self, site_type_id: str, market_status_id: str) -> List[Dict[str, Any]]:
+        """Get the template filters of a site type and market status combination, ordered by order"""
+        rows = await self._pool.fetch(
+            """
+            SELECT f.id, f.filter_type, f.filter_data, f.db_column_name, f."order", f.is_open, f.display_name
+            FROM site_type_market_status_filters stmsf
+            JOIN filters f ON f.id = stmsf.filter_id
+            WHERE stmsf.site_type_id = $1::uuid AND stmsf.market_status_id = $2::uuid
+            ORDER BY f."order"
+            """,
+            str(site_type_id), str(market_status_id)
+        )
+        return [dict(row) for row in rows]
+
+    async def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Get a project with its market status, site type and user filters, in the PostgREST response shape"""
+        row = await self._pool.fetchrow(
+            """
+            SELECT
+                p.id,
+                p.title,
+                p.site_type_id,
+                p.market_status_id,
+                to_jsonb(ms) AS market_status,
+                to_jsonb(st) AS site_types,
+                COALESCE(
+                    (SELECT jsonb_agg(to_jsonb(uf)) FROM user_filters uf WHERE uf.project_id = p.id),
+                    '[]'::jsonb
+                ) AS user_filters
+            FROM projects p
+            LEFT JOIN market_status ms ON ms.id = p.market_status_id
+            LEFT JOIN site_types st ON st.id = p.site_type_id
+            WHERE p.id = $1::uuid
+            """,
+            str(project_id)
+        )
+        return dict(row) if row else None
+
+    @staticmethod
+    def _property_conditions(
+        filters: Sequence[Any],
+        market_status: Optional[str],
+        columns: FrozenSet[str]
+    ) -> Tuple[List[str], List[Any]]:
+        """
+        Translate the property filters to SQL conditions with the same semantics as the
+        PostgREST filters in filter_service. Filters on columns the table does not have are skipped.
+        """
+        conditions: List[str] = []
+        params: List[Any] = []
+
+        def param(value: Any, cast: str = "") -> str:
+            params.append(value)
+            return f"${len(params)}{cast}"
+
+        def column(name: Optional[str]) -> Optional[str]:
+            if not name or name not in columns:
+                logger.warning(f"⚠️ Skipping filter for non-existent column: {name}")
+                return None
+            return _quote(name)
+
+        if market_status:
+            if "," in market_status:
+                values = [value.strip() for value in market_status.split(",")]
+                conditions.append(f"category = ANY({param(values, '::text[]')})")
+            else:
+                conditions.append(f"category = {param(market_status)}")
+
+        for filter_obj in filters or []:
+            filter_type = filter_obj.filter_type.lower()
+            filter_data = filter_obj.filter_data or {}
+
+            if filter_type == "range":
+                col = column(filter_obj.db_column_name)
+                if col is None:
+                    continue
+                if filter_data.get("min") is not None:
+                    conditions.append(f"{col} >= {param(filter_data['min'], '::numeric')}")
+                if filter_data.get("max") is not None:
+                    conditions.append(f"{col} <= {param(filter_data['max'], '::numeric')}")
+
+            elif filter_type == "zone":
+                values = filter_data.get("values", [])
+                col = column(filter_obj.db_column_name) if values else None
+                if col is not None:
+                    conditions.append(f"{col} && {param([str(value) for value in values], '::text[]')}")
+
+            elif filter_type == "distance_to_poi":
+                for filter_item in filter_data.get("values", []):
+                    threshold = filter_item.get("value")
+                    col = column(filter_item.get("db_column_name")) if threshold is not None else None
+                    if col is None:
+                        continue
+                    operator = "<=" if filter_item.get("isCloserTo", True) else ">="
+                    # Distance 0 marks missing data
+                    conditions.append(f"{col} <> 0 AND {col} {operator} {param(threshold, '::numeric')}")
+
+            elif filter_type == "supply_demand_ratio":
+                value = filter_data.get("value")
+                col = column(filter_obj.db_column_name) if value is not None else None
+                if col is None:
+                    continue
+                operator = ">=" if filter_data.get("is_higher_than") else "<="
+                conditions.append(f"{col} {operator} {param(value, '::numeric')}")
+
+        return conditions, params
+
+    async def search_properties(
+        self,
+        select_columns: Sequence[str],
+        filters: Sequence[Any],
+        market_status: Optional[str],
+        offset: int,
+        limit: int
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Return one page of properties matching the filters and the total number of matches"""
+        table_name = settings.PROPERTY_TABLE_NAME
+        columns = await self.get_table_columns(table_name)
+        conditions, params = self._property_conditions(filters, market_status, columns)
+
+        select_list = ", ".join(_quote(name) for name in select_columns if name in columns)
+        where = f"WHERE {' AND '.join(f'({condition})' for condition in conditions)}" if conditions else ""
+        table = _quote(table_name)
+
+        async with self._pool.acquire() as connection:
+            total_count = await connection.fetchval(f"SELECT count(*) FROM {table} {where}", *params)
+            rows = await connection.fetch(
+                f"SELECT {select_list} FROM {table} {where} OFFSET ${len(params) + 1} LIMIT ${len(params) + 2}",
+                *params, offset, limit
+            )
+
+        return [dict(row) for row in rows], total_count
+
+
+# Create a singleton instance
+pg_service = PgService()
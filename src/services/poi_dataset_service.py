@@ -0,0 +1,313 @@
+from typing import Any, Dict, List, Tuple
+import math
+
+from src.config import logger, settings
+from src.schemas.dataset import DatasetSchema
+from src.schemas.poi import POIRegistration
+from src.services.cache_service import cache_service
+from src.services.csv_ingest import LATITUDE_NAMES, LONGITUDE_NAMES, ROW_HASH_COLUMN
+from src.services.reference_data_service import POI_GRID, reference_data_service
+from src.services.supabase_service import supabase_service
+
+
+# Column holding the web mercator tile of a row at POI_TILE_ZOOM, see build_poi_spatial_index
+TILE_KEY_COLUMN = "tile_key"
+# Latitude range of web mercator tiles
+MAX_LATITUDE = 85.05112878
+# Deepest zoom a tile with more than POI_TILE_MAX_ROWS rows is split down to, to read it whole
+MAX_TILE_ZOOM = 22
+EARTH_RADIUS_METERS = 6371008.8
+
+
+def tile_of(latitude: float, longitude: float, zoom: int) -> Tuple[int, int]:
+    """Web mercator tile containing a point, the same formula as build_poi_spatial_index"""
+    tiles = 2 ** zoom
+    latitude = math.radians(max(min(latitude, MAX_LATITUDE), -MAX_LATITUDE))
+    x = min(math.floor((longitude + 180) / 360 * tiles), tiles - 1)
+    # The clamped latitudes can round past the edge rows
+    y = max(min(math.floor((1 - math.log(math.tan(latitude) + 1 / math.cos(latitude)) / math.pi) / 2 * tiles), tiles - 1), 0)
+    return x, y
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """South, west, north and east edges of a tile"""
+    tiles = 2 ** zoom
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / tiles))))
+
+    return latitude(y + 1), x / tiles * 360 - 180, latitude(y), (x + 1) / tiles * 360 - 180
+
+
+def distance_meters(latitude: float, longitude: float, other_latitude: float, other_longitude: float) -> float:
+    """Great circle distance between two points"""
+    phi1, phi2 = math.radians(latitude), math.radians(other_latitude)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(other_longitude - longitude)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def meridian_distance_meters(latitude: float, longitude: float, meridian: float) -> float:
+    """Great circle distance from a point to the nearest point of a meridian, pole to pole"""
+    d_lambda = abs((meridian - longitude + 180) % 360 - 180)
+    if d_lambda >= 90:
+        # The meridian is nearest at the pole
+        return EARTH_RADIUS_METERS * (math.pi / 2 - abs(math.radians(latitude)))
+    return EARTH_RADIUS_METERS * math.asin(math.cos(math.radians(latitude)) * math.sin(math.radians(d_lambda)))
+
+
+class PoiGrid:
+    """
+    Rows of a POI dataset by tile at POI_TILE_ZOOM. A complete grid holds the whole dataset,
+    loaded after an upload; otherwise tiles are added as they are read.
+    """
+
+    def __init__(self, latitude: str, longitude: str, indexed: bool):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.indexed = indexed
+        self.complete = False
+        self.tiles: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        self.rows = 0
+
+    def add(self, tile: Tuple[int, int], rows: List[Dict[str, Any]]):
+        # Incomplete grids stop growing at the size of a complete one
+        if self.complete or self.rows + len(rows) <= settings.POI_WARM_MAX_ROWS:
+            self.tiles[tile] = rows
+            self.rows += len(rows)
+
+
+class PoiDatasetService:
+    """
+    Post-upload stage for POI datasets: registers the table in poi, builds its persisted tile
+    index and loads it into the tile cache. Serves tile and nearest neighbour lookups from
+    that cache, reading missing tiles through the tile index.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(PoiDatasetService, cls).__new__(cls)
+        return cls._instance
+
+    async def register(self, table_name: str, registration: POIRegistration) -> Dict[str, Any]:
+        """Create the POI of an uploaded table, or update it when the table is uploaded again"""
+        supabase = await supabase_service.get_service_role_client()
+        poi_data = registration.model_dump()
+        poi_data["site_type_id"] = str(registration.site_type_id)
+        poi_data["details_table_name"] = table_name
+
+        existing = await supabase.table("poi").select("id").eq(
+            "site_type_id", poi_data["site_type_id"]
+        ).eq("details_table_name", table_name).limit(1).execute()
+        if existing.data:
+            response = await supabase.table("poi").update(poi_data).eq("id", existing.data[0]["id"]).execute()
+        else:
+            response = await supabase.table("poi").insert(poi_data).execute()
+
+        if not response.data:
+            raise Exception(f"Failed to register table {table_name} as POI")
+        reference_data_service.invalidate_table("poi")
+        logger.info(f"Registered table {table_name} as POI {response.data[0]['id']}")
+        return response.data[0]
+
+    async def build_index(self, supabase, table_name: str, schema: DatasetSchema):
+        """Add the tile_key column and its index to a table with geo columns, a no-op if it is up to date"""
+        latitude, longitude = schema.geo
+        await supabase.rpc('build_poi_spatial_index', {
+            'p_table_name': table_name,
+            'p_latitude': latitude.name,
+            'p_longitude': longitude.name,
+            'p_zoom': settings.POI_TILE_ZOOM
+        }).execute()
+        logger.info(f"Built spatial index of {table_name} at zoom {settings.POI_TILE_ZOOM}")
+
+    async def warm(self, table_name: str, schema: DatasetSchema) -> int:
+        """Load a dataset of up to POI_WARM_MAX_ROWS rows into the tile cache, returns the rows loaded"""
+        supabase = await supabase_service.get_service_role_client()
+        count = (await supabase.table(table_name).select("*", count="exact").limit(0).execute()).count or 0
+        if count > settings.POI_WARM_MAX_ROWS:
+            logger.info(f"Not warming tiles of {table_name}: {count} rows, tiles are cached as they are read")
+            return 0
+
+        latitude, longitude = schema.geo
+        key = schema.key.name
+        grid = PoiGrid(latitude.name, longitude.name, indexed=True)
+        grid.complete = True
+        tiles: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        last = None
+        # Keyset pagination on the key
+        while True:
+            query = supabase.table(table_name).select("*").order(key).limit(settings.DELTA_FETCH_PAGE_SIZE)
+            if last is not None:
+                query = query.gt(key, last)
+            page = (await query.execute()).data
+            if not page:
+                break
+            for row in page:
+                row = self._public(row)
+                tiles.setdefault(tile_of(row[grid.latitude], row[grid.longitude], settings.POI_TILE_ZOOM), []).append(row)
+            last = page[-1][key]
+
+        for tile, rows in tiles.items():
+            grid.add(tile, rows)
+        cache_service.set(POI_GRID, grid, key=table_name, ttl=settings.POI_TILE_CACHE_TTL)
+        logger.info(f"Warmed {len(tiles)} tiles ({grid.rows} rows) of {table_name}")
+        return grid.rows
+
+    @staticmethod
+    def _public(row: Dict[str, Any]) -> Dict[str, Any]:
+        return {name: value for name, value in row.items() if name not in (ROW_HASH_COLUMN, TILE_KEY_COLUMN)}
+
+    async def _grid(self, table_name: str) -> PoiGrid:
+        async def load():
+            # The geo columns the tile index was built from, whatever their names
+            supabase = await supabase_service.get_service_role_client()
+            index = (await supabase.rpc('poi_spatial_index', {'p_table_name': table_name}).execute()).data
+            if index:
+                return PoiGrid(index["latitude"], index["longitude"], indexed=index["zoom"] == settings.POI_TILE_ZOOM)
+
+            # Tables without a tile index, by the usual geo column names
+            columns = await reference_data_service.get_table_columns(table_name)
+            if columns is None:
+                raise Exception("Table not found")
+            latitude = next((name for name in LATITUDE_NAMES if name in columns), None)
+            longitude = next((name for name in LONGITUDE_NAMES if name in columns), None)
+            if latitude is None or longitude is None:
+                raise ValueError(f"Table '{table_name}' has no latitude and longitude columns")
+            return PoiGrid(latitude, longitude, indexed=False)
+
+        return await cache_service.get_or_load(POI_GRID, load, key=table_name, ttl=settings.POI_TILE_CACHE_TTL)
+
+    async def _read_tile(self, table_name: str, grid: PoiGrid, zoom: int, x: int, y: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Up to POI_TILE_MAX_ROWS rows of a tile from the database, through the tile index when it
+        is at its zoom, and whether there may be more
+        """
+        supabase = await supabase_service.read_client(service_role=True)
+        query = supabase.table(table_name).select("*")
+        if grid.indexed and zoom == settings.POI_TILE_ZOOM:
+            query = query.eq(TILE_KEY_COLUMN, x * 2 ** zoom + y)
+        else:
+            # Edge tiles of the map also hold the rows beyond the mercator latitudes and at 180
+            tiles = 2 ** zoom
+            south, west, north, east = tile_bounds(zoom, x, y)
+            if y < tiles - 1:
+                query = query.gte(grid.latitude, south)
+            if y > 0:
+                query = query.lt(grid.latitude, north)
+            query = query.gte(grid.longitude, west)
+            if x < tiles - 1:
+                query = query.lt(grid.longitude, east)
+        response = await query.limit(settings.POI_TILE_MAX_ROWS).execute()
+        rows = [self._public(row) for row in response.data or []]
+        return rows, len(rows) >= settings.POI_TILE_MAX_ROWS
+
+    async def _read_whole_tile(self, table_name: str, grid: PoiGrid, zoom: int, x: int, y: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Every row of a tile, splitting tiles with more than POI_TILE_MAX_ROWS rows into their quarters"""
+        rows, truncated = await self._read_tile(table_name, grid, zoom, x, y)
+        if not truncated or zoom >= MAX_TILE_ZOOM:
+            return rows, truncated
+
+        rows, truncated = [], False
+        for child_x in (2 * x, 2 * x + 1):
+            for child_y in (2 * y, 2 * y + 1):
+                child_rows, child_truncated = await self._read_whole_tile(table_name, grid, zoom + 1, child_x, child_y)
+                rows.extend(child_rows)
+                truncated = truncated or child_truncated
+        return rows, truncated
+
+    async def _index_tile(self, table_name: str, grid: PoiGrid, x: int, y: int) -> List[Dict[str, Any]]:
+        """Every row of a tile at POI_TILE_ZOOM, from the grid or read and added to it"""
+        rows = grid.tiles.get((x, y))
+        if rows is None:
+            if grid.complete:
+                return []
+            rows, truncated = await self._read_whole_tile(table_name, grid, settings.POI_TILE_ZOOM, x, y)
+            if truncated:
+                # Only whole tiles are cached, nearest() and deeper zooms rely on it
+                logger.warning(f"Tile {settings.POI_TILE_ZOOM}/{x}/{y} of {table_name} is too dense to read whole")
+            else:
+                grid.add((x, y), rows)
+        return rows
+
+    async def get_tile(self, table_name: str, zoom: int, x: int, y: int) -> List[Dict[str, Any]]:
+        """Rows of a dataset in a web mercator tile, up to POI_TILE_MAX_ROWS"""
+        tiles = 2 ** zoom
+        if not (0 <= x < tiles and 0 <= y < tiles):
+            raise ValueError("Tile coordinates out of range")
+        grid = await self._grid(table_name)
+        index_zoom = settings.POI_TILE_ZOOM
+
+        if zoom == index_zoom:
+            return (await self._index_tile(table_name, grid, x, y))[:settings.POI_TILE_MAX_ROWS]
+        if zoom > index_zoom:
+            # Inside a single index tile, filter its rows
+            shift = zoom - index_zoom
+            rows = await self._index_tile(table_name, grid, x >> shift, y >> shift)
+            south, west, north, east = tile_bounds(zoom, x, y)
+            return [
+                row for row in rows
+                if south <= row[grid.latitude] < north and west <= row[grid.longitude] < east
+            ][:settings.POI_TILE_MAX_ROWS]
+        if grid.complete:
+            shift = index_zoom - zoom
+            rows = [
+                row for (tile_x, tile_y), tile_rows in grid.tiles.items()
+                if tile_x >> shift == x and tile_y >> shift == y
+                for row in tile_rows
+            ]
+            return rows[:settings.POI_TILE_MAX_ROWS]
+        rows, _ = await self._read_tile(table_name, grid, zoom, x, y)
+        return rows
+
+    async def nearest(self, table_name: str, latitude: float, longitude: float, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Nearest rows of a dataset to a point, with their distance_m. Searches rings of index
+        tiles around the point until the nearest rows found are closer than any unsearched
+        tile, up to POI_NEAREST_MAX_RINGS rings.
+        """
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("Coordinates out of range")
+        grid = await self._grid(table_name)
+        zoom = settings.POI_TILE_ZOOM
+        tiles = 2 ** zoom
+        center_x, center_y = tile_of(latitude, longitude, zoom)
+
+        found = []
+        for ring in range(settings.POI_NEAREST_MAX_RINGS + 1):
+            # Columns wrap around the antimeridian, wide rings would otherwise visit them twice
+            columns = {(center_x + dx) % tiles for dx in range(-ring, ring + 1)}
+            for x in columns:
+                dx = min((x - center_x) % tiles, (center_x - x) % tiles)
+                for y in range(max(center_y - ring, 0), min(center_y + ring, tiles - 1) + 1):
+                    if max(dx, abs(y - center_y)) == ring:
+                        for row in await self._index_tile(table_name, grid, x, y):
+                            found.append((distance_meters(latitude, longitude, row[grid.latitude], row[grid.longitude]), row))
+
+            if len(found) >= limit:
+                # Rows outside the searched square are at least as far as its nearest edge; edge
+                # rows of the map hold everything beyond them and columns may cover every longitude
+                south, west, _, _ = tile_bounds(zoom, center_x - ring, center_y + ring)
+                _, _, north, east = tile_bounds(zoom, center_x + ring, center_y - ring)
+                south = -90 if center_y + ring >= tiles - 1 else south
+                north = 90 if center_y - ring <= 0 else north
+                edges = [
+                    distance_meters(latitude, longitude, south, longitude),
+                    distance_meters(latitude, longitude, north, longitude),
+                ]
+                if len(columns) < tiles:
+                    edges.append(meridian_distance_meters(latitude, longitude, west))
+                    edges.append(meridian_distance_meters(latitude, longitude, east))
+                reach = min(edges)
+                found.sort(key=lambda item: item[0])
+                if found[limit - 1][0] <= reach:
+                    break
+
+        found.sort(key=lambda item: item[0])
+        return [{**row, "distance_m": round(distance, 1)} for distance, row in found[:limit]]
+
+
+# Create a singleton instance
+poi_dataset_service = PoiDatasetService()
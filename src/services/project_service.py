@@ -1,5 +1,7 @@
+from typing import Optional
 from uuid import UUID
 from src.config import logger
+from src.schemas.project import ProjectClone
 from src.services.supabase_service import supabase_service
 
 class ProjectService:
@@ -14,58 +16,111 @@ class ProjectService:
             cls._instance = super(ProjectService, cls).__new__(cls)
         return cls._instance
 
+    async def create_project(
+        self,
+        user_id: str,
+        title: str,
+        site_type_id: UUID,
+        market_status_id: UUID,
+        is_active: bool = True,
+        client=None
+    ) -> Optional[dict]:
+        """
+        Create a project together with its template filters in a single call.
+        The project insert, the user_filters copy and the final select all run inside
+        the create_project_with_filters function (sql/project_functions.sql), so a
+        failure leaves no half-created project behind.
+        """
+        if client is None:
+            client = await supabase_service.client
+
+        response = await client.rpc("create_project_with_filters", {
+            "p_title": title,
+            "p_user_id": str(user_id),
+            "p_site_type_id": str(site_type_id),
+            "p_market_status_id": str(market_status_id),
+            "p_is_active": is_active
+        }).execute()
+
+        if not response.data:
+            logger.error(f"Failed to create project for user: {user_id}")
+            return None
+
+        return response.data
+
+    async def reconcile_filters(self, project_id: UUID, keep_values: bool = True, client=None) -> dict:
+        """
+        Bring a project's user_filters in line with the template of its current site type
+        and market status. Filters are matched on db_column_name/filter_type and the
+        inserts, updates and deletes are applied in one statement by the
+        reconcile_project_filters function (sql/project_functions.sql).
+        Returns the number of inserted, updated and deleted filters.
+        """
+        if client is None:
+            client = await supabase_service.client
+
+        response = await client.rpc("reconcile_project_filters", {
+            "p_project_id": str(project_id),
+            "p_keep_values": keep_values
+        }).execute()
+
+        result = response.data or {}
+        logger.info(
+            f"Reconciled filters for project {project_id} (keep_values={keep_values}): "
+            f"inserted={result.get('inserted', 0)}, updated={result.get('updated', 0)}, deleted={result.get('deleted', 0)}"
+        )
+        return result
+
+    async def clone_project(self, project_id: UUID, user_id: str, clone: ProjectClone, client=None) -> Optional[dict]:
+        """
+        Copy a project and all of its user_filters in one call, applying the optional
+        title, is_active and per-filter overrides. The copy is made by the clone_project
+        function (sql/project_functions.sql) and returned with all relations. Returns None
+        when the user has no project with that id.
+        """
+        if client is None:
+            client = await supabase_service.client
+
+        filter_overrides = [
+            override.model_dump(mode="json", exclude_none=True)
+            for override in clone.filter_overrides
+        ]
+
+        response = await client.rpc("clone_project", {
+            "p_project_id": str(project_id),
+            "p_user_id": str(user_id),
+            "p_title": clone.title,
+            "p_is_active": clone.is_active,
+            "p_filter_overrides": filter_overrides
+        }).execute()
+
+        if not response.data:
+            logger.error(f"Project {project_id} to clone not found for user: {user_id}")
+            return None
+
+        return response.data
+
     async def create_default_project(self, user_id: str) -> dict:
         """Create a default project for a new user"""
         try:
             client = await supabase_service.get_service_role_client()
-            
-            # Create default project data
-            project_data = {
-                "title": "My First Project",
-                "user_id": user_id,
-                "site_type_id": str(self.DEFAULT_SITE_TYPE_ID),
-                "market_status_id": str(self.DEFAULT_MARKET_STATUS_ID),
-                "is_active": True
-            }
-            
-            # Create the project
-            response = await client.table("projects").insert(project_data).execute()
-            
-            if not response.data:
+
+            project_result = await self.create_project(
+                user_id=user_id,
+                title="My First Project",
+                site_type_id=self.DEFAULT_SITE_TYPE_ID,
+                market_status_id=self.DEFAULT_MARKET_STATUS_ID,
+                is_active=True,
+                client=client
+            )
+
+            if not project_result:
                 logger.error(f"Failed to create default project for user: {user_id}")
                 return None
-            
-            project_result = response.data[0]
-            
-            # Fetch default filters for this site type and market status combination
-            filters_response = await client.table("site_type_market_status_filters").select(
-                """
-                *,
-                filters(*)
-                """
-            ).eq("site_type_id", str(self.DEFAULT_SITE_TYPE_ID)).eq("market_status_id", str(self.DEFAULT_MARKET_STATUS_ID)).execute()
-            
-            if filters_response.data:
-                # Create user_filters entries for each filter
-                user_filters = []
-                for filter_association in filters_response.data:
-                    filter_data = filter_association["filters"]
-                    user_filter = {
-                        "project_id": str(project_result["id"]),
-                        "filter_type": filter_data["filter_type"],
-                        "filter_data": filter_data["filter_data"],
-                        "db_column_name": filter_data["db_column_name"],
-                        "order": filter_data["order"],
-                        "is_open": filter_data["is_open"]
-                    }
-                    user_filters.append(user_filter)
-                    
-                if user_filters:
-                    await client.table("user_filters").insert(user_filters).execute()
-            
+
             logger.info(f"Successfully created default project for user: {user_id}")
             return project_result
-            
+
         except Exception as e:
             logger.error(f"Error creating default project for user {user_id}: {str(e)}")
             return None
@@ -0,0 +1,116 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+
+import httpx
+
+from src.config import logger, settings
+
+
+class ReadEndpoint:
+    """A Supabase API endpoint serving reads, with its clients, weight and health"""
+
+    def __init__(self, url: str, weight: int, is_primary: bool = False):
+        self.url = url.rstrip("/")
+        self.weight = weight
+        self.is_primary = is_primary
+        self.client = None
+        self.service_role_client = None
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.current_weight = 0
+        self.selected = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "primary": self.is_primary,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "selected": self.selected,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+def parse_read_endpoints() -> List[ReadEndpoint]:
+    """
+    Read endpoints from SUPABASE_READ_URLS (comma separated) and SUPABASE_READ_WEIGHTS (comma
+    separated, defaults to 1 each). The primary takes part with SUPABASE_PRIMARY_READ_WEIGHT.
+    """
+    urls = [url.strip() for url in (settings.SUPABASE_READ_URLS or "").split(",") if url.strip()]
+    weights = [int(weight) for weight in (settings.SUPABASE_READ_WEIGHTS or "").split(",") if weight.strip()]
+    endpoints = [ReadEndpoint(url, weights[index] if index < len(weights) else 1) for index, url in enumerate(urls)]
+    if endpoints and settings.SUPABASE_PRIMARY_READ_WEIGHT > 0:
+        endpoints.append(ReadEndpoint(settings.SUPABASE_URL, settings.SUPABASE_PRIMARY_READ_WEIGHT, is_primary=True))
+    return endpoints
+
+
+class ReplicaSet:
+    """
+    Picks read endpoints by smooth weighted round-robin among the healthy ones. A background
+    task probes every endpoint; an endpoint is taken out after READ_HEALTH_FAILURE_THRESHOLD
+    failed probes in a row and put back after the first successful one.
+    """
+
+    def __init__(self, endpoints: List[ReadEndpoint]):
+        self.endpoints = endpoints
+        self._health_task: Optional[asyncio.Task] = None
+
+    def pick(self) -> Optional[ReadEndpoint]:
+        """Next healthy endpoint, or None if there is none"""
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.healthy and endpoint.weight > 0]
+        if not healthy:
+            return None
+
+        total = 0
+        best = None
+        for endpoint in healthy:
+            endpoint.current_weight += endpoint.weight
+            total += endpoint.weight
+            if best is None or endpoint.current_weight > best.current_weight:
+                best = endpoint
+        best.current_weight -= total
+        best.selected += 1
+        return best
+
+    async def _probe(self, http_client: httpx.AsyncClient, endpoint: ReadEndpoint):
+        try:
+            response = await http_client.get(
+                f"{endpoint.url}/rest/v1/site_types",
+                params={"select": "id", "limit": "1"},
+                headers={"apikey": settings.SUPABASE_KEY, "Authorization": f"Bearer {settings.SUPABASE_KEY}"}
+            )
+            response.raise_for_status()
+        except Exception as e:
+            endpoint.consecutive_failures += 1
+            if endpoint.healthy and endpoint.consecutive_failures >= settings.READ_HEALTH_FAILURE_THRESHOLD:
+                endpoint.healthy = False
+                logger.warning(f"Read endpoint {endpoint.url} marked unhealthy: {str(e)}")
+            return
+
+        endpoint.consecutive_failures = 0
+        if not endpoint.healthy:
+            endpoint.healthy = True
+            logger.info(f"Read endpoint {endpoint.url} is healthy again")
+
+    async def _health_loop(self, transport: httpx.AsyncBaseTransport):
+        # Probes use the connection pool directly so replica failures do not trip the circuit breaker
+        http_client = httpx.AsyncClient(transport=transport, timeout=settings.SUPABASE_CONNECT_TIMEOUT)
+        while True:
+            await asyncio.gather(*(self._probe(http_client, endpoint) for endpoint in self.endpoints))
+            await asyncio.sleep(settings.READ_HEALTH_CHECK_INTERVAL)
+
+    def start_health_checks(self, transport: httpx.AsyncBaseTransport):
+        if self._health_task is None and self.endpoints:
+            self._health_task = asyncio.create_task(self._health_loop(transport))
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        return [endpoint.metrics() for endpoint in self.endpoints]
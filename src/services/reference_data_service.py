@@ -0,0 +1,168 @@
+from typing import Any, Dict, FrozenSet, List, Optional
+from uuid import UUID
+import time
+
+from src.config import logger, settings
+from src.services.cache_service import cache_service
+from src.services.pg_service import PG_TABLE_COLUMNS, pg_service
+from src.services.supabase_service import supabase_service
+
+
+# Cache namespaces for reference data, invalidated by the admin endpoints that change it
+SITE_TYPES = "site_types"
+MARKET_STATUSES = "market_status"
+POI = "poi"
+DEFAULT_FILTERS = "default_filters"
+TABLE_COLUMNS = "table_columns"
+PROPERTY_COUNT = "property_count"
+# Tiles of uploaded POI datasets by table, see PoiDatasetService
+POI_GRID = "poi_grid"
+
+# Namespaces to invalidate when rows of a table change
+TABLE_CACHES = {
+    "filters": (DEFAULT_FILTERS,),
+    "site_type_market_status_filters": (DEFAULT_FILTERS,),
+    # POI rows embed their site type name
+    "site_types": (SITE_TYPES, POI, DEFAULT_FILTERS),
+    "market_status": (MARKET_STATUSES, DEFAULT_FILTERS),
+    "poi": (POI,),
+}
+
+
+class ReferenceDataService:
+    """Cached reads of the small, rarely changing lookup tables used by every page"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ReferenceDataService, cls).__new__(cls)
+            # namespace -> monotonic time until which it is reloaded from the primary
+            cls._instance._primary_until = {}
+        return cls._instance
+
+    async def _read_client(self, namespace: str):
+        """
+        Client to reload a namespace with. Right after an invalidation a lagging read replica
+        could put the old rows back in the cache for the whole TTL, so those reloads use the primary.
+        """
+        if self._primary_until.get(namespace, 0) > time.monotonic():
+            return await supabase_service.client
+        return await supabase_service.read_client()
+
+    async def get_site_types(self) -> List[Dict[str, Any]]:
+        """Get all site types ordered by order"""
+        async def load():
+            supabase = await self._read_client(SITE_TYPES)
+            response = await supabase.table("site_types").select("id, name, icon, order").order("order").execute()
+            return response.data or []
+
+        return await cache_service.get_or_load(SITE_TYPES, load)
+
+    async def get_market_statuses(self) -> List[Dict[str, Any]]:
+        """Get all market statuses"""
+        async def load():
+            supabase = await self._read_client(MARKET_STATUSES)
+            response = await supabase.table("market_status").select("id, name").execute()
+            return response.data or []
+
+        return await cache_service.get_or_load(MARKET_STATUSES, load)
+
+    async def get_poi(self) -> List[Dict[str, Any]]:
+        """Get all points of interest with their site type name, ordered by order"""
+        async def load():
+            supabase = await self._read_client(POI)
+            response = await supabase.table("poi").select(
+                """
+                id,
+                created_at,
+                name,
+                db_column_name,
+                details_table_name,
+                icon_svg,
+                order,
+                site_type_id,
+                site_types(name),
+                details_table_name
+                """
+            ).order("order").execute()
+            return response.data or []
+
+        return await cache_service.get_or_load(POI, load)
+
+    async def get_default_filters(self, site_type_id: UUID, market_status_id: UUID) -> List[Dict[str, Any]]:
+        """Get the template filters of a site type and market status combination, ordered by order"""
+        async def load():
+            if pg_service.enabled:
+                return await pg_service.get_default_filters(site_type_id, market_status_id)
+
+            supabase = await self._read_client(DEFAULT_FILTERS)
+            response = await supabase.table("site_type_market_status_filters").select(
+                """
+                *,
+                filters(
+                    id,
+                    filter_type,
+                    filter_data,
+                    db_column_name,
+                    order,
+                    is_open,
+                    display_name
+                )
+                """
+            ).eq("site_type_id", str(site_type_id)).eq("market_status_id", str(market_status_id)).execute()
+
+            filters = [item["filters"] for item in (response.data or []) if item["filters"]]
+            return sorted(filters, key=lambda x: x["order"])
+
+        return await cache_service.get_or_load(
+            DEFAULT_FILTERS,
+            load,
+            key=(str(site_type_id), str(market_status_id))
+        )
+
+    async def get_table_columns(self, table_name: str) -> Optional[FrozenSet[str]]:
+        """
+        Get the column names of a table from the PostgREST schema.
+        Returns None if the schema could not be read, so callers can fall back to probing the table.
+        """
+        async def load():
+            supabase = await supabase_service.get_service_role_client()
+            response = await supabase.postgrest.session.get("", headers={"Accept": "application/openapi+json"})
+            response.raise_for_status()
+            definitions = response.json().get("definitions", {})
+            return {name: frozenset(definition.get("properties", {})) for name, definition in definitions.items()}
+
+        try:
+            tables = await cache_service.get_or_load(TABLE_COLUMNS, load, ttl=settings.SCHEMA_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not read the PostgREST schema: {str(e)}")
+            return None
+        return tables.get(table_name)
+
+    async def get_property_count(self) -> int:
+        """Get the number of rows in the property table, refreshed every PROPERTY_SNAPSHOT_TTL seconds"""
+        async def load():
+            supabase = await supabase_service.read_client()
+            response = await supabase.table(settings.PROPERTY_TABLE_NAME).select("id", count="exact").limit(0).execute()
+            return response.count or 0
+
+        return await cache_service.get_or_load(PROPERTY_COUNT, load, ttl=settings.PROPERTY_SNAPSHOT_TTL)
+
+    def invalidate_table(self, table_name: str):
+        """Invalidate every cache that holds data from table_name"""
+        namespaces = TABLE_CACHES.get(table_name)
+        if namespaces:
+            cache_service.invalidate(*namespaces)
+            until = time.monotonic() + settings.READ_AFTER_WRITE_WINDOW
+            for namespace in namespaces:
+                self._primary_until[namespace] = until
+
+    def invalidate_dataset(self, table_name: str):
+        """Invalidate what is cached about a dataset table that was created or replaced by an upload"""
+        cache_service.invalidate(TABLE_COLUMNS)
+        cache_service.invalidate(PG_TABLE_COLUMNS, key=table_name)
+        cache_service.invalidate(POI_GRID, key=table_name)
+
+
+# Create a singleton instance
+reference_data_service = ReferenceDataService()
@@ -0,0 +1,223 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import random
+import time
+
+import httpx
+
+from src.config import logger, settings
+from src.middleware.request_context import remaining_budget
+
+
+# Statuses that mean the backend (or the gateway in front of it) is unhealthy
+UNHEALTHY_STATUSES = (502, 503, 504)
+# Only these requests are retried and served stale; PostgREST reads and Auth lookups use GET
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+# Only PostgREST reads are served stale, never Auth responses such as token validation
+STALE_CACHE_PATH = "/rest/v1/"
+# Request headers that change the response of a read, part of the stale cache key
+CACHE_KEY_HEADERS = ("authorization", "apikey", "accept", "accept-profile", "prefer", "range")
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of calling Supabase while the circuit breaker is open"""
+
+
+class DeadlineExceededError(httpx.TimeoutException):
+    """Raised when the request's time budget is used up before a Supabase call"""
+
+
+# Raised instead of a Supabase response; callers re-raise them past their generic error handling
+# so main.py answers 503 or 504 rather than 500, or 401 for an auth check
+UPSTREAM_ERRORS = (CircuitOpenError, DeadlineExceededError)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for reset_timeout
+    seconds. After that one trial call is let through per reset_timeout: success closes the
+    breaker, failure keeps it open.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opens = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            # Restart the window so only one trial call goes through
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("Supabase circuit breaker closed")
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self.opens += 1
+            logger.warning(f"Supabase circuit breaker opened after {self.failures} failures")
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps the Supabase transport with a per-request deadline budget, jittered retries of
+    idempotent reads, a circuit breaker, and a bounded cache of successful reads that is
+    served when the backend is unavailable.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.breaker = CircuitBreaker(settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_TIMEOUT)
+        self._stale: "OrderedDict[str, Tuple[float, int, list, bytes]]" = OrderedDict()
+        self._stats = {
+            "retries": 0,
+            "failures": 0,
+            "short_circuited": 0,
+            "budget_exhausted": 0,
+            "stale_served": 0,
+        }
+
+    @staticmethod
+    def _cache_key(request: httpx.Request) -> str:
+        parts = [request.method, str(request.url)]
+        parts.extend(request.headers.get(name, "") for name in CACHE_KEY_HEADERS)
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    async def _store(self, key: str, response: httpx.Response) -> httpx.Response:
+        """Keep the raw body of a successful read and return an equivalent response"""
+        # Raw (still encoded) bytes, the client decodes them as usual
+        body = b"".join([chunk async for chunk in response.stream])
+        await response.aclose()
+        if len(body) <= settings.STALE_CACHE_MAX_BYTES:
+            self._stale[key] = (time.monotonic(), response.status_code, response.headers.raw, body)
+            self._stale.move_to_end(key)
+            while len(self._stale) > settings.STALE_CACHE_MAX_ENTRIES:
+                self._stale.popitem(last=False)
+        return httpx.Response(response.status_code, headers=response.headers.raw, content=body, extensions=response.extensions)
+
+    def _serve_stale(self, key: Optional[str], request: httpx.Request) -> Optional[httpx.Response]:
+        entry = self._stale.get(key) if key else None
+        if entry is None:
+            return None
+        stored_at, status_code, headers, body = entry
+        if time.monotonic() - stored_at > settings.STALE_CACHE_MAX_AGE:
+            del self._stale[key]
+            return None
+
+        self._stats["stale_served"] += 1
+        logger.warning(f"Serving stale response for {request.method} {request.url.path}")
+        return httpx.Response(status_code, headers=headers, content=body, request=request)
+
+    @staticmethod
+    def _apply_budget(request: httpx.Request, remaining: Optional[float]):
+        """Cap the connect/read/write/pool timeouts of the request to the remaining budget"""
+        if remaining is None:
+            return
+        timeout = dict(request.extensions.get("timeout") or {})
+        for name in ("connect", "read", "write", "pool"):
+            value = timeout.get(name)
+            timeout[name] = remaining if value is None else min(value, remaining)
+        request.extensions["timeout"] = timeout
+
+    async def _backoff(self, attempt: int) -> bool:
+        """Sleep before retry number attempt + 1, returns False if there is no attempt or budget left"""
+        if attempt >= settings.SUPABASE_RETRY_ATTEMPTS:
+            return False
+        delay = random.uniform(0, min(settings.SUPABASE_RETRY_MAX_DELAY, settings.SUPABASE_RETRY_BASE_DELAY * 2 ** attempt))
+        remaining = remaining_budget()
+        if remaining is not None and delay >= remaining:
+            return False
+        self._stats["retries"] += 1
+        await asyncio.sleep(delay)
+        return True
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        idempotent = request.method in IDEMPOTENT_METHODS
+        cache_key = self._cache_key(request) if request.method == "GET" and STALE_CACHE_PATH in request.url.path else None
+
+        if not self.breaker.allow():
+            self._stats["short_circuited"] += 1
+            stale = self._serve_stale(cache_key, request)
+            if stale is not None:
+                return stale
+            raise CircuitOpenError("Supabase is unavailable (circuit breaker open)", request=request)
+
+        attempt = 0
+        while True:
+            remaining = remaining_budget()
+            if remaining is not None and remaining <= 0:
+                self._stats["budget_exhausted"] += 1
+                stale = self._serve_stale(cache_key, request)
+                if stale is not None:
+                    return stale
+                raise DeadlineExceededError("Request time budget exhausted", request=request)
+            self._apply_budget(request, remaining)
+
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                budget_left = remaining_budget()
+                if isinstance(e, httpx.TimeoutException) and budget_left is not None and budget_left <= 0:
+                    # Cut short by this request's budget, not a sign of an unhealthy backend
+                    self._stats["budget_exhausted"] += 1
+                    stale = self._serve_stale(cache_key, request)
+                    if stale is not None:
+                        return stale
+                    raise DeadlineExceededError("Request time budget exhausted", request=request) from e
+
+                self._stats["failures"] += 1
+                self.breaker.record_failure()
+                if idempotent and await self._backoff(attempt):
+                    attempt += 1
+                    continue
+                stale = self._serve_stale(cache_key, request)
+                if stale is not None:
+                    return stale
+                raise
+
+            if response.status_code in UNHEALTHY_STATUSES:
+                self._stats["failures"] += 1
+                self.breaker.record_failure()
+                if idempotent and await self._backoff(attempt):
+                    await response.aclose()
+                    attempt += 1
+                    continue
+                stale = self._serve_stale(cache_key, request)
+                if stale is not None:
+                    await response.aclose()
+                    return stale
+                return response
+
+            self.breaker.record_success()
+            if cache_key and response.status_code == 200:
+                return await self._store(cache_key, response)
+            return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Retry, breaker, budget and stale cache counters"""
+        return {
+            **self._stats,
+            "breaker_state": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "consecutive_failures": self.breaker.failures,
+            "stale_entries": len(self._stale),
+        }
@@ -1,28 +1,151 @@
-from supabase import acreate_client, Client
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import time
+
+import httpx
+from supabase import Client
+from supabase._async.client import AsyncClient
 from src.config import settings, logger
+from src.middleware.request_context import request_state
+from src.services.http_pool import PooledTransport
+from src.services.read_replicas import ReadEndpoint, ReplicaSet, parse_read_endpoints
+from src.services.resilience import ResilientTransport
 from functools import lru_cache
 from uuid import UUID
 
 
+class PooledClient(AsyncClient):
+    """
+    Supabase client whose PostgREST and Auth requests go through the shared transport.
+    supabase-py has no option to pass an httpx client in, so the sessions it builds are
+    swapped for ones using the pool; the PostgREST client is rebuilt on auth events, so the
+    swap happens every time it is created.
+    """
+    transport: Optional[httpx.AsyncBaseTransport] = None
+    timeout: Optional[httpx.Timeout] = None
+    request_hooks: List[Callable[[httpx.Request], Awaitable[None]]] = []
+    # Closing of the replaced PostgREST sessions, referenced until done
+    _closing: Set[asyncio.Task] = set()
+
+    async def use_transport(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        timeout: httpx.Timeout,
+        request_hooks: Optional[List[Callable[[httpx.Request], Awaitable[None]]]] = None
+    ):
+        self.transport = transport
+        self.timeout = timeout
+        self.request_hooks = request_hooks or []
+        self._postgrest = None
+
+        # Close the clients supabase-py created for Auth before replacing them
+        for http_client in {id(client): client for client in (self.auth._http_client, self.auth.admin._http_client)}.values():
+            await http_client.aclose()
+        auth_http_client = httpx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=True)
+        self.auth._http_client = auth_http_client
+        self.auth.admin._http_client = auth_http_client
+
+    @property
+    def postgrest(self):
+        postgrest = super().postgrest
+        if self.transport is not None and postgrest.session._transport is not self.transport:
+            # The property is synchronous, the session supabase-py created is closed in the background
+            task = asyncio.get_running_loop().create_task(postgrest.session.aclose())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+            postgrest.session = httpx.AsyncClient(
+                base_url=postgrest.session.base_url,
+                headers=postgrest.session.headers,
+                timeout=self.timeout,
+                follow_redirects=True,
+                transport=self.transport,
+                event_hooks={"request": list(self.request_hooks)},
+            )
+        return postgrest
+
+
 class SupabaseService:
     _instance = None
     _client: Client = None
     _service_role_client: Client = None
+    _transport: PooledTransport = None
+    _resilient_transport: ResilientTransport = None
+    _replicas: ReplicaSet = None
+    # user_id -> monotonic time until which the user's reads go to the primary
+    _primary_until: Dict[str, float] = {}
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(SupabaseService, cls).__new__(cls)
         return cls._instance
 
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            settings.SUPABASE_TIMEOUT,
+            connect=settings.SUPABASE_CONNECT_TIMEOUT,
+            pool=settings.SUPABASE_POOL_TIMEOUT
+        )
+
+    def _get_transport(self) -> ResilientTransport:
+        """Create the connection pool shared by both clients, wrapped in the resilience layer, on first use"""
+        if self._transport is None:
+            limits = httpx.Limits(
+                max_connections=settings.SUPABASE_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SUPABASE_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=settings.SUPABASE_POOL_KEEPALIVE_EXPIRY
+            )
+            self._transport = PooledTransport(limits=limits, http2=settings.SUPABASE_HTTP2)
+            logger.info(
+                f"Opened Supabase connection pool (max_connections={limits.max_connections}, "
+                f"max_keepalive={limits.max_keepalive_connections}, http2={settings.SUPABASE_HTTP2})"
+            )
+            self._resilient_transport = ResilientTransport(self._transport)
+        return self._resilient_transport
+
+    async def _record_write(self, request: httpx.Request):
+        """Keep the reads of this request, and of its user for a short while, on the primary"""
+        if request.method in ("GET", "HEAD"):
+            return
+        state = request_state()
+        if state is None:
+            return
+
+        state["wrote"] = True
+        user_id = state.get("user_id")
+        if user_id:
+            self.record_user_write(user_id)
+
+    def record_user_write(self, user_id: str):
+        """Keep a user's reads on the primary for READ_AFTER_WRITE_WINDOW, for writes made outside their request"""
+        now = time.monotonic()
+        if len(self._primary_until) > 10000:
+            self._primary_until = {key: until for key, until in self._primary_until.items() if until > now}
+        self._primary_until[str(user_id)] = now + settings.READ_AFTER_WRITE_WINDOW
+
+    def _reads_need_primary(self) -> bool:
+        state = request_state()
+        if state is None:
+            return False
+        if state.get("wrote"):
+            return True
+        user_id = state.get("user_id")
+        return bool(user_id) and self._primary_until.get(str(user_id), 0) > time.monotonic()
+
+    async def _create_client(self, key: str, url: Optional[str] = None, primary: bool = True) -> Client:
+        client = await PooledClient.create(url or settings.SUPABASE_URL, key)
+        await client.use_transport(self._get_transport(), self.timeout, request_hooks=[self._record_write] if primary else None)
+        return client
+
     async def initialize(self):
         """Initialize the Supabase client"""
         if self._client is None:
             if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
                 raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
-            
+
             logger.info(f"Initializing Supabase client with URL: {settings.SUPABASE_URL}")
             try:
-                self._client = await acreate_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+                self._client = await self._create_client(settings.SUPABASE_KEY)
                 logger.info("Supabase client initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize Supabase client: {str(e)}")
@@ -33,18 +156,74 @@ class SupabaseService:
         if self._service_role_client is None:
             if not settings.SUPABASE_URL or not settings.SUPABASE_SERVICE_ROLE_KEY:
                 raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in environment variables")
-            
+
             logger.info("Initializing Supabase service role client")
             try:
-                self._service_role_client = await acreate_client(
-                    settings.SUPABASE_URL, 
-                    settings.SUPABASE_SERVICE_ROLE_KEY
-                )
+                self._service_role_client = await self._create_client(settings.SUPABASE_SERVICE_ROLE_KEY)
                 logger.info("Supabase service role client initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize Supabase service role client: {str(e)}")
                 raise
 
+    async def _replica_client(self, endpoint: ReadEndpoint, service_role: bool) -> Client:
+        """Clients of a read endpoint, created on first use"""
+        if endpoint.client is None:
+            endpoint.client = await self._create_client(settings.SUPABASE_KEY, endpoint.url, primary=False)
+            endpoint.service_role_client = await self._create_client(
+                settings.SUPABASE_SERVICE_ROLE_KEY, endpoint.url, primary=False
+            )
+        return endpoint.service_role_client if service_role else endpoint.client
+
+    async def open(self):
+        """Open the connection pool and start the read endpoint health checks, called on application startup"""
+        self._get_transport()
+        if self._replicas is None:
+            self._replicas = ReplicaSet(parse_read_endpoints())
+            if self._replicas.endpoints:
+                logger.info(f"Routing reads to {len(self._replicas.endpoints)} read endpoints")
+        self._replicas.start_health_checks(self._transport)
+
+    async def close(self):
+        """Drop all clients and close every pooled connection, called on application shutdown"""
+        if self._replicas is not None:
+            await self._replicas.stop_health_checks()
+            self._replicas = None
+        self._client = None
+        self._service_role_client = None
+        if self._transport is not None:
+            await self._resilient_transport.aclose()
+            self._transport = None
+            self._resilient_transport = None
+            logger.info("Closed Supabase connection pool")
+
+    def pool_metrics(self) -> Dict[str, Any]:
+        """Saturation and wait-time metrics of the shared connection pool"""
+        if self._transport is None:
+            return {"open": False}
+        return {"open": True, **self._transport.metrics()}
+
+    def resilience_metrics(self) -> Dict[str, Any]:
+        """Retry, circuit breaker, budget and stale cache counters"""
+        if self._resilient_transport is None:
+            return {}
+        return self._resilient_transport.metrics()
+
+    def replica_metrics(self) -> List[Dict[str, Any]]:
+        """Weight, health and selection count of each read endpoint"""
+        return self._replicas.metrics() if self._replicas is not None else []
+
+    async def read_client(self, service_role: bool = False) -> Client:
+        """
+        Get a client for read-only queries: a healthy read endpoint picked by weighted round-robin,
+        or the primary when there is none, or when this request or user has just written
+        """
+        endpoint = None
+        if self._replicas is not None and not self._reads_need_primary():
+            endpoint = self._replicas.pick()
+        if endpoint is None or endpoint.is_primary:
+            return await self.get_service_role_client() if service_role else await self.client
+        return await self._replica_client(endpoint, service_role)
+
     @property
     async def client(self) -> Client:
         """Get the Supabase client instance"""
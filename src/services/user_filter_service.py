@@ -0,0 +1,271 @@
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+import asyncio
+
+from src.config import logger, settings
+from src.services.supabase_service import supabase_service
+
+
+class UserFilterService:
+    _instance = None
+
+    # Columns of user_filters that can be changed through the filters API, with their expected types
+    UPDATABLE_FIELDS = {
+        "filter_type": (str,),
+        "filter_data": (dict,),
+        "db_column_name": (str,),
+        "display_name": (str,),
+        "order": (int,),
+        "is_open": (bool,),
+    }
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(UserFilterService, cls).__new__(cls)
+            # Write-behind buffer: latest pending fields per filter id and the user who wrote them
+            cls._instance._pending = {}
+            cls._instance._pending_owners = {}
+            # filter id -> owning user, filters never change owner
+            cls._instance._owners = {}
+            cls._instance._flush_lock = asyncio.Lock()
+            cls._instance._flush_task = None
+            cls._instance._stats = {
+                "buffered_updates": 0,
+                "flushed_rows": 0,
+                "flushes": 0,
+                "failed_flushes": 0,
+            }
+        return cls._instance
+
+    @property
+    def write_behind_enabled(self) -> bool:
+        return settings.FILTER_WRITE_BEHIND
+
+    def validate_batch(self, updates: List[dict]) -> Tuple[Dict[str, dict], Dict[str, int], List[Dict[str, Any]]]:
+        """
+        Validate a batch of filter updates before anything is written.
+        Returns the valid updates keyed by filter id (later updates of the same id are merged
+        over earlier ones), the index of the last update of each id, and a list of per-item
+        errors for the invalid ones.
+        """
+        valid_updates: Dict[str, dict] = {}
+        indexes: Dict[str, int] = {}
+        errors: List[Dict[str, Any]] = []
+
+        for index, update in enumerate(updates):
+            if not isinstance(update, dict):
+                errors.append({"index": index, "id": None, "error": "Update must be an object"})
+                continue
+
+            filter_id = update.get("id")
+            if not filter_id:
+                errors.append({"index": index, "id": None, "error": "Missing 'id' in update"})
+                continue
+
+            try:
+                filter_id = str(UUID(str(filter_id)))
+            except ValueError:
+                errors.append({"index": index, "id": filter_id, "error": "Invalid filter id"})
+                continue
+
+            update_data = {k: v for k, v in update.items() if k != "id"}
+            if not update_data:
+                errors.append({"index": index, "id": filter_id, "error": "No fields to update"})
+                continue
+
+            field_errors = []
+            for key, value in update_data.items():
+                expected_types = self.UPDATABLE_FIELDS.get(key)
+                if expected_types is None:
+                    field_errors.append(f"Unknown field '{key}'")
+                elif value is None and key in ("filter_type", "filter_data", "order", "is_open"):
+                    field_errors.append(f"Field '{key}' cannot be null")
+                elif value is not None and not isinstance(value, expected_types):
+                    field_errors.append(f"Invalid value for '{key}'")
+                elif key == "order" and isinstance(value, bool):
+                    field_errors.append(f"Invalid value for '{key}'")
+
+            if field_errors:
+                errors.append({"index": index, "id": filter_id, "error": "; ".join(field_errors)})
+                continue
+
+            valid_updates.setdefault(filter_id, {}).update(update_data)
+            indexes[filter_id] = index
+
+        return valid_updates, indexes, errors
+
+    async def apply_updates(self, updates: Dict[str, dict], client=None) -> List[Dict[str, Any]]:
+        """
+        Apply already validated updates (keyed by filter id) with a single call to the
+        update_user_filters_batch function (sql/user_filter_functions.sql).
+        Returns the updated rows.
+        """
+        if not updates:
+            return []
+
+        if client is None:
+            client = await supabase_service.client
+
+        payload = [{"id": filter_id, **update_data} for filter_id, update_data in updates.items()]
+        response = await client.rpc("update_user_filters_batch", {"p_updates": payload}).execute()
+        return response.data or []
+
+    async def update_filters_batch(self, updates: List[dict], user_id: str) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Validate and apply a batch of filter updates in one round trip.
+        Returns the updated rows in request order and the per-item errors, so a bad
+        item does not prevent the rest of the batch from being saved.
+        In write-behind mode the updates are buffered and their pending state is returned.
+        """
+        valid_updates, indexes, errors = self.validate_batch(updates)
+
+        if self.write_behind_enabled:
+            data, unknown_ids = await self.buffer_updates(user_id, valid_updates)
+            for filter_id in unknown_ids:
+                errors.append({"index": indexes[filter_id], "id": filter_id, "error": "Filter not found or update failed"})
+            return {"data": data, "errors": errors}
+
+        rows = await self.apply_updates(valid_updates)
+        rows_by_id = {str(row["id"]): row for row in rows}
+
+        data = []
+        for filter_id in valid_updates:
+            row = rows_by_id.get(filter_id)
+            if row is None:
+                logger.error(f"No data returned from update operation for filter {filter_id}")
+                errors.append({"index": indexes[filter_id], "id": filter_id, "error": "Filter not found or update failed"})
+            else:
+                data.append(row)
+
+        logger.info(f"Updated {len(data)} filters in batch, {len(errors)} failed")
+        return {"data": data, "errors": errors}
+
+
+    # WRITE-BEHIND
+    # Slider moves in the UI send a PATCH per step, and most of them are overwritten within
+    # a second. With FILTER_WRITE_BEHIND enabled, filter updates are acknowledged straight
+    # away and only the latest value per filter id is kept in memory. The buffer is flushed
+    # in bulk every FILTER_WRITE_BEHIND_INTERVAL seconds, whenever the owning user reads a
+    # project (read-your-writes), and on shutdown.
+    # The buffer lives in the process, so this mode assumes a single worker per instance.
+
+    async def _owned_filter_ids(self, user_id: str, filter_ids: List[str]) -> List[str]:
+        """The filter ids that belong to a project of user_id, remembered so repeated edits skip the lookup"""
+        user_id = str(user_id)
+        unchecked = [fid for fid in filter_ids if fid not in self._owners]
+        if unchecked:
+            supabase = await supabase_service.get_service_role_client()
+            response = await supabase.table("user_filters").select(
+                "id, projects!inner(user_id)"
+            ).in_("id", unchecked).execute()
+            if len(self._owners) + len(response.data or []) > settings.FILTER_OWNER_CACHE_SIZE:
+                self._owners.clear()
+            for row in response.data or []:
+                self._owners[str(row["id"])] = str(row["projects"]["user_id"])
+        return [fid for fid in filter_ids if self._owners.get(fid) == user_id]
+
+    async def buffer_updates(self, user_id: str, updates: Dict[str, dict]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Merge validated updates (keyed by filter id) into the write-behind buffer.
+        Returns the pending state of each filter as the acknowledgement, and the ids of the
+        filters that do not exist or belong to another user, which are not buffered.
+        """
+        owned = set(await self._owned_filter_ids(user_id, list(updates)))
+        unknown_ids = [filter_id for filter_id in updates if filter_id not in owned]
+        if unknown_ids:
+            logger.warning(f"Rejected buffered updates for unknown or foreign filters: {unknown_ids}")
+
+        acknowledged = []
+        for filter_id, update_data in updates.items():
+            if filter_id not in owned:
+                continue
+            pending = self._pending.setdefault(filter_id, {})
+            pending.update(update_data)
+            self._pending_owners[filter_id] = str(user_id)
+            self._stats["buffered_updates"] += 1
+            acknowledged.append({"id": filter_id, **pending})
+        return acknowledged, unknown_ids
+
+    async def flush(self, user_id: Optional[str] = None) -> int:
+        """
+        Write pending filter updates with one bulk call.
+        When user_id is given only that user's pending updates are flushed.
+        Returns the number of rows written.
+        """
+        async with self._flush_lock:
+            if user_id is None:
+                filter_ids = list(self._pending)
+            else:
+                filter_ids = [fid for fid, owner in self._pending_owners.items() if owner == str(user_id)]
+
+            if not filter_ids:
+                return 0
+
+            batch = {fid: self._pending.pop(fid) for fid in filter_ids}
+            owners = {fid: self._pending_owners.pop(fid) for fid in filter_ids}
+
+            try:
+                rows = await self.apply_updates(batch)
+            except Exception as e:
+                # Put the updates back, underneath anything that was buffered in the meantime
+                for fid, update_data in batch.items():
+                    self._pending[fid] = {**update_data, **self._pending.get(fid, {})}
+                    self._pending_owners.setdefault(fid, owners[fid])
+                self._stats["failed_flushes"] += 1
+                logger.error(f"Error flushing {len(batch)} buffered filter updates: {str(e)}")
+                raise
+
+            # The flush runs outside the owners' requests, keep their next reads on the primary
+            for owner in set(owners.values()):
+                supabase_service.record_user_write(owner)
+
+            written_ids = {str(row["id"]) for row in rows}
+            missing_ids = [fid for fid in batch if fid not in written_ids]
+            if missing_ids:
+                logger.warning(f"Dropped buffered updates for unknown filters: {missing_ids}")
+
+            self._stats["flushes"] += 1
+            self._stats["flushed_rows"] += len(rows)
+            logger.info(f"Flushed {len(rows)} buffered filter updates")
+            return len(rows)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.FILTER_WRITE_BEHIND_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                # Already logged and re-queued by flush, retry on the next tick
+                pass
+
+    def start_write_behind(self):
+        """Start the periodic flush of the write-behind buffer"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+            logger.info(f"Filter write-behind enabled, flushing every {settings.FILTER_WRITE_BEHIND_INTERVAL}s")
+
+    async def stop_write_behind(self):
+        """Stop the periodic flush and write everything that is still pending"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        try:
+            await self.flush()
+        except Exception:
+            # Already logged by flush, do not abort the rest of the shutdown
+            logger.error(f"Lost {len(self._pending)} buffered filter updates at shutdown")
+
+    def write_behind_stats(self) -> Dict[str, Any]:
+        """Counters for the write-behind buffer"""
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+        }
+
+
+# Create a singleton instance
+user_filter_service = UserFilterService()
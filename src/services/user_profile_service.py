@@ -1,6 +1,8 @@
 from uuid import UUID
 from src.schemas.user_profile import UserProfileCreate, UserProfileUpdate, UserProfileResponse
 from src.services.supabase_service import supabase_service
+from src.services.data_loader import get_loader
+from src.services.auth_user_service import auth_user_service
 from src.config import logger
 
 class UserProfileService:
@@ -14,86 +16,75 @@ class UserProfileService:
                 converted_data[key] = value
         return converted_data
 
+    def _prime_loaders(self, row: dict):
+        """Share a freshly written profile row with later lookups in the same request"""
+        get_loader('user_profile').prime(row['id'], row)
+        get_loader('user_profile', key_column='user_id').prime(row['user_id'], row)
+
+    async def _with_auth_user_data(self, profile_data: dict) -> dict:
+        """Attach the email and image_url of the profile's auth user, served from the auth user cache"""
+        user_id = profile_data['user_id']
+        try:
+            profile_data.update(await auth_user_service.get(user_id))
+        except Exception as auth_e:
+            logger.warning(f"Could not fetch auth user data for user {user_id}: {str(auth_e)}")
+            profile_data['email'] = None
+            profile_data['image_url'] = None
+        return profile_data
+
     async def create_profile(self, profile: UserProfileCreate) -> UserProfileResponse:
         """Create a new user profile"""
         client = await supabase_service.client
         try:
             # Check if profile already exists
-            existing_result = await client.table('user_profile').select("id").eq('user_id', str(profile.user_id)).execute()
-            if existing_result.data:
+            existing_profile = await get_loader('user_profile', key_column='user_id').load(profile.user_id)
+            if existing_profile:
                 logger.warning(f"Profile already exists for user_id: {profile.user_id}")
-                return UserProfileResponse(**existing_result.data[0])
+                return UserProfileResponse(**existing_profile)
             
             # Convert UUIDs to strings for Supabase
             profile_data = self._convert_uuids_to_strings(profile.model_dump())
             
             result = await client.table('user_profile').insert(profile_data).execute()
+            self._prime_loaders(result.data[0])
             return UserProfileResponse(**result.data[0])
         except Exception as e:
             logger.error(f"Error creating user profile: {str(e)}")
             raise
 
+    async def get_profile_owner(self, profile_id: UUID) -> str:
+        """Get the user_id of a profile, or None if it does not exist"""
+        row = await get_loader('user_profile').load(profile_id)
+        return str(row['user_id']) if row else None
+
     async def get_profile_by_user_id(self, user_id: UUID) -> UserProfileResponse:
         """Get a user profile by user_id"""
-        client = await supabase_service.client
         try:
             # Get user profile data
-            result = await client.table('user_profile').select("*").eq('user_id', str(user_id)).execute()
+            row = await get_loader('user_profile', key_column='user_id').load(user_id)
             
-            if not result.data:
+            if not row:
                 return None
             
-            profile_data = result.data[0]
-            
-            # Get auth user data using admin client
-            try:
-                admin_client = await supabase_service.get_service_role_client()
-                auth_result = await admin_client.auth.admin.get_user_by_id(str(user_id))
-                
-                if auth_result.user:
-                    profile_data['email'] = auth_result.user.email
-                    # Check for image_url in user_metadata (common with OAuth providers)
-                    user_metadata = auth_result.user.user_metadata or {}
-                    profile_data['image_url'] = user_metadata.get('avatar_url') or user_metadata.get('picture')
-            except Exception as auth_e:
-                logger.warning(f"Could not fetch auth user data for user {user_id}: {str(auth_e)}")
-                profile_data['email'] = None
-                profile_data['image_url'] = None
+            profile_data = dict(row)
             
-            return UserProfileResponse(**profile_data)
+            return UserProfileResponse(**await self._with_auth_user_data(profile_data))
         except Exception as e:
             logger.error(f"Error getting user profile: {str(e)}")
             raise
 
     async def get_profile(self, profile_id: UUID) -> UserProfileResponse:
         """Get a user profile by profile id"""
-        client = await supabase_service.client
         try:
             # Get user profile data
-            result = await client.table('user_profile').select("*").eq('id', str(profile_id)).execute()
+            row = await get_loader('user_profile').load(profile_id)
             
-            if not result.data:
+            if not row:
                 return None
             
-            profile_data = result.data[0]
-            user_id = profile_data['user_id']
-            
-            # Get auth user data using admin client
-            try:
-                admin_client = await supabase_service.get_service_role_client()
-                auth_result = await admin_client.auth.admin.get_user_by_id(str(user_id))
-                
-                if auth_result.user:
-                    profile_data['email'] = auth_result.user.email
-                    # Check for image_url in user_metadata (common with OAuth providers)
-                    user_metadata = auth_result.user.user_metadata or {}
-                    profile_data['image_url'] = user_metadata.get('avatar_url') or user_metadata.get('picture')
-            except Exception as auth_e:
-                logger.warning(f"Could not fetch auth user data for user {user_id}: {str(auth_e)}")
-                profile_data['email'] = None
-                profile_data['image_url'] = None
+            profile_data = dict(row)
             
-            return UserProfileResponse(**profile_data)
+            return UserProfileResponse(**await self._with_auth_user_data(profile_data))
         except Exception as e:
             logger.error(f"Error getting user profile: {str(e)}")
             raise
@@ -106,6 +97,8 @@ class UserProfileService:
             profile_data = self._convert_uuids_to_strings(profile.model_dump(exclude_unset=True))
             
             result = await client.table('user_profile').update(profile_data).eq('id', str(profile_id)).execute()
+            self._prime_loaders(result.data[0])
+            auth_user_service.invalidate(result.data[0]['user_id'])
             return UserProfileResponse(**result.data[0])
         except Exception as e:
             logger.error(f"Error updating user profile: {str(e)}")
@@ -116,6 +109,7 @@ class UserProfileService:
         client = await supabase_service.client
         try:
             await client.table('user_profile').delete().eq('id', str(profile_id)).execute()
+            get_loader('user_profile').clear(profile_id)
             return True
         except Exception as e:
             logger.error(f"Error deleting user profile: {str(e)}")
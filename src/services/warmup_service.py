@@ -0,0 +1,130 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import time
+
+from src.config import logger, settings
+from src.middleware.jwt_verifier import jwt_verifier
+from src.services.reference_data_service import reference_data_service
+from src.services.supabase_service import supabase_service
+
+
+class WarmupService:
+    """
+    Startup phase that creates the Supabase clients and primes the caches used by the first
+    requests. The instance reports ready once every required step has succeeded; failed
+    steps are retried in the background until then.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(WarmupService, cls).__new__(cls)
+            cls._instance._steps = {}
+            cls._instance._task = None
+            cls._instance._started_at = None
+            cls._instance._ready_at = None
+        return cls._instance
+
+    async def _create_clients(self):
+        await supabase_service.initialize()
+        await supabase_service.initialize_service_role()
+
+    async def _prime_auth(self):
+        # Remote validation shares the pooled connection opened by the other steps
+        if settings.AUTH_VERIFICATION_MODE == "local" and settings.SUPABASE_URL:
+            await jwt_verifier.prefetch_jwks()
+
+    async def _prime_reference_data(self):
+        await asyncio.gather(
+            reference_data_service.get_site_types(),
+            reference_data_service.get_market_statuses(),
+            reference_data_service.get_poi()
+        )
+
+    async def _prime_schema(self):
+        if settings.PROPERTY_TABLE_NAME and await reference_data_service.get_table_columns(settings.PROPERTY_TABLE_NAME) is None:
+            raise RuntimeError(f"Table '{settings.PROPERTY_TABLE_NAME}' not found in the PostgREST schema")
+
+    async def _load_property_snapshot(self):
+        await reference_data_service.get_property_count()
+
+    def _plan(self) -> List[Tuple[str, Callable[[], Awaitable[Any]], bool]]:
+        """Steps in order as (name, step, required)"""
+        steps = [
+            ("clients", self._create_clients, True),
+            ("auth", self._prime_auth, False),
+            ("reference_data", self._prime_reference_data, True),
+            # Filters fall back to probing columns when the schema cannot be read
+            ("schema", self._prime_schema, False),
+        ]
+        if settings.WARMUP_PROPERTY_SNAPSHOT:
+            steps.append(("property_snapshot", self._load_property_snapshot, False))
+        return steps
+
+    async def _run_step(self, name: str, step: Callable[[], Awaitable[Any]], required: bool) -> bool:
+        started_at = time.perf_counter()
+        try:
+            await step()
+            self._steps[name] = {"ok": True, "required": required, "ms": round((time.perf_counter() - started_at) * 1000, 1)}
+            return True
+        except Exception as e:
+            logger.warning(f"Warm-up step '{name}' failed: {str(e)}")
+            self._steps[name] = {"ok": False, "required": required, "error": str(e)}
+            return False
+
+    async def _run(self):
+        pending = self._plan()
+        while pending:
+            failed = []
+            for name, step, required in pending:
+                if not await self._run_step(name, step, required) and required:
+                    failed.append((name, step, required))
+
+            if not failed:
+                break
+            pending = failed
+            await asyncio.sleep(settings.WARMUP_RETRY_INTERVAL)
+
+        self._ready_at = time.monotonic()
+        logger.info(f"Warm-up complete in {self._ready_at - self._started_at:.2f}s")
+
+    async def start(self, timeout: Optional[float] = None):
+        """
+        Run the warm-up, waiting at most timeout seconds (WARMUP_TIMEOUT by default).
+        If it has not finished by then it continues in the background and /api/ready reports 503.
+        """
+        if self._task is not None:
+            return
+
+        timeout = settings.WARMUP_TIMEOUT if timeout is None else timeout
+        self._started_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Warm-up not finished after {timeout}s, accepting traffic while it continues")
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready_at is not None
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness and the outcome of each warm-up step"""
+        return {
+            "ready": self.ready,
+            "duration_s": round(self._ready_at - self._started_at, 3) if self.ready else None,
+            "steps": self._steps,
+        }
+
+
+# Create a singleton instance
+warmup_service = WarmupService()
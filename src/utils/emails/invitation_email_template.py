@@ -1,11 +1,9 @@
+from functools import lru_cache
 from src.config import settings
 from string import Template
 
 
-def invitation_email_template(email: str) -> str:
-    site_url = settings.SITE_URL
-    
-    html_template = Template("""
+INVITATION_TEMPLATE = Template("""
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -241,4 +239,13 @@ def invitation_email_template(email: str) -> str:
 </body>
 </html>
 """)
-    return html_template.safe_substitute(EMAIL=email, SITE_URL=site_url)
\ No newline at end of file
+
+
+@lru_cache(maxsize=4)
+def _site_template(site_url: str) -> Template:
+    # The site URL is the same for every invitation, substitute it once
+    return Template(INVITATION_TEMPLATE.safe_substitute(SITE_URL=site_url))
+
+
+def invitation_email_template(email: str) -> str:
+    return _site_template(settings.SITE_URL).safe_substitute(EMAIL=email)
\ No newline at end of file
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+from fastapi import Depends, FastAPI, File, UploadFile
+
+from src.config import settings
+from src.middleware.request_context import RequestContextMiddleware, remaining_budget, request_deadline
+from src.services.resilience import ResilientTransport
+
+
+def build_app() -> FastAPI:
+    """An app wired like src.main, with an auth dependency making a Supabase call under the budget"""
+    supabase = ResilientTransport(httpx.MockTransport(lambda request: httpx.Response(200, json={"id": "user"})))
+
+    async def auth():
+        async with httpx.AsyncClient(transport=supabase, base_url="http://supabase") as client:
+            response = await client.get("/auth/v1/user")
+        return response.json()["id"]
+
+    app = FastAPI(dependencies=[Depends(request_deadline)])
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.post("/upload", dependencies=[Depends(auth)])
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read()), "remaining": remaining_budget()}
+
+    return app
+
+
+async def slow_body(boundary: str, chunks: int, delay: float):
+    yield f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="big.csv"\r\n\r\n'.encode()
+    for _ in range(chunks):
+        await asyncio.sleep(delay)
+        yield b"a,b\n" * 256
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_upload_slower_than_budget_keeps_its_budget(monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_TIMEOUT_BUDGET", 0.2)
+    boundary = "deadline-test"
+
+    async def run():
+        transport = httpx.ASGITransport(app=build_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/upload",
+                content=slow_body(boundary, chunks=5, delay=0.1),
+                headers={"content-type": f"multipart/form-data; boundary={boundary}"},
+            )
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.json()["size"] == 5 * 256 * 4
+    assert 0 < response.json()["remaining"] <= 0.2